@@ -15,6 +15,8 @@ from src.util.config import Config
 from src.util.crypto_store.local_crypto_store import LocalCryptoStore
 from src.util.crypto_store.pkcs11_crypto_store import Pkcs11CryptoStore
 from src.util.logger import get_logger
+from src.util.metrics import MetricsReporter
+from src.util.secret.signing import CryptoStoreSecretKey
 from src.util.secretcli import configure_secretcli
 from src.util.web3 import w3
 
@@ -83,10 +85,17 @@ def run_bridge():  # pylint: disable=too-many-statements
         secret_account = SecretAccount(cfg['multisig_acc_addr'], cfg['secret_key_name'])
 
         eth_signer = EtherSigner(eth_wallet, signer, dst_network="Secret", config=cfg)
-        s20_signer = Secret20Signer(secret_account, eth_wallet, cfg)
+        secret_key = None
+        if cfg.get('token', '') and cfg.get('secret_signer_key_label', ''):
+            # the secret network key is kept in the same HSM token as the ethereum one
+            secret_key = CryptoStoreSecretKey(Pkcs11CryptoStore(store=cfg["PKCS11_MODULE"], token=cfg["token"],
+                                                                user_pin=cfg["user_pin"],
+                                                                label=cfg['secret_signer_key_label']))
+        s20_signer = Secret20Signer(secret_account, eth_wallet, cfg, key=secret_key)
 
         runners.append(eth_signer)
         runners.append(s20_signer)
+        runners.append(MetricsReporter(cfg))
 
         if cfg['MODE'].lower() == 'leader':
             eth_leader = EtherLeader(eth_wallet, signer, dst_network="Secret", config=cfg)
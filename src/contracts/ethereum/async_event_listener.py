@@ -0,0 +1,334 @@
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import count
+from queue import Queue, Full
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+from web3 import Web3
+from web3._utils.method_formatters import log_entry_formatter
+from web3.datastructures import AttributeDict
+from web3.types import LogReceipt
+
+from src.contracts.ethereum.canonical_chain import CanonicalChain, REORG_BUFFER_SIZE
+from src.contracts.ethereum.ethr_contract import EthereumContract
+from src.contracts.ethereum.event_listener import Callbacks
+from src.contracts.ethereum.listener_state import ListenerState
+from src.contracts.event_provider import EventProvider
+from src.util.config import Config
+from src.util.dispatcher import KeyedDispatcher, QUEUE_SIZE as DISPATCH_QUEUE_SIZE
+from src.util.eth.async_client import AsyncJsonRpc, REQUEST_ERRORS
+from src.util.eth.provider_pool import eth_endpoints
+from src.util.logger import get_logger
+from src.util.metrics import metrics
+from src.util.web3 import LOGS_CHUNK_SIZE, LOGS_LAG_INTERVAL, LogsScan, chain_head, event_topics, get_block, \
+    is_range_too_large
+
+# maximal number of confirmed events waiting for their callbacks - when full, the listener stops scanning
+QUEUE_SIZE = 1000
+# how often (seconds) a listener blocked on a full queue checks it again
+QUEUE_RETRY_INTERVAL = 0.1
+
+
+class TrackedContract(ListenerState):
+    """
+    Listening state of one contract: its callbacks, the events waiting for confirmations and the last scanned block
+
+    With a cursor name, the state is stored in the DB like EthEventListener does, and restored on the next run
+    """
+
+    def __init__(self, contract: EthereumContract, cursor_name: str = ''):
+        super().__init__(cursor_name)
+        self.contract = contract
+        self.callbacks = Callbacks()
+        self.topics: Dict[bytes, str] = {}
+        self.last_block: Optional[int] = None
+        # cleared when unregistered, so events already queued aren't delivered anymore
+        self.active = True
+        self.dispatcher: Optional[KeyedDispatcher] = None
+
+
+class AsyncEthEventListener(EventProvider):  # pylint: disable=too-many-instance-attributes
+    """
+    Listens to the events of any number of contracts from a single asyncio loop
+
+    Alternative to running an EthEventListener thread per contract: all the registered contracts are scanned
+    together, with one eth_getLogs query per tick for all the contracts that are at the same block, over an async
+    JSON-RPC client. Confirmation threshold, reorg checks ('eth_reorg_depth') and cursors behave like in
+    EthEventListener.
+
+    Confirmed events are handed to the callbacks, in block order, by a single dispatcher thread through a bounded
+    queue. While the callbacks are busy the loop keeps scanning, and it stops when the queue is full.
+    A pending event is only removed from the DB after its callbacks ran. A failing callback is logged, and only
+    affects its own registration: the event stays pending in the DB, and the other registrations carry on.
+
+    The process runs 3 threads no matter how many contracts are tracked: the loop, the dispatcher, and a worker for
+    the blocking calls of the loop - the reorg check and the DB. Errors end a tick, and the next one starts over.
+
+    The listener queries one of the HTTP nodes in 'eth_node' at a time, and moves to the next one when it is behind.
+    """
+    _ids = count(0)
+    _chain = "ETH"
+
+    def __init__(self, config: Config, contract: Optional[EthereumContract] = None, **kwargs):
+        """
+        :param contract: the contract events are registered to when register is called without one
+        """
+        self.id = next(self._ids)
+        self.config = config
+        self.default_contract = contract
+        self.logger = get_logger(
+            db_name=config['db_name'],
+            logger_name=config.get('logger_name', f"{self.__class__.__name__}-{self.id}")
+        )
+        # the async client doesn't balance between nodes - they're used one at a time, see _logs
+        self.endpoints = [endpoint for endpoint in eth_endpoints(config['eth_node']) if endpoint.startswith('http')]
+        if not self.endpoints:
+            raise ValueError(f"{self.__class__.__name__} requires an HTTP node in 'eth_node': {config['eth_node']}")
+        self.clients: List[AsyncJsonRpc] = []
+        self.confirmations = config['eth_confirmations']
+        reorg_depth = int(config.get('eth_reorg_depth', REORG_BUFFER_SIZE))
+        self.canonical_chain = CanonicalChain(reorg_depth) if reorg_depth else None
+        self.tracked: Dict[Tuple[str, str], TrackedContract] = {}
+        self.tracked_lock = Lock()
+        self.queue: Queue = Queue(maxsize=int(config.get('eth_listener_queue_size', QUEUE_SIZE)))
+        self.dispatcher = Thread(target=self._dispatch, name=f"EventDispatcher-{self.id}", daemon=True)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # runs the blocking calls of the loop, one at a time and in order
+        self.worker: Optional[ThreadPoolExecutor] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._stopping = False
+        super().__init__(group=None, name=f"AsyncEventListener-{config.get('logger_name', '')}", target=self.run,
+                         **kwargs)
+        self.setDaemon(True)
+
+    def register(self, callback: Callable, events: List[str], from_block: Union[int, str] = "latest",
+                 contract: Optional[EthereumContract] = None, cursor_name: str = '', subscriber: str = '',
+                 partition_key: Optional[Callable[[LogReceipt], Hashable]] = None):
+        """
+        Registers @callback to @events of @contract. Can be called before or after the listener started
+
+        :param from_block: starting block. Ignored if the contract resumes from a stored cursor
+        :param contract: defaults to the contract the listener was created with
+        :param cursor_name: name to store the listening state of the contract under, see EthEventListener
+        :param subscriber: registrations of different subscribers to the same contract keep separate state (start
+        block, pending events, cursor), while the logs are still fetched once for all of them. Defaults to the cursor
+        :param partition_key: with 'eth_callback_workers' set, the callbacks of the registration run on that many
+        workers of its own, like those of an EthEventListener (see Callbacks)
+        """
+        contract = contract or self.default_contract
+        with self.tracked_lock:
+            key = (contract.address.lower(), subscriber or cursor_name)
+            tracked = self.tracked.get(key)
+            if tracked is None:
+                tracked = self.tracked[key] = TrackedContract(contract, cursor_name)
+                from_block = tracked.restore(from_block)
+            if partition_key and tracked.dispatcher is None:
+                self._dispatch_with(tracked, partition_key, name=f"Callbacks-{self.id}-{len(self.tracked)}")
+
+            for event_name in events:
+                self.logger.info(f"registering event {event_name} of {contract.address}")
+                tracked.callbacks[event_name] = callback
+            tracked.topics.update(event_topics(contract.contract, events))
+
+            # the new events are fetched by the next tick, along with the other contracts
+            start = chain_head.number if from_block == "latest" else int(from_block) - 1
+            tracked.last_block = start if tracked.last_block is None else min(tracked.last_block, start)
+
+    def _dispatch_with(self, tracked: TrackedContract, partition_key: Callable[[LogReceipt], Hashable], name: str):
+        workers = int(self.config.get('eth_callback_workers', 0))
+        if workers:
+            tracked.dispatcher = KeyedDispatcher(
+                workers, int(self.config.get('eth_callback_queue_size', DISPATCH_QUEUE_SIZE)), name=name)
+            tracked.callbacks.dispatch_with(tracked.dispatcher, partition_key)
+
+    def unregister(self, contract: EthereumContract, subscriber: str):
+        """ Removes all the registrations of @subscriber to @contract. Its pending events stay in the DB """
+        with self.tracked_lock:
+            tracked = self.tracked.pop((contract.address.lower(), subscriber), None)
+            if tracked:
+                tracked.active = False
+                if tracked.dispatcher:
+                    tracked.dispatcher.stop()
+
+    def stop(self):
+        self.logger.info("Stopping..")
+        self._stopping = True
+        if self.loop and self._stopped and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def run(self):
+        self.logger.info("Starting..")
+        self.dispatcher.start()
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+            self.queue.put(None)
+
+    async def _main(self):
+        self._stopped = asyncio.Event()
+        self.clients = [AsyncJsonRpc(endpoint) for endpoint in self.endpoints]
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"ListenerWorker-{self.id}")
+        try:
+            while not self._stopping:
+                try:
+                    await self._tick()
+                except (ValueError, *REQUEST_ERRORS) as e:
+                    self.logger.error(f"Failed to scan for new events: {e}")
+                except Exception:  # pylint: disable=broad-except
+                    self.logger.exception("Unexpected error while scanning for new events, starting over")
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), self.config['sleep_interval'])
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for client in self.clients:
+                await client.close()
+            self.worker.shutdown()
+
+    async def _blocking(self, func: Callable, *args) -> Any:
+        """ Runs @func on the worker, off the loop """
+        return await self.loop.run_in_executor(self.worker, func, *args)
+
+    async def _tick(self):
+        head = await self.clients[0].block_number()
+        chain_head.update(head)
+        with self.tracked_lock:
+            tracked = list(self.tracked.values())
+
+        if self.canonical_chain:
+            reorg_from = await self._blocking(self.canonical_chain.update, head, get_block)
+            if reorg_from is not None:
+                await self._blocking(self._handle_reorg, tracked, reorg_from)
+
+        await self._scan(tracked, head)
+
+        for contract in tracked:
+            for name, event in contract.pending_events.release(head - self.confirmations):
+                if not self._is_canonical(event):
+                    self.logger.warning(f"Dropping event {name} of tx {event.transactionHash.hex()}, "
+                                        f"block {event.blockNumber} is not canonical anymore")
+                    await self._blocking(contract.remove_pending, event)
+                    continue
+                await self._enqueue((contract, name, event))
+
+    def _handle_reorg(self, tracked: List[TrackedContract], reorg_from: int):
+        """ Drops the pending events of the replaced blocks, and rewinds the contracts so they are scanned again """
+        metrics.counter('eth.reorgs').inc()
+        self.logger.warning(f"Chain reorganization from block {reorg_from}")
+        for contract in tracked:
+            for _, event in contract.pending_events.drop_from(reorg_from):
+                contract.remove_pending(event)
+            contract.last_block = min(contract.last_block, reorg_from - 1)
+
+    async def _scan(self, tracked: List[TrackedContract], head: int):
+        """ Fetches the new events of all the contracts, with one query per group of contracts at the same block """
+        groups: Dict[int, List[TrackedContract]] = defaultdict(list)
+        for contract in tracked:
+            if contract.last_block < head:
+                groups[contract.last_block].append(contract)
+
+        for last_block, group in groups.items():
+            by_address: Dict[str, List[TrackedContract]] = defaultdict(list)
+            with self.tracked_lock:
+                for contract in group:
+                    by_address[contract.contract.address.lower()].append(contract)
+                topics = list({Web3.toHex(topic) for contract in group for topic in contract.topics})
+
+            found = []
+            async for log in self._logs(list(by_address), topics, last_block + 1, head):
+                log = AttributeDict.recursive(log_entry_formatter(log))
+                found.extend(self._fan_out(log, by_address[log.address.lower()]))
+            await self._blocking(self._advance, group, found, last_block, head)
+
+    def _advance(self, group: List[TrackedContract], found: List[Tuple[TrackedContract, str, LogReceipt]],
+                 last_block: int, head: int):
+        """ Adds the events @found to the pending events, and moves the cursors of @group to @head. Blocking """
+        for contract, name, event in found:
+            self.logger.info(f"New event found {name}, adding to confirmation handler")
+            contract.add_pending(name, event)
+
+        with self.tracked_lock:
+            for contract in group:
+                # unless a registration moved it back in the meantime
+                if contract.last_block == last_block:
+                    contract.last_block = head
+                    contract.save_cursor(head)
+
+    @staticmethod
+    def _fan_out(log: LogReceipt, subscribers: List[TrackedContract]) -> List[Tuple[TrackedContract, str, LogReceipt]]:
+        """ Returns @log for each of the @subscribers registered to its event, decoded only once """
+        decoded = {}
+        found = []
+        for contract in subscribers:
+            name = contract.topics.get(bytes(log.topics[0]))
+            if name:
+                if name not in decoded:
+                    decoded[name] = getattr(contract.contract.contract.events, name)().processLog(log)
+                found.append((contract, name, decoded[name]))
+        return found
+
+    async def _logs(self, addresses: List[str], topics: List[str], from_block: int, to_block: int):
+        """
+        Async counterpart of src.util.web3.logs_in_range: the same scan (see LogsScan), and when the node is behind
+        the next query goes to the next node
+        """
+        scan = LogsScan(from_block, to_block, int(self.config.get('eth_logs_chunk_size', LOGS_CHUNK_SIZE)))
+        while not scan.done:
+            start, end = scan.next_range()
+            try:
+                node_head, logs = await self.clients[0].get_logs(addresses, topics, start, end)
+            except (ValueError, asyncio.TimeoutError) as e:
+                too_large = isinstance(e, asyncio.TimeoutError) or is_range_too_large(e)
+                if not too_large or not scan.shrink():
+                    raise
+                continue
+
+            scanned = scan.answered(end, node_head, len(logs))
+            for log in logs:
+                if int(log['blockNumber'], 16) <= scanned:
+                    yield log
+
+            if scan.lagging:
+                self.clients.append(self.clients.pop(0))
+                await asyncio.sleep(LOGS_LAG_INTERVAL)
+
+    def _is_canonical(self, event: LogReceipt) -> bool:
+        if not self.canonical_chain:
+            return True
+        canonical_hash = self.canonical_chain.hash_of(event.blockNumber)
+        return canonical_hash is None or canonical_hash == bytes(event.blockHash)
+
+    async def _enqueue(self, item: Tuple[TrackedContract, str, LogReceipt]):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except Full:
+                metrics.counter('eth.listener.queue_full').inc()
+                await asyncio.sleep(QUEUE_RETRY_INTERVAL)
+
+    def _dispatch(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            contract, name, event = item
+            if not contract.active:
+                continue
+            self.logger.info(f"Event {name} passed confirmation limit, executing callback")
+            try:
+                contract.callbacks.trigger(name, event, done=partial(contract.remove_pending, event))
+            except Exception as e:  # pylint: disable=broad-except
+                # the other registrations mustn't miss their events
+                self.logger.error(f"Callback of event {name} of tx {event.transactionHash.hex()} failed, "
+                                  f"the event stays pending: {e}")
+
+        with self.tracked_lock:
+            for contract in self.tracked.values():
+                if contract.dispatcher:
+                    contract.dispatcher.stop()
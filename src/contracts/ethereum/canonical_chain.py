@@ -0,0 +1,53 @@
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+
+from web3.types import BlockData
+
+REORG_BUFFER_SIZE = 128
+
+
+class CanonicalChain:
+    """
+    Bounded ring buffer of (number, hash, parentHash) of the latest blocks of the canonical chain
+
+    Used to detect reorgs: a new block whose parent is not the buffered tip means the tip was replaced, and the buffer
+    is rewound until it links up with the new chain again
+    """
+
+    def __init__(self, size: int = REORG_BUFFER_SIZE):
+        self.blocks: Deque[Tuple[int, bytes, bytes]] = deque(maxlen=size)
+
+    def hash_of(self, number: int) -> Optional[bytes]:
+        """ Returns the canonical hash of block @number, or None if it isn't in the buffer """
+        if not self.blocks or not self.blocks[0][0] <= number <= self.blocks[-1][0]:
+            return None
+        return self.blocks[number - self.blocks[0][0]][1]
+
+    def update(self, head: int, get_block: Callable[[int], BlockData]) -> Optional[int]:
+        """
+        Extends the buffer up to block @head
+
+        :param head: current block number
+        :param get_block: returns the block with the given number
+        :return: the first block number that was replaced by a reorg, or None if there wasn't any
+        """
+        number = self.blocks[-1][0] + 1 if self.blocks else head
+        if head - number >= self.blocks.maxlen:
+            # too far behind to link up with the buffer - start over from the most recent blocks
+            self.blocks.clear()
+            number = head - self.blocks.maxlen + 1
+
+        reorg_from = None
+        while number <= head:
+            block = get_block(number)
+            if block is None:  # the node went back to a shorter chain
+                break
+            if self.blocks and bytes(block.parentHash) != self.blocks[-1][1]:
+                # the tip isn't canonical anymore - drop it and check its replacement
+                number = self.blocks.pop()[0]
+                reorg_from = number
+                continue
+            self.blocks.append((number, bytes(block.hash), bytes(block.parentHash)))
+            number += 1
+
+        return reorg_from
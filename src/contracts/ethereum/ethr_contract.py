@@ -9,7 +9,7 @@ from web3.datastructures import AttributeDict
 
 from src.util.crypto_store.crypto_manager import CryptoManagerBase
 from src.util.eth.transaction import Transaction
-from src.util.web3 import normalize_address, send_contract_tx, event_log, w3
+from src.util.web3 import normalize_address, send_contract_tx, event_log, event_logs, w3
 
 GAS_LIMIT_DEFAULT = 4000000
 
@@ -53,6 +53,10 @@ class EthereumContract:
             return None
         return log
 
+    def get_events_by_txs(self, tx_ids: List[str]) -> List[Optional[AttributeDict]]:
+        """ Bulk version of get_events_by_tx - fetches the logs of all of @tx_ids in a single batch """
+        return [log or None for _, log in event_logs(tx_ids, self.tracked_event(), self.provider, self.contract)]
+
     def send_transaction(self, func_name: str, from_: str, private_key: bytes, gas, gas_price=None, args: Tuple = None):
         """
         Used for sending contract transactions (executing @func_name  on a ethr contract)
@@ -66,9 +70,11 @@ class EthereumContract:
         return send_contract_tx(self.contract, func_name, from_, private_key, gas, gas_price=gas_price, args=args)
 
     def raw_transaction(self, account: str, value: int, data: str = '0x',
-                        gas_price=None, gas_limit=None) -> Transaction:
+                        gas_price=None, gas_limit=None, nonce: Optional[int] = None) -> Transaction:
+        """ :param nonce: the account's pending transaction count if not given - see TransactionSubmitter """
         address = to_checksum_address(account)
-        nonce = w3.eth.getTransactionCount(address, block_identifier='pending')
+        if nonce is None:
+            nonce = w3.eth.getTransactionCount(address, block_identifier='pending')
         _gas_price = gas_price * 1e9 if gas_price else estimate_gas_price()
         _gas_limit = gas_limit or GAS_LIMIT_DEFAULT
         tx = Transaction(nonce=nonce,
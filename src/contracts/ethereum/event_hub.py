@@ -0,0 +1,95 @@
+from itertools import count
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Optional, Union
+
+from web3.types import LogReceipt
+
+from src.contracts.ethereum.async_event_listener import AsyncEthEventListener
+from src.contracts.ethereum.ethr_contract import EthereumContract
+from src.contracts.ethereum.event_listener import EthEventListener
+from src.util.config import Config
+from src.util.eth.provider_pool import eth_endpoints
+
+# one listener per contract address, shared by all the subscribers in the process
+_hubs: Dict[str, AsyncEthEventListener] = {}
+_subscribers: Dict[str, int] = {}
+_hubs_lock = Lock()
+
+
+def _acquire(contract: EthereumContract, config: Config) -> AsyncEthEventListener:
+    address = contract.address.lower()
+    with _hubs_lock:
+        if address not in _hubs:
+            _hubs[address] = AsyncEthEventListener(config, contract)
+            _subscribers[address] = 0
+        _subscribers[address] += 1
+        return _hubs[address]
+
+
+def _release(contract: EthereumContract):
+    address = contract.address.lower()
+    with _hubs_lock:
+        _subscribers[address] -= 1
+        if _subscribers[address] == 0:
+            # a stopped thread can't be restarted - the next subscriber gets a new listener
+            del _subscribers[address]
+            _hubs.pop(address).stop()
+
+
+class SharedEventListener:
+    """
+    A subscriber of the process wide listener of a contract, with the same interface as EthEventListener
+
+    Logs of the contract are fetched and decoded once, and each subscriber gets the confirmed events of the events it
+    registered to. Subscribers keep their own start block, pending events, cursor and callback workers (see
+    partition_key), and a failing callback only affects its subscriber. The shared listener starts with its first
+    subscriber, and stops when the last one stops
+    """
+    _ids = count(0)
+
+    def __init__(self, contract: EthereumContract, config: Config, cursor_name: str = '',
+                 partition_key: Optional[Callable[[LogReceipt], Hashable]] = None):
+        """ :param partition_key: see EthEventListener """
+        self.contract = contract
+        self.cursor_name = cursor_name
+        self.partition_key = partition_key
+        self.subscriber = cursor_name or f"{self.__class__.__name__}-{next(self._ids)}"
+        self.hub = _acquire(contract, config)
+        self.stopped = False
+
+    def register(self, callback: Callable, events: List[str], from_block: Union[int, str] = "latest"):
+        self.hub.register(callback, events, from_block, contract=self.contract, cursor_name=self.cursor_name,
+                          subscriber=self.subscriber, partition_key=self.partition_key)
+
+    def start(self):
+        with _hubs_lock:
+            if self.hub.ident is None:  # not started by another subscriber yet
+                self.hub.start()
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        self.hub.unregister(self.contract, self.subscriber)
+        _release(self.contract)
+
+    def is_alive(self) -> bool:
+        return not self.stopped and self.hub.is_alive()
+
+
+EventListener = Union[EthEventListener, SharedEventListener]
+
+
+def event_listener(contract: EthereumContract, config: Config, cursor_name: str = '',
+                   partition_key: Optional[Callable[[LogReceipt], Hashable]] = None) -> EventListener:
+    """
+    Creates the event listener of a component - a listener of its own, or a subscriber of the shared listener of the
+    contract if 'eth_shared_listener' is set. The shared listener needs an HTTP node, without one in 'eth_node' the
+    component gets a listener of its own
+
+    :param partition_key: see EthEventListener
+    """
+    http_node = any(endpoint.startswith('http') for endpoint in eth_endpoints(config['eth_node']))
+    if config.get('eth_shared_listener', False) and http_node:
+        return SharedEventListener(contract, config, cursor_name, partition_key)
+    return EthEventListener(contract, config, cursor_name=cursor_name, partition_key=partition_key)
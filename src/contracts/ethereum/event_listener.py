@@ -1,26 +1,57 @@
 from collections.abc import MutableMapping
+from functools import partial
 from itertools import count
 from threading import Event
-from time import sleep
-from typing import List, Callable, Iterator, Dict, Tuple, Union
+from time import monotonic
+from typing import List, Callable, Iterator, Dict, Hashable, Union, Optional
 
 from web3.contract import LogFilter, LogReceipt
 
+from src.contracts.ethereum.canonical_chain import CanonicalChain, REORG_BUFFER_SIZE
 from src.contracts.ethereum.ethr_contract import EthereumContract
+from src.contracts.ethereum.listener_state import ListenerState
 from src.contracts.event_provider import EventProvider
 from src.util.config import Config
+from src.util.dispatcher import KeyedDispatcher, QUEUE_SIZE as DISPATCH_QUEUE_SIZE
+from src.util.eth.provider_pool import eth_endpoints
+from src.util.eth.subscription import NewHeadsSubscription
 from src.util.logger import get_logger
-from src.util.web3 import contract_event_in_range, w3
+from src.util.metrics import metrics
+from src.util.web3 import contract_event_in_range, contract_events_in_range, get_block, chain_head
 
+# when subscribed, scan at least this often (seconds) even if no new block arrived
+SUBSCRIPTION_TICK_TIMEOUT = 60
 
-class EthEventListener(EventProvider):
-    """Tracks the block-chain for new transactions on a given address"""
+
+class EthEventListener(EventProvider):  # pylint: disable=too-many-instance-attributes
+    """
+    Tracks the block-chain for new transactions on a given address
+
+    By default new events are found with a single stateless eth_getLogs query per tick, covering all the registered
+    events of the contract. Setting 'eth_listener_mode' to 'filter' polls one server-side filter per event instead.
+    In 'subscribe' mode (WebSocket or IPC 'eth_node' only) the listener subscribes to newHeads, and only queries the
+    node when a new block arrives. While the subscription is down it falls back to polling every 'sleep_interval'.
+
+    Before events are released, the listener checks for reorgs with a ring buffer of the latest block hashes
+    ('eth_reorg_depth' blocks, 0 disables the check). Pending events of replaced blocks are dropped and fetched again
+    from the new chain, and events whose block isn't canonical anymore are never released.
+
+    If a cursor name is given, the events waiting for confirmations and the last scanned block are stored in the DB
+    under that name, and a restarted listener resumes from there instead of scanning from its starting block.
+    """
     _ids = count(0)
     _chain = "ETH"
 
-    def __init__(self, contract: EthereumContract, config: Config, **kwargs):
+    def __init__(self, contract: EthereumContract, config: Config, cursor_name: str = '',
+                 partition_key: Optional[Callable[[LogReceipt], Hashable]] = None, **kwargs):
+        """
+        :param cursor_name: name to store the listener's state under in the DB, see above
+        :param partition_key: with 'eth_callback_workers' set, callbacks run on that many workers instead of the
+        listener thread, in order for events with the same key (see Callbacks)
+        """
         # Note: each event listener can listen to one contract at a time
         self.id = next(self._ids)
+        self.state = ListenerState(cursor_name)
         self.tracked_contract = contract
         self.config = config
         self.callbacks = Callbacks()
@@ -28,10 +59,24 @@ class EthEventListener(EventProvider):
             db_name=config['db_name'],
             logger_name=config.get('logger_name', f"{self.__class__.__name__}-{self.id}")
         )
+        self.dispatcher: Optional[KeyedDispatcher] = None
+        workers = int(config.get('eth_callback_workers', 0))
+        if partition_key and workers:
+            self.dispatcher = KeyedDispatcher(workers, int(config.get('eth_callback_queue_size', DISPATCH_QUEUE_SIZE)),
+                                              name=f"Callbacks-{self.id}")
+            self.callbacks.dispatch_with(self.dispatcher, partition_key)
         self.events = []
-        self.pending_events: List[Tuple[str, LogReceipt]] = []
+        self.pending_events = self.state.pending_events
         self.filters: Dict[str, LogFilter] = {}
+        self.mode = config.get('eth_listener_mode', 'logs')
+        # last block that was scanned for new events
+        self.last_block: Optional[int] = None
+        self.subscription: Optional[NewHeadsSubscription] = None
+        if self.mode == 'subscribe':
+            self.subscription = self._subscribe(config['eth_node'])
         self.confirmations = config['eth_confirmations']
+        reorg_depth = int(config.get('eth_reorg_depth', REORG_BUFFER_SIZE))
+        self.canonical_chain = CanonicalChain(reorg_depth) if reorg_depth else None
         self.stop_event = Event()
         super().__init__(group=None, name=f"EventListener-{config.get('logger_name', '')}", target=self.run, **kwargs)
         self.setDaemon(True)
@@ -43,74 +88,175 @@ class EthEventListener(EventProvider):
 
         :param callback: callback function that will be invoked upon event
         :param events: list of events the caller wants to register to
-        :param from_block: Starting block
+        :param from_block: Starting block. Ignored if the listener resumes from a stored cursor
         """
+        if self.last_block is None:
+            self.last_block = chain_head.number
+            from_block = self._restore(from_block)
+
         for event_name in events:
             self.logger.info(f"registering event {event_name}")
             self.events.append(event_name)
             self.callbacks[event_name] = callback
 
-            event = getattr(self.tracked_contract.contract.events, event_name)
-            evt_filter = event.createFilter(fromBlock="latest")
-            self.filters[event_name] = evt_filter
+            if self.mode == 'filter':
+                event = getattr(self.tracked_contract.contract.events, event_name)
+                evt_filter = event.createFilter(fromBlock="latest")
+                self.filters[event_name] = evt_filter
+
+        if from_block != "latest":
+            self.add_events_in_range(events, from_block=from_block, to_block=self.last_block)
+
+        self._save_cursor()
 
-            if from_block != "latest":
-                self.add_events_in_range(event_name, from_block=from_block, to_block=w3.eth.blockNumber)
+    def _restore(self, from_block: Union[int, str]) -> Union[int, str]:
+        """ Resumes from the state stored by a previous run, if any. Returns the block to continue scanning from """
+        start = self.state.restore(from_block)
+        if start != from_block:
+            self.logger.info(f"Resuming from block {start} with {len(self.pending_events)} pending events")
+        return start
+
+    def _save_cursor(self):
+        self.state.save_cursor(self.last_block)
+
+    def _add_pending(self, name: str, event: LogReceipt):
+        self.state.add_pending(name, event)
+
+    def _remove_pending(self, event: LogReceipt):
+        self.state.remove_pending(event)
+
+    def _subscribe(self, eth_node: Union[str, List[str]]) -> Optional[NewHeadsSubscription]:
+        # with several nodes configured, the first WebSocket or IPC one is subscribed to
+        endpoints = [endpoint for endpoint in eth_endpoints(eth_node) if not endpoint.startswith('http')]
+        if not endpoints:
+            self.logger.warning("Subscriptions require a WebSocket or IPC node, falling back to polling")
+            return None
+        return NewHeadsSubscription(endpoints[0])
 
     def stop(self):
         self.logger.info("Stopping..")
         self.stop_event.set()
+        if self.subscription:
+            self.subscription.stop()
 
     def run(self):
         """Notify registered callbacks upon event occurrence"""
         self.logger.info("Starting..")
+        if self.subscription:
+            self.subscription.start()
 
+        head = None
         while not self.stop_event.is_set():
+            head = self._check_reorg(head)
             self.logger.debug(f'Scanning for new events of type {self.events}')
-            for name, event in self.get_new_events():
+            for name, event in self.get_new_events(head):
                 self.logger.info(f"New event found {name}, adding to confirmation handler")
-                self.pending_events.append((name, event))
-            for name, event in self.confirmation_handler():
+                self._add_pending(name, event)
+            self._save_cursor()
+            for name, event in self.confirmation_handler(head):
                 self.logger.info(f"Event {name} passed confirmation limit, executing callback")
-                self.callbacks.trigger(name, event)
+                # the event stays pending (in the DB) until its callbacks are done
+                self.callbacks.trigger(name, event, done=partial(self._remove_pending, event))
+
+            head = self._wait_for_tick(head)
+
+        if self.dispatcher:
+            self.dispatcher.stop()
+
+    def _check_reorg(self, head: Optional[int]) -> Optional[int]:
+        """
+        Updates the canonical chain buffer, and replaces the pending events of blocks that were reorged out
+
+        :return: the current head
+        """
+        if not self.canonical_chain:
+            return head
+        if head is None:
+            head = chain_head.number
+
+        reorg_from = self.canonical_chain.update(head, get_block)
+        if reorg_from is not None:
+            metrics.counter('eth.reorgs').inc()
+            dropped = self.pending_events.drop_from(reorg_from)
+            self.logger.warning(f"Chain reorganization from block {reorg_from}, refetching {len(dropped)} pending events")
+            for _, event in dropped:
+                self._remove_pending(event)
+            self.add_events_in_range(self.events, from_block=reorg_from, to_block=self.last_block)
+        return head
 
-            sleep(self.config['sleep_interval'])
+    def _is_canonical(self, event: LogReceipt) -> bool:
+        """ False if the event's block is known to have been replaced """
+        if not self.canonical_chain:
+            return True
+        canonical_hash = self.canonical_chain.hash_of(event.blockNumber)
+        return canonical_hash is None or canonical_hash == bytes(event.blockHash)
 
-    def confirmation_handler(self):
-        blockNum = w3.eth.blockNumber
-        # this creates a copy of the list, so we can remove from the original one while still iterating
-        for item in list(self.pending_events):
-            _name, event = item
-            if event.blockNumber <= (blockNum - self.confirmations):
-                self.pending_events.remove(item)
-                yield item
+    def _wait_for_tick(self, head: Optional[int]) -> Optional[int]:
+        """
+        Waits for the next scan - until a new block arrives when subscribed, or 'sleep_interval' seconds when polling
+
+        :return: the new head if it was received from the subscription, otherwise None
+        """
+        if self.subscription and self.subscription.connected.is_set():
+            head = self.subscription.wait_for_head(head, SUBSCRIPTION_TICK_TIMEOUT)
+            if head is not None:
+                chain_head.update(head, self.subscription.hash_of(head))
+            return head
+        self.stop_event.wait(self.config['sleep_interval'])
+        return None
+
+    def confirmation_handler(self, head: Optional[int] = None):
+        """ Yields the pending events that passed the confirmation threshold, by block order """
+        block_num = chain_head.number if head is None else head
+        for name, event in self.pending_events.release(block_num - self.confirmations):
+            if not self._is_canonical(event):
+                self.logger.warning(f"Dropping event {name} of tx {event.transactionHash.hex()}, "
+                                    f"block {event.blockNumber} is not canonical anymore")
+                self._remove_pending(event)
+                continue
+            yield name, event
 
     def events_in_range(self, event: str, from_block: int, to_block: int = None):
         """ Returns a generator that yields all contract events in range"""
         return contract_event_in_range(self.tracked_contract, event, from_block=from_block,
                                        to_block=to_block)
 
-    def add_events_in_range(self, event_name, from_block: Union[int, str], to_block: int):
+    def add_events_in_range(self, events: List[str], from_block: Union[int, str], to_block: int):
         """
         Used to catch up for all the events from when we wanted to start, and where we are now.
-        Todo: check on ropsten and mainnet if this behaves the same way
+        All the @events are fetched together, with one eth_getLogs query per chunk of blocks
         """
-        event = getattr(self.tracked_contract.contract.events, event_name)
-        evt_filter = event.createFilter(fromBlock=from_block, toBlock=to_block)
-        for event in evt_filter.get_all_entries():
-            self.pending_events.append((event_name, event))
+        for name, event in contract_events_in_range(self.tracked_contract, events, from_block=int(from_block),
+                                                    to_block=to_block):
+            self._add_pending(name, event)
 
     def wait_for_block(self, number: int) -> int:
-        while True:
-            block = (w3.eth.blockNumber - self.confirmations)
-            if block >= number:
-                return block
-            sleep(self.config['sleep_interval'])
+        """ Blocks until block @number passed the confirmation threshold, and returns the last confirmed block """
+        return chain_head.wait_for(number + self.confirmations) - self.confirmations
 
     def confirmation_manager(self):
         pass
 
-    def get_new_events(self):
+    def get_new_events(self, head: Optional[int] = None):
+        """
+        Return new events of all the registered types, starting from events that were generated after registration
+
+        :param head: current block number, if already known
+        """
+        if head is None:
+            head = chain_head.number
+
+        if self.mode == 'filter':
+            yield from self._get_new_filter_events()
+            self.last_block = head
+            return
+
+        if head <= self.last_block:
+            return
+        yield from contract_events_in_range(self.tracked_contract, self.events, self.last_block + 1, head)
+        self.last_block = head
+
+    def _get_new_filter_events(self):
         """
         Return new events from the filters (starting from events that were generated after the filters were created)
         """
@@ -120,9 +266,17 @@ class EthEventListener(EventProvider):
 
 
 class Callbacks(MutableMapping):
-    """Utility class that manages events registration by confirmation threshold"""
+    """
+    Utility class that manages events registration by confirmation threshold
+
+    By default callbacks run inline, on the thread that triggers them. After dispatch_with, they run on the workers
+    of a KeyedDispatcher instead: in order for events with the same partition key, and in parallel otherwise.
+    Either way the latency of each callback is recorded in the 'callback.<name>' histogram
+    """
     def __init__(self, *args, **kwargs):
         self.store = dict()
+        self.dispatcher: Optional[KeyedDispatcher] = None
+        self.partition_key: Optional[Callable[[LogReceipt], Hashable]] = None
         self.update(dict(*args, **kwargs))
 
     def __iter__(self) -> Iterator:
@@ -145,8 +299,27 @@ class Callbacks(MutableMapping):
             return []
         return self.store[key]
 
-    def trigger(self, event_name: str, event):
-        """ call all the callbacks whose confirmation threshold reached """
+    def dispatch_with(self, dispatcher: KeyedDispatcher, partition_key: Callable[[LogReceipt], Hashable]):
+        """ Runs the callbacks on @dispatcher, ordered by @partition_key of the event """
+        self.dispatcher = dispatcher
+        self.partition_key = partition_key
 
-        for callback in self[event_name]:
-            callback(event)
+    def trigger(self, event_name: str, event, done: Optional[Callable[[], None]] = None):
+        """
+        call all the callbacks whose confirmation threshold reached
+
+        :param done: called after all the callbacks of the event returned (not called if one of them raised)
+        """
+        def run():
+            for callback in self[event_name]:
+                start = monotonic()
+                callback(event)
+                metrics.histogram(f"callback.{getattr(callback, '__qualname__', repr(callback))}").observe(
+                    monotonic() - start)
+            if done:
+                done()
+
+        if self.dispatcher:
+            self.dispatcher.submit(self.partition_key(event), run)
+        else:
+            run()
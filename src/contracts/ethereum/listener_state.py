@@ -0,0 +1,54 @@
+from typing import Union
+
+from mongoengine.errors import NotUniqueError
+from web3.types import LogReceipt
+
+from src.contracts.ethereum.pending_events import PendingEvents
+from src.db.collections.listener_state import ListenerCursor, PendingEvent
+from src.util.web3 import event_from_json, event_to_json
+
+
+class ListenerState:
+    """
+    The events an event listener found that wait for confirmations, and its scan cursor
+
+    With a cursor name, both are stored in the DB (see ListenerCursor, PendingEvent) and restored by the next run.
+    The DB calls are blocking
+    """
+
+    def __init__(self, cursor_name: str = ''):
+        self.cursor_name = cursor_name
+        self.pending_events = PendingEvents()
+
+    def restore(self, from_block: Union[int, str]) -> Union[int, str]:
+        """ Loads the pending events stored by a previous run, and returns the block to continue scanning from """
+        last_scanned = ListenerCursor.last_scanned(self.cursor_name) if self.cursor_name else None
+        if last_scanned is None:
+            return from_block
+
+        for record in PendingEvent.objects(listener=self.cursor_name).order_by('block_number', 'log_index'):
+            self.pending_events.push(record.event_name, event_from_json(record.event))
+
+        if from_block == "latest":
+            return last_scanned + 1
+        return max(int(from_block), last_scanned + 1)
+
+    def save_cursor(self, last_block: int):
+        if self.cursor_name:
+            ListenerCursor.update_last_scanned(self.cursor_name, last_block)
+
+    def add_pending(self, name: str, event: LogReceipt):
+        if self.cursor_name:
+            try:
+                PendingEvent(listener=self.cursor_name, event_name=name, block_number=event.blockNumber,
+                             tx_hash=event.transactionHash.hex(), log_index=event.logIndex,
+                             event=event_to_json(event)).save()
+            except NotUniqueError:
+                # already pending - restored from the DB and found again while catching up
+                return
+        self.pending_events.push(name, event)
+
+    def remove_pending(self, event: LogReceipt):
+        if self.cursor_name:
+            PendingEvent.objects(listener=self.cursor_name, tx_hash=event.transactionHash.hex(),
+                                 log_index=event.logIndex).delete()
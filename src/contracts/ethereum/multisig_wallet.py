@@ -1,5 +1,5 @@
 import os
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 from web3 import Web3
 from web3.datastructures import AttributeDict
@@ -7,6 +7,7 @@ from web3.datastructures import AttributeDict
 from src.contracts.ethereum.ethr_contract import EthereumContract
 from src.contracts.ethereum.message import Submit, Confirm
 from src.util.common import project_base_path
+from src.util.web3 import batch_calls
 
 
 class MultisigWallet(EthereumContract):
@@ -64,7 +65,18 @@ class MultisigWallet(EthereumContract):
 
     def submission_data(self, transaction_id) -> Dict[str, any]:
         data = self.contract.functions.transactions(transaction_id).call()
+        return self._submission_dict(transaction_id, data)
 
+    def submission_status(self, transaction_id, account: str) -> Tuple[Dict[str, any], bool]:
+        """
+        Returns the submission data of @transaction_id, and whether @account already confirmed it, in a single batch
+        """
+        data, confirmed = batch_calls(self.contract, [('transactions', (transaction_id,)),
+                                                      ('confirmations', (transaction_id, account))])
+        return self._submission_dict(transaction_id, data), confirmed
+
+    @staticmethod
+    def _submission_dict(transaction_id, data) -> Dict[str, any]:
         return {
             'dest': data[0],
             'amount': data[1],
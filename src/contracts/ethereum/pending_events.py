@@ -0,0 +1,43 @@
+from heapq import heappush, heappop, heapify
+from itertools import count
+from typing import Generator, Iterator, List, Tuple
+
+from web3.types import LogReceipt
+
+
+class PendingEvents:
+    """
+    Events waiting for confirmations, indexed by block number
+
+    Kept in a min-heap so releasing the confirmed events only touches the events at or below the released block:
+    O(log n) per insert and per released event, regardless of how many events are still pending
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int, int, str, LogReceipt]] = []
+        # tie breaker - keeps insertion order for events of the same log, and avoids comparing the events themselves
+        self._counter = count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __iter__(self) -> Iterator[Tuple[str, LogReceipt]]:
+        """ Iterates over the pending events by block order, without releasing them """
+        for _, _, _, name, event in sorted(self._heap):
+            yield name, event
+
+    def push(self, name: str, event: LogReceipt):
+        heappush(self._heap, (event.blockNumber, event.logIndex, next(self._counter), name, event))
+
+    def release(self, block: int) -> Generator[Tuple[str, LogReceipt], None, None]:
+        """ Removes and yields all the events at or below @block, by block order """
+        while self._heap and self._heap[0][0] <= block:
+            _, _, _, name, event = heappop(self._heap)
+            yield name, event
+
+    def drop_from(self, block: int) -> List[Tuple[str, LogReceipt]]:
+        """ Removes and returns all the events at or above @block (e.g. events of blocks replaced by a reorg) """
+        dropped = [(name, event) for number, _, _, name, event in self._heap if number >= block]
+        self._heap = [item for item in self._heap if item[0] < block]
+        heapify(self._heap)
+        return dropped
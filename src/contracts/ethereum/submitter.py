@@ -0,0 +1,53 @@
+from threading import Lock
+from typing import Dict, Optional
+
+from eth_utils import to_checksum_address
+from hexbytes import HexBytes
+
+from src.contracts.ethereum.ethr_contract import EthereumContract, broadcast_transaction
+from src.util.crypto_store.crypto_manager import CryptoManagerBase
+from src.util.metrics import InstrumentedLock
+from src.util.web3 import w3
+
+
+class TransactionSubmitter:
+    """
+    Builds, signs and broadcasts the transactions of an account, one at a time
+
+    Nonces are allocated here: the higher of the node's pending transaction count and the nonce after the last one we
+    sent, since the node's count may not include a transaction we just sent yet. Threads that built transactions on
+    their own would reuse nonces. A failed broadcast drops the local nonce, and the next transaction resyncs from the
+    node
+    """
+
+    def __init__(self, account: str):
+        self.account = to_checksum_address(account)
+        self.next_nonce: Optional[int] = None
+        self._lock = InstrumentedLock('eth.submitter')
+
+    def submit(self, contract: EthereumContract, signer: CryptoManagerBase, data: str, gas_price=None,
+               gas_limit=None, value: int = 0) -> HexBytes:
+        """ Sends @data to @contract - see EthereumContract.raw_transaction. Returns the hash of the transaction """
+        with self._lock:
+            nonce = max(w3.eth.getTransactionCount(self.account, block_identifier='pending'), self.next_nonce or 0)
+            tx = contract.raw_transaction(self.account, value, data, gas_price, gas_limit=gas_limit, nonce=nonce)
+            tx = contract.sign_transaction(tx, signer)
+
+            # if the broadcast fails, we don't know whether the node got the transaction
+            self.next_nonce = None
+            tx_hash = broadcast_transaction(tx)
+            self.next_nonce = nonce + 1
+            return tx_hash
+
+
+_submitters: Dict[str, TransactionSubmitter] = {}
+_submitters_lock = Lock()
+
+
+def submitter(account: str) -> TransactionSubmitter:
+    """ The submitter of @account - shared by everything that sends its transactions in this process """
+    account = to_checksum_address(account)
+    with _submitters_lock:
+        if account not in _submitters:
+            _submitters[account] = TransactionSubmitter(account)
+        return _submitters[account]
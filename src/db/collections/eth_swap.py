@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum, auto
 
-from mongoengine import Document, StringField, DateTimeField, signals, IntField
+from mongoengine import Document, StringField, DateTimeField, signals, IntField, ReferenceField
 
 from src.db.collections.common import EnumField
 
@@ -29,6 +29,20 @@ class Swap(Document):
     created_on = DateTimeField(default=datetime.utcnow())
     updated_on = DateTimeField(default=datetime.utcnow())
     sequence = IntField(required=False)
+    # swaps minted by a single tx (see SecretManager) reference the first swap of the batch, which holds the tx, its
+    # signatures and the status of the whole batch. None for the first swap, and for swaps minted on their own
+    batch = ReferenceField('self', required=False, default=None)
+
+    def save_batch(self):
+        """ Saves the swap, and copies its status to the other swaps of its batch """
+        self.save()
+        Swap.objects(batch=self).update(status=self.status, dst_tx_hash=self.dst_tx_hash, sequence=self.sequence,
+                                        updated_on=self.updated_on)
+
+    def update_batch(self, **kwargs):
+        """ Updates the swap and the other swaps of its batch """
+        self.update(**kwargs)
+        Swap.objects(batch=self).update(**kwargs)
 
     @classmethod
     def pre_save(cls, _, document, **kwargs):  # pylint: disable=unused-argument
@@ -0,0 +1,38 @@
+from typing import Optional
+
+from mongoengine import Document, IntField, StringField, DoesNotExist
+
+
+class ListenerCursor(Document):
+    """Last block an event listener scanned for new events"""
+    name = StringField(required=True, unique=True)
+    last_block = IntField(required=True)
+
+    @classmethod
+    def last_scanned(cls, name: str) -> Optional[int]:
+        """ Returns the last scanned block of listener @name, or None if it never ran """
+        try:
+            return cls.objects.get(name=name).last_block
+        except DoesNotExist:
+            return None
+
+    @classmethod
+    def update_last_scanned(cls, name: str, block: int):
+        cls.objects(name=name).update_one(set__last_block=block, upsert=True)
+
+
+class PendingEvent(Document):
+    """An event found by a listener that did not pass the confirmation threshold yet"""
+    listener = StringField(required=True)
+    event_name = StringField(required=True)
+    block_number = IntField(required=True)
+    tx_hash = StringField(required=True)
+    log_index = IntField(required=True)
+    # the decoded event, serialized with src.util.web3.event_to_json
+    event = StringField(required=True)
+
+    meta = {
+        'indexes': [
+            {'fields': ('listener', 'tx_hash', 'log_index'), 'unique': True},
+        ]
+    }
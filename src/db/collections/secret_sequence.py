@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Optional
+
+from mongoengine import Document, IntField, StringField, DateTimeField, DoesNotExist
+
+
+class SecretSequence(Document):
+    """The next sequence number to use for the transactions of a Secret account"""
+    account = StringField(required=True, unique=True)
+    account_number = IntField(required=True)
+    next_sequence = IntField(required=True)
+    resynced_on = DateTimeField(required=True)
+
+    @classmethod
+    def get(cls, account: str) -> Optional['SecretSequence']:
+        try:
+            return cls.objects.get(account=account)
+        except DoesNotExist:
+            return None
+
+    @classmethod
+    def reserve(cls, account: str) -> int:
+        """ Atomically takes the next sequence number of @account - safe across threads and processes """
+        doc = cls.objects(account=account).modify(inc__next_sequence=1)
+        if doc is None:
+            raise DoesNotExist(f"No sequence for account {account}")
+        # modify returns the document as it was before the update
+        return doc.next_sequence
+
+    @classmethod
+    def release(cls, account: str, sequence: int) -> bool:
+        """ Gives back @sequence, unless a later one was reserved since. Returns whether it was given back """
+        return cls.objects(account=account, next_sequence=sequence + 1).modify(dec__next_sequence=1) is not None
+
+    @classmethod
+    def sync(cls, account: str, account_number: int, sequence: int):
+        cls.objects(account=account).update_one(set__account_number=account_number, set__next_sequence=sequence,
+                                                set__resynced_on=datetime.utcnow(), upsert=True)
@@ -1,13 +1,16 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from subprocess import CalledProcessError
 from threading import Event, Thread
+from time import monotonic
+from typing import Dict, Optional
 
 from mongoengine.errors import NotUniqueError
 from pymongo.errors import DuplicateKeyError
 from web3.exceptions import TransactionNotFound
 
 import src.contracts.ethereum.message as message
-from src.contracts.ethereum.ethr_contract import broadcast_transaction
 from src.contracts.ethereum.multisig_wallet import MultisigWallet
+from src.contracts.ethereum.submitter import submitter
 from src.contracts.secret.secret_contract import swap_query_res, get_swap_id
 from src.db.collections.eth_swap import Swap, Status
 from src.db.collections.swaptrackerobject import SwapTrackerObject
@@ -18,9 +21,14 @@ from src.util.config import Config
 from src.util.crypto_store.crypto_manager import CryptoManagerBase
 from src.util.logger import get_logger
 from src.util.oracle.oracle import BridgeOracle
-from src.util.secretcli import query_scrt_swap
+from src.util.secretcli import SwapNotFound, query_scrt_swap
 from src.util.web3 import erc20_contract, w3
 
+# most swap nonces queried at once, per token
+SCAN_WINDOW = 32
+# tokens scanned at once
+TOKEN_WORKERS = 4
+
 
 class EtherLeader(Thread):
     """
@@ -30,6 +38,13 @@ class EtherLeader(Thread):
     broadcast a submit transaction on-chain.
 
     The account set here must have enough ETH for all the transactions you're planning on doing
+
+    Swaps are scanned a window of nonces at a time, queried concurrently. The window of a token doubles while all of
+    its nonces are found (up to 'scrt_swap_window'), and shrinks back when they aren't - so a backlog is drained at
+    the node's pace, and a quiet token costs a single query per tick.
+    Tokens are scanned concurrently by up to 'eth_leader_token_workers' threads, each on its own schedule, so a slow
+    token doesn't hold back the others. A token is never scanned by two threads at once, which keeps its swaps in
+    order
     """
     network = "Ethereum"
 
@@ -50,6 +65,11 @@ class EtherLeader(Thread):
         self.logger = get_logger(db_name=self.config['db_name'],
                                  logger_name=config.get('logger_name', self.__class__.__name__))
         self.stop_event = Event()
+        self.max_window = int(config.get('scrt_swap_window', SCAN_WINDOW))
+        self.windows: Dict[str, int] = {}
+        self.query_pool = ThreadPoolExecutor(max_workers=self.max_window, thread_name_prefix='SwapQuery')
+        self.scan_pool = ThreadPoolExecutor(max_workers=int(config.get('eth_leader_token_workers', TOKEN_WORKERS)),
+                                            thread_name_prefix='TokenScan')
         super().__init__(group=None, name="EtherLeader", target=self.run, **kwargs)
 
     def stop(self):
@@ -58,32 +78,71 @@ class EtherLeader(Thread):
 
     def run(self):
         self.logger.info("Starting")
-        self._scan_swap()
+        try:
+            self._scan_swap()
+        finally:
+            self.scan_pool.shutdown(wait=False)
+            self.query_pool.shutdown(wait=False)
 
     def _scan_swap(self):
         """ Scans secret network contract for swap events """
         self.logger.info(f'Starting for account {self.signer.address} with tokens: {self.token_map=}')
+        # when each token is due to be scanned again, and the tokens being scanned
+        due = {token: 0.0 for token in self.token_map}
+        scans: Dict[str, Future] = {}
         while not self.stop_event.is_set():
-            for token in self.token_map:
-                try:
-                    swap_tracker = SwapTrackerObject.get_or_create(src=token)
-                    next_nonce = swap_tracker.nonce + 1
-
-                    self.logger.debug(f'Scanning token {token} for query #{next_nonce}')
-
-                    swap_data = query_scrt_swap(next_nonce, self.config["scrt_swap_address"], token)
-
-                    self._handle_swap(swap_data, token, self.token_map[token].address)
-                    swap_tracker.nonce = next_nonce
-                    swap_tracker.save()
-                    next_nonce += 1
-
-                except CalledProcessError as e:
-                    if b'ERROR: query result: encrypted: Failed to get swap for token' not in e.stderr:
-                        self.logger.error(f"Failed to query swap: stdout: {e.stdout} stderr: {e.stderr}")
-                        # if b'ERROR: query result: encrypted: Failed to get swap for key' not in e.stderr:
-
-            self.stop_event.wait(self.config['sleep_interval'])
+            for token, due_at in due.items():
+                if token not in scans and due_at <= monotonic():
+                    scans[token] = self.scan_pool.submit(self._scan_token, token)
+
+            next_due = min((due_at for token, due_at in due.items() if token not in scans), default=None)
+            timeout = self.config['sleep_interval'] if next_due is None else max(next_due - monotonic(), 0)
+            if scans:
+                wait(scans.values(), timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                self.stop_event.wait(timeout)
+
+            for token, scan in list(scans.items()):
+                if scan.done():
+                    del scans[token]
+                    # there are probably more swaps waiting - no need to wait for them
+                    backlog = scan.result()
+                    due[token] = monotonic() + (0 if backlog else self.config['sleep_interval'])
+
+    def _scan_token(self, token: str) -> bool:
+        """
+        Handles the swaps of the next window of nonces of @token, up to the first nonce that isn't found
+
+        :return: True if all the nonces of the window were found
+        """
+        swap_tracker = SwapTrackerObject.get_or_create(src=token)
+        window = self.windows.get(token, 1)
+        nonces = range(swap_tracker.nonce + 1, swap_tracker.nonce + 1 + window)
+
+        self.logger.debug(f'Scanning token {token} for queries #{nonces.start}-#{nonces.stop - 1}')
+        swaps = self.query_pool.map(lambda nonce: self._query_swap(nonce, token), nonces)
+
+        handled = 0
+        for nonce, swap_data in zip(nonces, swaps):
+            if swap_data is None:
+                break
+            self._handle_swap(swap_data, token, self.token_map[token].address)
+            swap_tracker.nonce = nonce
+            swap_tracker.save()
+            handled += 1
+
+        self.windows[token] = min(window * 2, self.max_window) if handled == window else max(window // 2, 1)
+        return handled == window
+
+    def _query_swap(self, nonce: int, token: str) -> Optional[str]:
+        """ The swap with @nonce, or None if there isn't one, or it failed to be queried """
+        try:
+            return query_scrt_swap(nonce, self.config["scrt_swap_address"], token)
+        except SwapNotFound:
+            return None
+        except CalledProcessError as e:
+            self.logger.error(f"Failed to query swap: stdout: {e.stdout} stderr: {e.stderr}")
+            return None
 
     @staticmethod
     def _validate_fee(amount: int, fee: int):
@@ -191,13 +250,9 @@ class EtherLeader(Thread):
         # tx_hash = self.multisig_wallet.submit_transaction(self.config['leader_acc_addr'], self.config['leader_key'],
         #                                                   gas_price, msg)
         data = self.multisig_wallet.encode_data('submitTransaction', *msg.args())
-        tx = self.multisig_wallet.raw_transaction(
-            self.signer.address, 0, data, gas_price,
-            gas_limit=self.multisig_wallet.SUBMIT_GAS
-        )
-        tx = self.multisig_wallet.sign_transaction(tx, self.signer)
-
-        tx_hash = broadcast_transaction(tx)
+        # token scans broadcast concurrently - the submitter allocates their nonces
+        tx_hash = submitter(self.signer.address).submit(self.multisig_wallet, self.signer, data, gas_price,
+                                                        gas_limit=self.multisig_wallet.SUBMIT_GAS)
 
         self.logger.info(msg=f"Submitted tx: hash: {tx_hash.hex()}, msg: {msg}")
         return tx_hash.hex()
@@ -14,7 +14,8 @@ from src.signer.secret20.signer import SecretAccount
 from src.util.common import temp_file, temp_files, Token
 from src.util.config import Config
 from src.util.logger import get_logger
-from src.util.secretcli import broadcast, multisig_tx, query_data_success, get_uscrt_balance
+from src.util.secret.multisig import MultisigKey, multisign
+from src.util.secretcli import STDIN, broadcast, multisig_tx, query_data_success, query_tx, get_uscrt_balance
 
 BROADCAST_VALIDATION_COOLDOWN = 60
 SCRT_BLOCK_TIME = 7
@@ -22,11 +23,16 @@ SCRT_BLOCK_TIME = 7
 
 def _set_retry(tx: Swap):
     tx.status = Status.SWAP_RETRY
-    tx.save()
+    tx.save_batch()
 
 
 class Secret20Leader(Thread):
-    """ Broadcasts signed Secret-20 minting tx after successful ETH or ERC20 swap event """
+    """
+    Broadcasts signed Secret-20 minting tx after successful ETH or ERC20 swap event
+
+    The signatures are combined by secretcli. With 'secret_inprocess_multisign' set, they are combined in-process
+    instead, with the keys of the multisig set in 'secret_signers'
+    """
     network = "Secret"
 
     def __init__(
@@ -46,6 +52,9 @@ class Secret20Leader(Thread):
 
         self.multisig_name = secret_multisig.name
         self.config = config
+        self.multisig_key = None
+        if config.get('secret_inprocess_multisign', False):
+            self.multisig_key = MultisigKey.from_bech32(int(config['signatures_threshold']), config['secret_signers'])
         self.manager = SecretManager(contract, token_map, secret_multisig, config)
         self.logger = get_logger(
             db_name=self.config['db_name'],
@@ -58,7 +67,7 @@ class Secret20Leader(Thread):
     def _catch_up(self):
         """ Scans the DB for signed swap tx at startup """
         # Note: As Collection.objects() call is cached, there shouldn't be collisions with DB signals
-        for tx in Swap.objects(status=Status.SWAP_SIGNED).order_by('sequence'):
+        for tx in Swap.objects(status=Status.SWAP_SIGNED, batch=None).order_by('sequence'):
             self._create_and_broadcast(tx)
 
     def stop(self):
@@ -74,7 +83,8 @@ class Secret20Leader(Thread):
     def _scan_swap(self):
         while not self.stop_event.is_set():
             failed_prev = False
-            for tx in Swap.objects(status=Status.SWAP_SIGNED, src_network="Ethereum"):
+            # the swaps of a batch follow its first swap
+            for tx in Swap.objects(status=Status.SWAP_SIGNED, src_network="Ethereum", batch=None):
                 # if there are 2 transactions that depend on each other (sequence number), and the first fails we mark
                 # the next as "retry"
                 if failed_prev:
@@ -85,7 +95,7 @@ class Secret20Leader(Thread):
                 self.logger.info(f"Found tx ready for broadcasting {tx.id}")
                 failed_prev = not self._create_and_broadcast(tx)
             failed_prev = False
-            for tx in Swap.objects(status=Status.SWAP_SUBMITTED, src_network="Ethereum"):
+            for tx in Swap.objects(status=Status.SWAP_SUBMITTED, src_network="Ethereum", batch=None):
                 if failed_prev:
                     self.logger.info(f"Previous TX failed, retrying {tx.id}")
                     _set_retry(tx)
@@ -109,17 +119,20 @@ class Secret20Leader(Thread):
             self.logger.info(f"Broadcasted {tx.id} successfully - {scrt_tx_hash}")
             tx.status = Status.SWAP_SUBMITTED
             tx.dst_tx_hash = scrt_tx_hash
-            tx.save()
+            tx.save_batch()
             self.logger.info(f"Changed status of tx {tx.id} to submitted")
             return True
         except (RuntimeError, OperationError) as e:
             self.logger.error(msg=f"Failed to create multisig and broadcast, error: {e}")
             tx.status = Status.SWAP_FAILED
-            tx.save()
+            tx.save_batch()
             return False
 
     def _create_multisig(self, unsigned_tx: str, sequence: int, signatures: List[str]) -> str:
         """Takes all the signatures of the signers from the db and generates the signed tx with them."""
+        if self.multisig_key:
+            return multisign(unsigned_tx, self.multisig_key, signatures, self.config['chain_id'],
+                             self.manager.account_num, sequence)
 
         # creates temp-files containing the signatures, as the 'multisign' command requires files as input
         with temp_file(unsigned_tx) as unsigned_tx_path:
@@ -138,8 +151,7 @@ class Secret20Leader(Thread):
         self._check_remaining_funds()
 
         # Note: This operation costs Scrt
-        with temp_file(signed_tx) as signed_tx_path:
-            return json.loads(broadcast(signed_tx_path))['txhash']
+        return json.loads(broadcast(STDIN, stdin=signed_tx))['txhash']
 
     def _broadcast_validation(self, document: Swap) -> bool:  # pylint: disable=unused-argument
         """validation of submitted broadcast signed tx
@@ -149,13 +161,10 @@ class Secret20Leader(Thread):
         if not document.status == Status.SWAP_SUBMITTED or not document.src_network == "Ethereum":
             return False
 
-        tx_hash = document.dst_tx_hash
         try:
-            res = query_data_success(tx_hash)
-
-            if res and res["mint_from_ext_chain"]["status"] == "success":
+            if self._is_confirmed(document):
                 self.logger.info("Updated status to confirmed")
-                document.update(status=Status.SWAP_CONFIRMED)
+                document.update_batch(status=Status.SWAP_CONFIRMED)
                 return True
 
             # maybe the block took a long time - we wait 60 seconds before we mark it as failed
@@ -164,7 +173,7 @@ class Secret20Leader(Thread):
                 return True
 
             # TX isn't on-chain. We can retry it
-            document.update(status=Status.SWAP_RETRY)
+            document.update_batch(status=Status.SWAP_RETRY)
 
             # update sequence number - just in case we failed because we are out of sync
             self.manager.update_sequence()
@@ -176,6 +185,26 @@ class Secret20Leader(Thread):
             # The DB update can fail, but if it does we want to crash - this can lead to
             # duplicate amounts and confusion. Better to just stop and make sure
             # everything is kosher before continuing
-            document.update(status=Status.SWAP_FAILED)
+            document.update_batch(status=Status.SWAP_FAILED)
             self.manager.update_sequence()
             return False
+
+    @staticmethod
+    def _is_confirmed(document: Swap) -> bool:
+        """
+        Returns True if the mint tx of @document succeeded, or False if it isn't on-chain yet
+
+        :raises ValueError: if the tx failed
+        """
+        if not Swap.objects(batch=document).count():
+            res = query_data_success(document.dst_tx_hash)
+            return bool(res) and res["mint_from_ext_chain"]["status"] == "success"
+
+        # the output of a batch is that of all its messages - but a tx succeeds, or fails, as a whole
+        try:
+            res = query_tx(document.dst_tx_hash)
+        except RuntimeError:
+            return False
+        if not res.succeeded:
+            raise ValueError(f"Failed to execute transaction: {res.raw_log}")
+        return True
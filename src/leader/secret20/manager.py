@@ -1,10 +1,13 @@
-from threading import Thread, Event, Lock
-from typing import Dict
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Thread, Event, RLock
+from time import monotonic
+from typing import Deque, Dict, Iterable, Iterator, List, Tuple
 
 from web3.datastructures import AttributeDict
-from mongoengine.errors import NotUniqueError
+from mongoengine.errors import NotUniqueError, OperationError
 
-from src.contracts.ethereum.event_listener import EthEventListener
+from src.contracts.ethereum.event_hub import event_listener
 from src.contracts.ethereum.multisig_wallet import MultisigWallet
 from src.contracts.secret.secret_contract import mint_json
 from src.db.collections.eth_swap import Swap, Status
@@ -14,12 +17,26 @@ from src.signer.secret20.signer import SecretAccount
 from src.util.common import Token
 from src.util.config import Config
 from src.util.logger import get_logger
-from src.util.secretcli import create_unsigned_tx, account_info
-from src.util.web3 import w3
+from src.util.secret.sequence import SequenceAllocator
+from src.util.secretcli import create_unsigned_batch_tx
+from src.util.web3 import chain_head, contract_events_in_range
+
+# catch up defaults - partition size is in blocks
+CATCH_UP_PARTITION = 10000
+CATCH_UP_WORKERS = 4
+# swaps minted per tx - 1 mints each swap on its own. Seconds a batch waits for more swaps
+BATCH_SIZE = 1
+BATCH_WINDOW = 5.0
 
 
 class SecretManager(Thread):
-    """Registers to contract event and manages tx state in DB"""
+    """
+    Registers to contract event and manages tx state in DB
+
+    Swaps can be minted in batches: up to 'secret_batch_size' swaps seen within 'secret_batch_window' seconds are
+    minted by a single tx, with a message per swap, which is signed and broadcast once. The first swap of a batch
+    holds the tx, and the others reference it (see Swap.batch)
+    """
 
     def __init__(
         self,
@@ -33,29 +50,24 @@ class SecretManager(Thread):
         self.s20_map = token_to_secret_map
         self.config = config
         self.multisig = s20_multisig_account
-        self.event_listener = EthEventListener(contract, config)
+        self.event_listener = event_listener(contract, config)
 
         self.logger = get_logger(
             db_name=self.config['db_name'],
             logger_name=config.get('logger_name', f"{self.__class__.__name__}-{self.multisig.name}")
         )
         self.stop_signal = Event()
-        self.account_num = 0
-        self.sequence_lock = Lock()
-        self.sequence = 0
-        self.update_sequence()
+        self.sequences = SequenceAllocator(self.multisig.address)
+        self.account_num = self.sequences.account_number
+        self.batch_size = int(config.get('secret_batch_size', BATCH_SIZE))
+        self.batch_window = float(config.get('secret_batch_window', BATCH_WINDOW))
+        # (swap, mint message, block number) of the swaps waiting for their batch to be created
+        self.batch: List[Tuple[Swap, Dict, int]] = []
+        self.batch_started = 0.0
+        self.batch_lock = RLock()
         self.event_listener.register(self._handle, contract.tracked_event(),)
         super().__init__(group=None, name="SecretManager", target=self.run, **kwargs)
 
-    @property
-    def _sequence(self):
-        return self.sequence
-
-    @_sequence.setter
-    def _sequence(self, val):
-        with self.sequence_lock:
-            self.sequence = val
-
     def stop(self):
         self.logger.info("Stopping..")
         self.event_listener.stop()
@@ -65,7 +77,7 @@ class SecretManager(Thread):
         """Scans for signed transactions and updates status if multisig threshold achieved"""
         self.logger.info("Starting..")
 
-        to_block = w3.eth.blockNumber - self.config['eth_confirmations']
+        to_block = chain_head.number - self.config['eth_confirmations']
 
         self.catch_up(to_block)
 
@@ -73,21 +85,32 @@ class SecretManager(Thread):
         self.logger.info("Done catching up")
 
         while not self.stop_signal.is_set():
-            for transaction in Swap.objects(status=Status.SWAP_RETRY):
+            self._flush_if_due()
+
+            # the swaps of a batch follow its first swap
+            for transaction in Swap.objects(status=Status.SWAP_RETRY, batch=None):
                 self._retry(transaction)
 
-            for transaction in Swap.objects(status=Status.SWAP_UNSIGNED):
+            for transaction in Swap.objects(status=Status.SWAP_UNSIGNED, batch=None):
                 self.logger.debug(f"Checking unsigned tx {transaction.id}")
                 if Signatures.objects(tx_id=transaction.id).count() >= self.config['signatures_threshold']:
                     self.logger.info(f"Found tx {transaction.id} with enough signatures to broadcast")
                     transaction.status = Status.SWAP_SIGNED
-                    transaction.save()
+                    transaction.save_batch()
                     self.logger.info(f"Set status of tx {transaction.id} to signed")
                 else:
                     self.logger.debug(f"Tx {transaction.id} does not have enough signatures")
-            self.stop_signal.wait(self.config['sleep_interval'])
+            self.stop_signal.wait(min(self.config['sleep_interval'], self.batch_window))
 
     def catch_up(self, to_block: int):
+        """
+        Handles all the swap events between the last processed block and @to_block
+
+        The range is split into partitions of 'eth_catch_up_partition' blocks, fetched concurrently by up to
+        'eth_catch_up_workers' threads, up to twice as many partitions ahead of the one being handled. Partitions are
+        handled in block order, and the last processed block is saved after each one, so a crash mid catch-up resumes
+        from the last complete partition
+        """
         from_block = SwapTrackerObject.last_processed('Ethereum') + 1
         self.logger.debug(f'Starting to catch up from block {from_block}')
         if int(self.config['eth_start_block']) > from_block:
@@ -100,19 +123,40 @@ class SecretManager(Thread):
 
         self.logger.debug(f'Catching up to current block: {to_block}')
 
-        evt_filter = self.contract.contract.events.Swap.createFilter(fromBlock=from_block, toBlock=to_block)
-        for event in evt_filter.get_all_entries():
-            self._handle(event)
+        partition = int(self.config.get('eth_catch_up_partition', CATCH_UP_PARTITION))
+        ranges = ((start, min(start + partition - 1, to_block)) for start in range(from_block, to_block + 1, partition))
+
+        workers = int(self.config.get('eth_catch_up_workers', CATCH_UP_WORKERS))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for (_, end), events in self._fetch_in_order(pool, ranges, window=workers * 2):
+                for event in sorted(events, key=lambda e: (e.blockNumber, e.logIndex)):
+                    self.logger.info(f'Found new event at block: {event["blockNumber"]}')
+                    self._handle(event)
+                with self.batch_lock:
+                    self._flush_batch()
+                SwapTrackerObject.update_last_processed('Ethereum', end)
 
-        evt_filter = self.contract.contract.events.SwapToken.createFilter(fromBlock=from_block, toBlock=to_block)
-        for event in evt_filter.get_all_entries():
-            self._handle(event)
+    def _fetch_in_order(self, pool: ThreadPoolExecutor, ranges: Iterable[Tuple[int, int]],
+                        window: int) -> Iterator[Tuple[Tuple[int, int], List[AttributeDict]]]:
+        """
+        Yields the events of each of @ranges, in order, whatever order they are fetched in
 
-        # for event_name in self.contract.tracked_event():
-        #     for event in self.event_listener.events_in_range(event_name, from_block, to_block):
-        #         self.logger.info(f'Found new event at block: {event["blockNumber"]}')
+        At most @window ranges are fetched ahead of the one being handled, so the events of a long catch up are
+        never all held in memory at once
+        """
+        in_flight: Deque[Tuple[Tuple[int, int], Future]] = deque()
+        for block_range in ranges:
+            in_flight.append((block_range, pool.submit(self._events_in_range, block_range)))
+            if len(in_flight) >= window:
+                block_range, future = in_flight.popleft()
+                yield block_range, future.result()
+        for block_range, future in in_flight:
+            yield block_range, future.result()
 
-        SwapTrackerObject.update_last_processed('Ethereum', to_block)
+    def _events_in_range(self, block_range: Tuple[int, int]) -> List[AttributeDict]:
+        from_block, to_block = block_range
+        return [event for _, event in
+                contract_events_in_range(self.contract, self.contract.tracked_event(), from_block, to_block)]
 
     def _get_s20(self, foreign_token_addr: str) -> Token:
         return self.s20_map[foreign_token_addr]
@@ -121,9 +165,8 @@ class SecretManager(Thread):
         for signature in Signatures.objects(tx_id=tx.id):
             signature.delete()
         tx.status = Status.SWAP_UNSIGNED
-        tx.sequence = self.sequence
-        tx.save()
-        self.sequence = self.sequence + 1
+        tx.sequence = self.sequences.reserve()
+        tx.save_batch()
 
     def _handle(self, event: AttributeDict):
         """Extracts tx data from @event and add unsigned_tx to db"""
@@ -142,30 +185,82 @@ class SecretManager(Thread):
         try:
             s20 = self._get_s20(token)
             mint = mint_json(amount, tx_hash, recipient, s20.address)
-            unsigned_tx = create_unsigned_tx(self.config["scrt_swap_address"], mint, self.config['chain_id'],
-                                             self.config['enclave_key'], self.config["swap_code_hash"],
-                                             self.multisig.address)
-
-            tx = Swap(src_tx_hash=tx_hash, status=Status.SWAP_UNSIGNED, unsigned_tx=unsigned_tx, src_coin=token,
-                      dst_coin=s20.name, dst_address=s20.address, src_network="Ethereum", sequence=self.sequence,
-                      amount=amount)
-            tx.save(force_insert=True)
-            self.sequence = self.sequence + 1
-            self.logger.info(f"saved new Ethereum -> Secret transaction {tx_hash}, for {amount} {s20.name}")
-            # SwapTrackerObject.update_last_processed(src=Source.ETH.value, update_val=block_number)
+            swap = Swap(src_tx_hash=tx_hash, status=Status.SWAP_UNSIGNED, src_coin=token, dst_coin=s20.name,
+                        dst_address=s20.address, src_network="Ethereum", amount=amount)
         except (IndexError, AttributeError) as e:
             self.logger.error(f"Failed on tx {tx_hash}, block {block_number}, "
                               f"due to missing config: {e}")
+            with self.batch_lock:
+                # the swaps of earlier blocks still waiting for their batch mustn't be skipped on restart
+                if not self.batch:
+                    SwapTrackerObject.update_last_processed('Ethereum', block_number)
+            return
+
+        with self.batch_lock:
+            if not self.batch:
+                self.batch_started = monotonic()
+            self.batch.append((swap, mint, block_number))
+            if len(self.batch) >= self.batch_size:
+                self._flush_batch()
+
+    def _flush_if_due(self):
+        """ Flushes the batch if its first swap waited for 'secret_batch_window' seconds """
+        with self.batch_lock:
+            if self.batch and monotonic() - self.batch_started >= self.batch_window:
+                self._flush_batch()
+
+    def _flush_batch(self):
+        """ Creates the tx minting the swaps of the batch, and saves them. Called holding batch_lock """
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        block_number = max(block for _, _, block in batch)
+
+        # events seen again, e.g. while catching up
+        saved = {swap.src_tx_hash for swap in Swap.objects(src_tx_hash__in=[swap.src_tx_hash for swap, _, _ in batch])}
+        for tx_hash in saved:
+            self.logger.error(f"Tried to save duplicate TX, might be a catch up issue - {tx_hash}")
+        batch = [(swap, mint) for swap, mint, _ in batch if swap.src_tx_hash not in saved]
+
+        try:
+            if batch:
+                self._save_batch(batch)
         except RuntimeError as e:
-            self.logger.error(f"Failed to create swap tx for eth hash {tx_hash}, block {block_number}. Error: {e}")
+            self.logger.error(f"Failed to create swap tx for eth hashes {[swap.src_tx_hash for swap, _ in batch]}, "
+                              f"block {block_number}. Error: {e}")
         except NotUniqueError as e:
             self.logger.error(f"Tried to save duplicate TX, might be a catch up issue - {e}")
-        # return block_number, tx_hash, recipient, s20
         SwapTrackerObject.update_last_processed('Ethereum', block_number)
 
-    def _account_details(self):
-        details = account_info(self.multisig.address)
-        return details["value"]["account_number"], details["value"]["sequence"]
+    def _save_batch(self, batch: List[Tuple[Swap, Dict]]):
+        """
+        Saves the swaps of @batch, with the tx minting them all. If one of them can't be saved, none is kept, and
+        the sequence reserved for the tx is released
+        """
+        unsigned_tx = create_unsigned_batch_tx(self.config["scrt_swap_address"], [mint for _, mint in batch],
+                                               self.config['chain_id'], self.config['enclave_key'],
+                                               self.config["swap_code_hash"], self.multisig.address)
+        first = batch[0][0]
+        sequence = self.sequences.reserve()
+        saved = []
+        try:
+            for swap, _ in batch:
+                swap.unsigned_tx = unsigned_tx
+                swap.sequence = sequence
+                swap.batch = None if swap is first else first
+                swap.save(force_insert=True)
+                saved.append(swap)
+        except OperationError:
+            for swap in reversed(saved):
+                swap.delete()
+            self.sequences.release(sequence)
+            raise
+
+        for swap in saved:
+            self.logger.info(f"saved new Ethereum -> Secret transaction {swap.src_tx_hash}, for {swap.amount} "
+                             f"{swap.dst_coin}")
 
     def update_sequence(self):
-        self.account_num, self.sequence = self._account_details()
+        """ Called when a tx failed, or was never included - the txs with the sequences after it can't be either """
+        self.sequences.gap()
+        self.account_num = self.sequences.account_number
@@ -6,8 +6,8 @@ from typing import Dict
 from web3.datastructures import AttributeDict
 
 import src.contracts.ethereum.message as message
-from src.contracts.ethereum.ethr_contract import broadcast_transaction
 from src.contracts.ethereum.multisig_wallet import MultisigWallet
+from src.contracts.ethereum.submitter import submitter
 from src.contracts.secret.secret_contract import swap_query_res
 from src.db.collections.token_map import TokenPairing
 from src.util.common import Token
@@ -85,7 +85,7 @@ class EthSignerImpl:  # pylint: disable=too-many-instance-attributes, too-many-a
         transaction_id = submission_event.args.transactionId
         self.logger.info(f'Got submission event with transaction id: {transaction_id}, checking status')
 
-        data = self.multisig_contract.submission_data(transaction_id)
+        data, signed = self.multisig_contract.submission_status(transaction_id, self.account)
         # placeholder - check how this looks for ETH transactions
         # check if submitted tx is an ERC-20 transfer tx
         if data['amount'] == 0 and data['data']:
@@ -93,7 +93,7 @@ class EthSignerImpl:  # pylint: disable=too-many-instance-attributes, too-many-a
             data['amount'] = params['amount']
             data['dest'] = params['recipient']
 
-        if not self._is_confirmed(transaction_id, data):
+        if not self._is_confirmed(data, signed):
             self.logger.info(f'Transaction {transaction_id} is missing approvals. Checking validity..')
 
             try:
@@ -156,7 +156,8 @@ class EthSignerImpl:  # pylint: disable=too-many-instance-attributes, too-many-a
 
         return True
 
-    def _is_confirmed(self, transaction_id: int, submission_data: Dict[str, any]) -> bool:
+    @staticmethod
+    def _is_confirmed(submission_data: Dict[str, any], signed: bool) -> bool:
         """Checks with the data on the contract if signer already added confirmation or if threshold already reached"""
 
         # check if already executed
@@ -164,11 +165,7 @@ class EthSignerImpl:  # pylint: disable=too-many-instance-attributes, too-many-a
             return True
 
         # check if signer already signed the tx
-        res = self.multisig_contract.contract.functions.confirmations(transaction_id, self.account).call()
-        if res:
-            return True
-
-        return False
+        return signed
 
     def _approve_and_sign(self, submission_id: int):
         """
@@ -182,10 +179,8 @@ class EthSignerImpl:  # pylint: disable=too-many-instance-attributes, too-many-a
         msg = message.Confirm(submission_id)
 
         data = self.multisig_contract.encode_data('confirmTransaction', *msg.args())
-        tx = self.multisig_contract.raw_transaction(self.signer.address, 0, data, gas_prices,
-                                                    gas_limit=self.multisig_contract.CONFIRM_GAS)
-        tx = self.multisig_contract.sign_transaction(tx, self.signer)
-        tx_hash = broadcast_transaction(tx)
+        tx_hash = submitter(self.signer.address).submit(self.multisig_contract, self.signer, data, gas_prices,
+                                                        gas_limit=self.multisig_contract.CONFIRM_GAS)
 
         # tx_hash = self.multisig_contract.confirm_transaction(self.account, self.private_key, gas_prices, msg)
         self.logger.info(msg=f"Signed transaction - signer: {self.account}, signed msg: {msg}, "
@@ -1,7 +1,7 @@
 from threading import Thread, Event
 from time import sleep
 
-from src.contracts.ethereum.event_listener import EthEventListener
+from src.contracts.ethereum.event_hub import event_listener
 from src.contracts.ethereum.multisig_wallet import MultisigWallet
 from src.signer.eth.impl import EthSignerImpl
 from src.util.config import Config
@@ -20,7 +20,8 @@ class EtherSigner(Thread):
     greater than the set threshold will trigger the transfer of funds
 
     Will first attempt to catch up with unsigned transactions by scanning past events,
-    and only then will start monitoring new transactions.
+    and only then will start monitoring new transactions. After a restart the scan resumes from the
+    last block the event listener stored, rather than from 'eth_start_block'.
 
     The account set here must have enough ETH for all the transactions you're planning on doing
     """
@@ -34,7 +35,9 @@ class EtherSigner(Thread):
     ):
         self.account = signer.address
         # self.private_key = private_key
-        self.event_listener = EthEventListener(contract, config)
+        # submissions of different transactions can be signed in parallel (see 'eth_callback_workers')
+        self.event_listener = event_listener(contract, config, cursor_name=f"{self.__class__.__name__}-{self.account}",
+                                             partition_key=lambda event: event.args.transactionId)
         self.stop_event = Event()
         self.logger = get_logger(
             db_name=config['db_name'],
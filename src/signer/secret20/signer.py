@@ -1,28 +1,38 @@
 import json
-from collections import namedtuple
+from collections import Counter, namedtuple
 from threading import Thread, Event
-from typing import Dict
+from typing import Dict, Optional, Tuple
 
 from mongoengine import OperationError
+from web3.datastructures import AttributeDict
 
 from src.contracts.ethereum.multisig_wallet import MultisigWallet
 from src.db.collections.eth_swap import Swap, Status
+from src.db.collections.secret_sequence import SecretSequence
 from src.db.collections.signatures import Signatures
-from src.util.common import temp_file
 from src.util.config import Config
 from src.util.logger import get_logger
-from src.util.secretcli import sign_tx as secretcli_sign, decrypt, account_info
+from src.util.secret.signing import SecretKey, secret_key_from_config, sign_tx
+from src.util.secretcli import STDIN, sign_tx as secretcli_sign, decrypt, account_info
 
 SecretAccount = namedtuple('SecretAccount', ['address', 'name'])
 
 
 class Secret20Signer(Thread):
-    """Signs on the SCRT side, after verifying Ethereum tx stored in the db"""
+    """
+    Signs on the SCRT side, after verifying Ethereum tx stored in the db
 
-    def __init__(self, multisig: SecretAccount, contract: MultisigWallet, config: Config, **kwargs):
+    Transactions are signed in-process with @key (e.g. a CryptoStoreSecretKey, the key labeled
+    'secret_signer_key_label' in the HSM token), or with the key set in 'secret_signer_private_key'. Without either,
+    they are signed by secretcli, with the key it stores as the multisig's name
+    """
+
+    def __init__(self, multisig: SecretAccount, contract: MultisigWallet, config: Config,
+                 key: Optional[SecretKey] = None, **kwargs):
         self.multisig = multisig
         self.contract = contract
         self.config = config
+        self.key = key or secret_key_from_config(config)
         self.stop_event = Event()
         self.logger = get_logger(
             db_name=config['db_name'],
@@ -30,7 +40,9 @@ class Secret20Signer(Thread):
         )
         super().__init__(group=None, name=f"SecretSigner-{self.multisig.name}", target=self.run, **kwargs)
         self.setDaemon(True)  # so tests don't hang
-        self.account_num, _ = self._account_details()
+        # the account number never changes - the leader keeps it with the account's sequence
+        sequence = SecretSequence.get(self.multisig.address)
+        self.account_num = sequence.account_number if sequence else self._account_details()[0]
         # signals.post_init.connect(self._tx_signal, sender=ETHSwap)  # TODO: test this with deployed db on machine
 
     def stop(self):
@@ -42,7 +54,8 @@ class Secret20Signer(Thread):
         self.logger.info("Starting..")
         while not self.stop_event.is_set():
             failed = False
-            for tx in Swap.objects(status=Status.SWAP_UNSIGNED):
+            # the swaps of a batch are signed with its first swap
+            for tx in Swap.objects(status=Status.SWAP_UNSIGNED, batch=None):
 
                 # if there are 2 transactions that depend on each other (sequence number), and the first fails we mark
                 # the next as "retry"
@@ -73,14 +86,14 @@ class Secret20Signer(Thread):
         if not self._is_valid(tx):
             self.logger.error(f"Validation failed. Signer: {self.multisig.name}. Tx id:{tx.id}.")
             tx.status = Status.SWAP_FAILED
-            tx.save()
+            tx.save_batch()
             raise ValueError
 
         try:
-            signed_tx = self._sign_with_secret_cli(tx.unsigned_tx, tx.sequence)
+            signed_tx = self._sign(tx.unsigned_tx, tx.sequence)
         except RuntimeError as e:
             tx.status = Status.SWAP_FAILED
-            tx.save()
+            tx.save_batch()
             raise ValueError from e
 
         try:
@@ -94,25 +107,44 @@ class Secret20Signer(Thread):
         return Signatures.objects(tx_id=tx.id, signer=self.multisig.name).count() > 0
 
     def _is_valid(self, tx: Swap) -> bool:
-        """Assert that the data in the unsigned_tx matches the tx on the chain"""
-        log = self.contract.get_events_by_tx(tx.src_tx_hash)
-        if not log:  # because for some reason event_log can return None???
-            return False
+        """
+        Assert that the data in the unsigned_tx matches the tx on the chain
 
+        The tx of a batch mints each of its swaps - every message is checked against the on-chain tx of its swap. The
+        logs of all the swaps are fetched in a single batch
+        """
         try:
-            unsigned_tx = json.loads(tx.unsigned_tx)
-
-            res = self._decrypt(unsigned_tx)
-            self.logger.debug(f'Decrypted unsigned tx successfully {res}')
-            json_start_index = res.find('{')
-            json_end_index = res.rfind('}') + 1
-            decrypted_data = json.loads(res[json_start_index:json_end_index])
-
-        except json.JSONDecodeError:
+            mints = [self._decrypt_mint(msg) for msg in json.loads(tx.unsigned_tx)['value']['msg']]
+        except (json.JSONDecodeError, RuntimeError):
             self.logger.error(f'Tried to load tx with hash: {tx.src_tx_hash} {tx.id}'
                               f'but got data as invalid json, or failed to decrypt')
             return False
 
+        swaps = {swap.src_tx_hash: swap for swap in [tx, *Swap.objects(batch=tx)]}
+        identifiers = [mint.get('mint_from_ext_chain', {}).get('identifier') for mint in mints]
+        # each swap is minted exactly once, and nothing else is
+        if Counter(identifiers) != Counter(swaps.keys()):
+            self.logger.error(f"Failed to validate tx data: {tx}, minting {identifiers} instead of {list(swaps)}")
+            return False
+
+        logs = dict(zip(swaps, self.contract.get_events_by_txs(list(swaps))))
+        return all(self._is_valid_mint(swaps[identifier], mint, logs[identifier])
+                   for identifier, mint in zip(identifiers, mints))
+
+    def _decrypt_mint(self, msg: Dict) -> Dict:
+        """
+        :raises RuntimeError: if the message can't be decrypted
+        :raises json.JSONDecodeError: if the message isn't valid json
+        """
+        _, res = self._decrypt(msg)
+        self.logger.debug(f'Decrypted unsigned tx successfully {res}')
+        return json.loads(res)
+
+    def _is_valid_mint(self, tx: Swap, decrypted_data: Dict, log: Optional[AttributeDict]) -> bool:
+        """ Assert that a mint message matches the on-chain tx of its swap, whose swap event is @log """
+        if not log:  # because for some reason event_log can return None???
+            return False
+
         # extract address and value from unsigned transaction
         try:
             tx_amount = int(decrypted_data['mint_from_ext_chain']['amount'])
@@ -145,18 +177,19 @@ class Secret20Signer(Thread):
 
         return True
 
-    def _sign_with_secret_cli(self, unsigned_tx: str, sequence: int) -> str:
-        with temp_file(unsigned_tx) as unsigned_tx_path:
-            res = secretcli_sign(unsigned_tx_path, self.multisig.address, self.multisig.name,
-                                 self.account_num, sequence)
+    def _sign(self, unsigned_tx: str, sequence: int) -> str:
+        if self.key is None:
+            return self._sign_with_secret_cli(unsigned_tx, sequence)
+        return sign_tx(unsigned_tx, self.key, self.config['chain_id'], self.account_num, sequence)
 
-        return res
+    def _sign_with_secret_cli(self, unsigned_tx: str, sequence: int) -> str:
+        return secretcli_sign(STDIN, self.multisig.address, self.multisig.name, self.account_num, sequence,
+                              stdin=unsigned_tx)
 
     @staticmethod
-    def _decrypt(unsigned_tx: Dict):
-        msg = unsigned_tx['value']['msg'][0]['value']['msg']
-        return decrypt(msg)
+    def _decrypt(msg: Dict) -> Tuple[str, str]:
+        return decrypt(msg['value']['msg'])
 
     def _account_details(self):
         details = account_info(self.multisig.address)
-        return details["value"]["account_number"], details["value"]["sequence"]
+        return details.account_number, details.sequence
@@ -1,37 +1,66 @@
-import sys
+import os
 from collections import namedtuple
-from contextlib import contextmanager
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
-from os import remove
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import List, Generator
+from typing import Generator, List, Optional
 
 import src
 
 
-@contextmanager
-def temp_file(data: str):
-    f = NamedTemporaryFile(mode="w+", delete=False)
-    f.write(data)
-    f.close()
-    yield f.name
-    remove(f.name)
+# tmpfs - files written here stay in memory
+SHM_DIR = '/dev/shm'
 
 
-# todo: I don't think this actually works
-@contextmanager
-def temp_files(data: List[str], logger) -> Generator:
-    temp = []
-    for d in data:
-        temp.append(temp_file(d))
+def _memfd(data: str) -> Optional[int]:
+    """ An anonymous in-memory file holding @data, or None if the platform has none """
+    if not hasattr(os, 'memfd_create') or not os.path.isdir(f'/proc/{os.getpid()}/fd'):
+        return None
+    fd = os.memfd_create('bridge-temp', 0)
+    try:
+        os.write(fd, data.encode())
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
 
-    yield list(manager.__enter__() for manager in temp)
-    for manager in temp:
+
+@contextmanager
+def temp_file(data: str) -> Generator[str, None, None]:
+    """
+    A temporary file holding @data, for commands that only read their input from files. Yields its path
+
+    The file is kept in memory - an anonymous memfd when the platform has one (opened by other processes through
+    /proc), or a file in /dev/shm - and falls back to the default temp dir. It's removed when the block exits,
+    also on exceptions
+    """
+    fd = _memfd(data)
+    if fd is not None:
         try:
-            manager.__exit__(*sys.exc_info())
-        except OSError as e:
-            logger.debug(msg=e)
+            # /proc/self would be the reading process, not us
+            yield f'/proc/{os.getpid()}/fd/{fd}'
+        finally:
+            os.close(fd)
+        return
+
+    f = NamedTemporaryFile(mode="w+", delete=False, dir=SHM_DIR if os.path.isdir(SHM_DIR) else None)
+    try:
+        f.write(data)
+        f.close()
+        yield f.name
+    finally:
+        f.close()
+        os.remove(f.name)
+
+
+@contextmanager
+def temp_files(data: List[str], logger=None) -> Generator[List[str], None, None]:
+    """ Like temp_file, for several files. All of them are removed when the block exits, also on exceptions """
+    with ExitStack() as stack:
+        yield [stack.enter_context(temp_file(d)) for d in data]
+    if logger:
+        logger.debug(f"Removed {len(data)} temp files")
 
 
 # noinspection PyTypeChecker
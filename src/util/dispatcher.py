@@ -0,0 +1,59 @@
+from queue import Queue
+from threading import Thread
+from typing import Callable, Hashable, List, Optional
+
+from src.util.logger import get_logger
+
+WORKERS = 4
+# tasks waiting per worker - when a worker's queue is full, submitting to it blocks
+QUEUE_SIZE = 100
+
+
+class KeyedDispatcher:
+    """
+    Runs tasks on a fixed pool of worker threads, in order per partition key
+
+    All the tasks of a key go to the same worker (by hash), so they run one after the other in submission order,
+    while tasks of different keys run in parallel. Each worker has a bounded queue: a producer that gets ahead of a
+    busy worker blocks in submit, which throttles it instead of queueing without limit.
+
+    A task that raises stops the dispatcher: the error is raised again by the next submit, so a failing task still
+    stops its producer, and the tasks that were already queued are dropped without running
+    """
+
+    def __init__(self, workers: int = WORKERS, queue_size: int = QUEUE_SIZE, name: str = 'Dispatcher'):
+        self.queues: List[Queue] = [Queue(maxsize=queue_size) for _ in range(workers)]
+        self.error: Optional[Exception] = None
+        self.logger = get_logger(logger_name=name)
+        self.workers = [Thread(target=self._work, args=(queue,), name=f"{name}-{i}", daemon=True)
+                        for i, queue in enumerate(self.queues)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, key: Hashable, task: Callable[[], None]):
+        if self.error:
+            raise self.error
+        self.queues[hash(key) % len(self.queues)].put(task)
+
+    def stop(self):
+        """ Lets the workers finish the tasks already submitted, and exit """
+        for queue in self.queues:
+            queue.put(None)
+
+    def join(self, timeout: Optional[float] = None):
+        for worker in self.workers:
+            worker.join(timeout)
+
+    def _work(self, queue: Queue):
+        while True:
+            task = queue.get()
+            if task is None:
+                return
+            if self.error:
+                # keep draining the queue, so a producer blocked on it is released
+                continue
+            try:
+                task()
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.error(f"Task failed, stopping dispatcher: {e}")
+                self.error = e
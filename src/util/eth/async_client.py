@@ -0,0 +1,68 @@
+import asyncio
+from itertools import count
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from src.util.eth.provider_pool import REQUEST_TIMEOUT
+
+# errors of a request that didn't get an answer from the node
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+class AsyncJsonRpc:
+    """
+    Minimal asyncio JSON-RPC client for an HTTP Ethereum node
+
+    Keeps a single aiohttp session (and connection pool), created on first use so it belongs to the running loop.
+    JSON-RPC error responses raise ValueError with the error object, like web3 does
+    """
+
+    def __init__(self, endpoint: str, timeout: float = REQUEST_TIMEOUT):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ids = count(0)
+
+    async def request(self, method: str, params: List) -> Any:
+        return (await self.batch([(method, params)]))[0]
+
+    async def batch(self, calls: List[Tuple[str, List]]) -> List:
+        """ Sends @calls (method, params) in a single POST, and returns their results in order """
+        request = [{'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params}
+                   for method, params in calls]
+        async with self._get_session().post(self.endpoint, json=request, raise_for_status=True) as response:
+            responses: Dict[int, Dict] = {item['id']: item for item in await response.json(content_type=None)}
+
+        results = []
+        for call in request:
+            response = responses[call['id']]
+            if 'error' in response:
+                raise ValueError(response['error'])
+            results.append(response['result'])
+        return results
+
+    async def block_number(self) -> int:
+        return int(await self.request('eth_blockNumber', []), 16)
+
+    async def get_logs(self, addresses: List[str], topics: List[str], from_block: int,
+                       to_block: int) -> Tuple[int, List[Dict]]:
+        """
+        Raw logs emitted by any of @addresses with any of @topics as topic0
+
+        :return: the head of the node that answered, and the logs - which only go up to that head
+        """
+        head, logs = await self.batch([('eth_blockNumber', []),
+                                       ('eth_getLogs', [{'address': addresses, 'topics': [topics],
+                                                         'fromBlock': hex(from_block), 'toBlock': hex(to_block)}])])
+        return int(head, 16), logs
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
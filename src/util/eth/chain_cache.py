@@ -0,0 +1,110 @@
+import json
+import sqlite3
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from typing import Dict, Optional
+
+from src.util.metrics import metrics
+
+MEMORY_ITEMS = 10000
+DISK_BYTES = 256 * 1024 * 1024
+# after the disk tier overflows, entries are evicted until it is back to this fraction of its size
+DISK_EVICTION_TARGET = 0.9
+# reads from the disk tier are recorded (for the eviction order) in batches of this many
+TOUCH_BATCH = 100
+
+
+class ChainCache:
+    """
+    Two tier cache for chain data that can't change anymore (receipts and blocks below the confirmation depth)
+
+    Entries are JSON values, keyed by the chain, a namespace (e.g. 'receipt') and a key (e.g. the tx hash). Reads go
+    to an in-process LRU first, and then to a sqlite file that survives restarts. The file is kept under 'disk_bytes'
+    by evicting the least recently read entries - reads are recorded in batches (TOUCH_BATCH), so most of them don't
+    write. Without a path, only the in-memory tier is used.
+    Hits and misses are counted in the 'eth.cache.*' metrics
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_items: int = MEMORY_ITEMS, disk_bytes: int = DISK_BYTES,
+                 chain: str = ''):
+        """ :param chain: identifies the chain the entries belong to, so a file shared by several never mixes them """
+        self.chain = chain
+        self.memory: OrderedDict = OrderedDict()
+        self.memory_items = memory_items
+        self.disk_bytes = disk_bytes
+        self.lock = Lock()
+        self.db = None
+        self.disk_used = 0
+        # disk tier reads not recorded yet - key to time
+        self._touched: Dict[str, float] = {}
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.db.execute('CREATE TABLE IF NOT EXISTS entries '
+                            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+            self.disk_used = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        full_key = f'{self.chain}:{namespace}:{key}'
+        with self.lock:
+            if full_key in self.memory:
+                self.memory.move_to_end(full_key)
+                metrics.counter('eth.cache.memory_hits').inc()
+                return self.memory[full_key]
+
+            row = None
+            if self.db:
+                row = self.db.execute('SELECT value FROM entries WHERE key = ?', (full_key,)).fetchone()
+            if row is None:
+                metrics.counter('eth.cache.misses').inc()
+                return None
+
+            self._touched[full_key] = time()
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush_touched()
+            value = json.loads(row[0])
+            self._remember(full_key, value)
+            metrics.counter('eth.cache.disk_hits').inc()
+            return value
+
+    def put(self, namespace: str, key: str, value: dict):
+        full_key = f'{self.chain}:{namespace}:{key}'
+        with self.lock:
+            self._remember(full_key, value)
+            if self.db:
+                data = json.dumps(value, separators=(',', ':'))
+                replaced = self.db.execute('SELECT size FROM entries WHERE key = ?', (full_key,)).fetchone()
+                self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', (full_key, data, len(data), time()))
+                self.disk_used += len(data) - (replaced[0] if replaced else 0)
+                if self.disk_used > self.disk_bytes:
+                    self._evict()
+
+    def _remember(self, full_key: str, value: dict):
+        self.memory[full_key] = value
+        self.memory.move_to_end(full_key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _flush_touched(self):
+        """ Records the pending reads, in a single transaction """
+        self.db.execute('BEGIN')
+        self.db.executemany('UPDATE entries SET accessed = ? WHERE key = ?',
+                            [(accessed, key) for key, accessed in self._touched.items()])
+        self.db.execute('COMMIT')
+        self._touched.clear()
+
+    def _evict(self):
+        """ Deletes the least recently read entries, until the disk tier is back under its target size """
+        if self._touched:
+            self._flush_touched()
+        while self.disk_used > self.disk_bytes * DISK_EVICTION_TARGET:
+            oldest = self.db.execute('SELECT key, size FROM entries ORDER BY accessed LIMIT 100').fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.disk_used -= size
+                metrics.counter('eth.cache.evictions').inc()
+                if self.disk_used <= self.disk_bytes * DISK_EVICTION_TARGET:
+                    break
@@ -0,0 +1,73 @@
+from threading import Condition, Lock
+from time import monotonic
+from typing import Callable, Optional
+
+from src.util.metrics import metrics
+
+HEAD_INTERVAL = 1.0
+
+
+class ChainHead:
+    """
+    Process wide view of the current block number, shared by all the threads that need it
+
+    Reads are served from a cached value, refreshed from the node at most once every 'interval' seconds no matter
+    how many threads ask. A new-heads subscription can push blocks with 'update', which also wakes up all the threads
+    waiting for a height at once, and a head with a new hash replaces a higher one
+    """
+
+    def __init__(self, fetch: Callable[[], int], interval: float = HEAD_INTERVAL):
+        self.fetch = fetch
+        self.interval = interval
+        self._number: Optional[int] = None
+        # hash of the head, when it was given with it
+        self._hash: Optional[bytes] = None
+        self._updated = 0.0
+        self._new_head = Condition()
+        self._refresh_lock = Lock()
+
+    @property
+    def number(self) -> int:
+        """ The current block number, at most 'interval' seconds old """
+        if self._number is None or monotonic() - self._updated >= self.interval:
+            self._refresh()
+        return self._number
+
+    def update(self, number: int, block_hash: Optional[bytes] = None):
+        """
+        Sets a new head received from elsewhere (e.g. a subscription)
+
+        Lower heads are ignored, unless both their @block_hash and the head's are known and differ - a reorg to a
+        shorter chain, as reported by newHeads. A head polled from the node has no hash, and isn't replaced
+        """
+        with self._new_head:
+            replaced = block_hash is not None and self._hash is not None and block_hash != self._hash
+            if self._number is None or number > self._number or replaced:
+                self._number = number
+                self._hash = block_hash
+                self._updated = monotonic()
+                self._new_head.notify_all()
+
+    def wait_for(self, height: int, timeout: Optional[float] = None) -> int:
+        """
+        Blocks until the head is at least @height, or @timeout seconds passed
+
+        :return: the current head
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while self.number < height:
+            remaining = self.interval if deadline is None else min(self.interval, deadline - monotonic())
+            if remaining <= 0:
+                break
+            with self._new_head:
+                self._new_head.wait_for(lambda: self._number >= height, remaining)
+        return self._number
+
+    def _refresh(self):
+        # only one thread queries the node, the others use its result
+        with self._refresh_lock:
+            if self._number is not None and monotonic() - self._updated < self.interval:
+                return
+            metrics.counter('eth.head.refreshes').inc()
+            self.update(self.fetch())
+            self._updated = monotonic()
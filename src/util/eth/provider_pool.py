@@ -0,0 +1,272 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from threading import Lock, local
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import requests
+import websockets
+from web3 import HTTPProvider, IPCProvider, WebsocketProvider
+from web3._utils.request import make_post_request
+from web3.providers import BaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from src.util.logger import get_logger
+from src.util.metrics import InstrumentedLock, metrics
+
+# weight of the newest sample in the latency moving average
+LATENCY_ALPHA = 0.3
+# a failed endpoint is skipped for this long (seconds), doubled on every consecutive failure up to the maximum
+RETRY_INTERVAL = 1.0
+RETRY_INTERVAL_MAX = 60.0
+# methods that must all go to the same node, so the transactions and nonces it sees are consistent
+STICKY_METHODS = ('eth_sendRawTransaction', 'eth_sendTransaction', 'eth_getTransactionCount')
+# seconds, same as web3's default
+REQUEST_TIMEOUT = 10
+# errors that mean the endpoint itself failed (as opposed to a JSON-RPC error response)
+ENDPOINT_ERRORS = (OSError, json.JSONDecodeError, asyncio.TimeoutError, websockets.WebSocketException)
+# methods whose cost depends on the query - a timeout means the query was too large (see logs_in_range), and is
+# neither held against the node nor retried on the others
+QUERY_METHODS = ('eth_getLogs',)
+QUERY_TIMEOUTS = (requests.ReadTimeout, asyncio.TimeoutError)
+
+
+def eth_endpoints(eth_node: Union[str, List[str]]) -> List[str]:
+    """ Parses the 'eth_node' configuration - a single endpoint, a comma separated string, or a list """
+    if isinstance(eth_node, str):
+        eth_node = eth_node.split(',')
+    return [endpoint.strip() for endpoint in eth_node if endpoint.strip()]
+
+
+class SessionHTTPProvider(HTTPProvider):
+    """
+    HTTPProvider with a requests session (and connection pool) per thread
+
+    web3's HTTPProvider shares a single session per endpoint between all the threads, and closes it when its small
+    session cache overflows, so it isn't safe to use concurrently. With a session per thread, threads query the node
+    in parallel without any lock
+    """
+
+    def __init__(self, endpoint_uri: str, request_kwargs: Optional[Any] = None):
+        super().__init__(endpoint_uri, request_kwargs)
+        self._local = local()
+
+    def post(self, data: bytes) -> bytes:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        kwargs = dict(self.get_request_kwargs())
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        response = session.post(self.endpoint_uri, data=data, **kwargs)
+        response.raise_for_status()
+        return response.content
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return self.decode_rpc_response(self.post(self.encode_rpc_request(method, params)))
+
+
+class SerialWebsocketProvider(WebsocketProvider):
+    """
+    WebsocketProvider that sends one request at a time
+
+    Requests share a single connection, and each one expects the next message to be its response, so they must not
+    interleave. The wait is measured in the 'eth.ws_lock.*' metrics
+    """
+
+    def __init__(self, endpoint_uri: str, **kwargs):
+        super().__init__(endpoint_uri, **kwargs)
+        self.lock = InstrumentedLock('eth.ws_lock')
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        with self.lock:
+            return super().make_request(method, params)
+
+
+def make_provider(endpoint: str) -> BaseProvider:
+    """ Thread safe provider for @endpoint. IPCProvider already serializes its requests itself """
+    if endpoint.startswith('http'):  # HTTP
+        return SessionHTTPProvider(endpoint)
+    if endpoint.startswith('ws'):  # WebSocket
+        return SerialWebsocketProvider(endpoint)
+    return IPCProvider(endpoint)
+
+
+def send_batch(provider: BaseProvider, request: List[Dict]) -> List[RPCResponse]:
+    """
+    Sends a JSON-RPC batch @request, and returns the responses in request order
+
+    HTTP providers get a single POST, providers that don't support batches (WebSocket, IPC) get the calls one after
+    the other
+    """
+    if isinstance(provider, SessionHTTPProvider):
+        return sorted(json.loads(provider.post(json.dumps(request).encode())), key=lambda response: response['id'])
+    if isinstance(provider, HTTPProvider):
+        raw_response = make_post_request(provider.endpoint_uri, json.dumps(request).encode(),
+                                         **dict(provider.get_request_kwargs()))
+        return sorted(json.loads(raw_response), key=lambda response: response['id'])
+    return [provider.make_request(RPCEndpoint(call['method']), call['params']) for call in request]
+
+
+class Endpoint:
+    """ A single node of the pool, with its health and latency statistics """
+
+    def __init__(self, uri: str, provider: BaseProvider):
+        self.uri = uri
+        self.provider = provider
+        self.latency = 0.0
+        self.failures = 0
+        self.retry_at = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return monotonic() >= self.retry_at
+
+    def succeeded(self, latency: float):
+        self.latency = latency if self.latency == 0 else LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * self.latency
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def failed(self):
+        self.failures += 1
+        self.retry_at = monotonic() + min(RETRY_INTERVAL * 2 ** (self.failures - 1), RETRY_INTERVAL_MAX)
+
+    def set_aside(self):
+        """ Skips the endpoint for a while, without counting a failure """
+        self.retry_at = max(self.retry_at, monotonic() + RETRY_INTERVAL)
+
+
+class ProviderPool(BaseProvider):
+    """
+    web3 provider that spreads the requests over several Ethereum nodes
+
+    Reads go to the healthy node with the lowest latency (exponentially weighted moving average), and fail over to
+    the next nodes if it doesn't answer. A node that failed is skipped for a while, with exponential backoff.
+    With 'hedge_after' set, a read that didn't get an answer after that many seconds is sent to the next node too,
+    and the first answer wins.
+    Writes (see STICKY_METHODS) always go to the same node, and only move to another node when it fails.
+    Only transport errors count as failures: JSON-RPC error responses, and timeouts of queries that were too large
+    (see QUERY_METHODS), are returned to the caller as they are
+    """
+
+    def __init__(self, endpoints: List[str], hedge_after: Optional[float] = None,
+                 provider_factory: Callable[[str], BaseProvider] = make_provider):
+        super().__init__()
+        if not endpoints:
+            raise ValueError("ProviderPool requires at least one endpoint")
+        self.endpoints = [Endpoint(uri, provider_factory(uri)) for uri in endpoints]
+        self.hedge_after = hedge_after
+        self.sticky: Endpoint = self.endpoints[0]
+        self.lock = Lock()
+        self._executor = ThreadPoolExecutor(thread_name_prefix='ProviderPool') if hedge_after else None
+        self.logger = get_logger(logger_name='ProviderPool')
+        # the endpoint that answered the last request of each thread
+        self._local = local()
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method in STICKY_METHODS:
+            return self._send_sticky(lambda provider: provider.make_request(method, params))
+        return self._send(lambda provider: provider.make_request(method, params), query=method in QUERY_METHODS)
+
+    def make_batch_request(self, request: List[Dict]) -> List[RPCResponse]:
+        """ Sends a JSON-RPC batch (see send_batch) to a single node """
+        if any(call['method'] in STICKY_METHODS for call in request):
+            return self._send_sticky(lambda provider: send_batch(provider, request))
+        return self._send(lambda provider: send_batch(provider, request),
+                          query=any(call['method'] in QUERY_METHODS for call in request))
+
+    def set_aside_last(self):
+        """ Skips the node that answered the calling thread's last request for a while, e.g. because it is behind """
+        endpoint: Optional[Endpoint] = getattr(self._local, 'endpoint', None)
+        if endpoint is not None:
+            with self.lock:
+                endpoint.set_aside()
+
+    def isConnected(self) -> bool:
+        return any(endpoint.provider.isConnected() for endpoint in self.endpoints)
+
+    def ranked(self) -> List[Endpoint]:
+        """ The endpoints by order of preference - healthy ones first, then by latency """
+        with self.lock:
+            return sorted(self.endpoints, key=lambda endpoint: (not endpoint.healthy, endpoint.latency))
+
+    def _send_sticky(self, send: Callable[[BaseProvider], Any]) -> Any:
+        with self.lock:
+            sticky = self.sticky
+        others = [endpoint for endpoint in self.ranked() if endpoint is not sticky]
+        return self._send(send, [sticky] + others, sticky=True)
+
+    def _send(self, send: Callable[[BaseProvider], Any], endpoints: List[Endpoint] = None, sticky: bool = False,
+              query: bool = False) -> Any:
+        """
+        Sends to the first of @endpoints that answers. Writes are never hedged, and move the sticky node
+
+        :param query: the request includes a QUERY_METHODS call
+        """
+        endpoints = endpoints or self.ranked()
+        if not sticky and self._executor and len(endpoints) > 1:
+            return self._send_hedged(send, endpoints, query)
+
+        error = None
+        for endpoint in endpoints:
+            try:
+                result = self._timed(endpoint, send, query)
+            except ENDPOINT_ERRORS as e:
+                if query and isinstance(e, QUERY_TIMEOUTS):
+                    raise
+                error = e
+                continue
+            self._local.endpoint = endpoint
+            if sticky:
+                with self.lock:
+                    self.sticky = endpoint
+            return result
+        raise error
+
+    def _send_hedged(self, send: Callable[[BaseProvider], Any], endpoints: List[Endpoint], query: bool) -> Any:
+        candidates = iter(endpoints)
+        pending = {}
+        error = None
+
+        def launch() -> bool:
+            endpoint = next(candidates, None)
+            if endpoint is not None:
+                pending[self._executor.submit(self._timed, endpoint, send, query)] = endpoint
+            return endpoint is not None
+
+        exhausted = not launch()
+        while pending:
+            done, _ = wait(pending, timeout=None if exhausted else self.hedge_after, return_when=FIRST_COMPLETED)
+            if not done:
+                metrics.counter('eth.pool.hedged').inc()
+                exhausted = not launch()
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    result = future.result()
+                except ENDPOINT_ERRORS as e:
+                    if query and isinstance(e, QUERY_TIMEOUTS):
+                        raise
+                    error = e
+                    exhausted = not launch()
+                    continue
+                self._local.endpoint = endpoint
+                return result
+        raise error
+
+    def _timed(self, endpoint: Endpoint, send: Callable[[BaseProvider], Any], query: bool = False) -> Any:
+        start = monotonic()
+        try:
+            result = send(endpoint.provider)
+        except ENDPOINT_ERRORS as e:
+            if query and isinstance(e, QUERY_TIMEOUTS):
+                raise
+            with self.lock:
+                endpoint.failed()
+            metrics.counter('eth.pool.failures').inc()
+            self.logger.warning(f"Request to {endpoint.uri} failed: {e}")
+            raise
+        with self.lock:
+            endpoint.succeeded(monotonic() - start)
+        return result
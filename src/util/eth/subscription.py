@@ -0,0 +1,160 @@
+import asyncio
+import json
+from itertools import count
+from threading import Thread, Event, Condition
+from typing import Callable, List, Optional
+
+import websockets
+from hexbytes import HexBytes
+
+from src.util.logger import get_logger
+
+RECONNECT_INTERVAL = 5
+# how often a blocked receive wakes up to check if the subscription was stopped
+RECEIVE_TIMEOUT = 1
+
+
+class _IPCConnection:
+    """Minimal message connection over a node's IPC socket, which streams JSON objects without framing"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.buffer = ''
+        self.decoder = json.JSONDecoder()
+
+    @classmethod
+    async def open(cls, path: str) -> '_IPCConnection':
+        reader, writer = await asyncio.open_unix_connection(path)
+        return cls(reader, writer)
+
+    async def send(self, message: str):
+        self.writer.write(message.encode())
+        await self.writer.drain()
+
+    async def recv(self) -> str:
+        while True:
+            self.buffer = self.buffer.lstrip()
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer)
+                self.buffer = self.buffer[end:]
+                return json.dumps(obj)
+            except json.JSONDecodeError:
+                chunk = await self.reader.read(4096)
+                if not chunk:
+                    raise ConnectionError("IPC connection closed")
+                self.buffer += chunk.decode()
+
+    async def close(self):
+        self.writer.close()
+
+
+class Subscription(Thread):
+    """
+    Keeps an eth_subscribe subscription open on a WebSocket or IPC node, and hands each notification to the callbacks
+
+    Runs its own asyncio loop. When the connection drops it reconnects every 'reconnect_interval' seconds - while
+    'connected' is not set users are expected to fall back to polling the node
+    """
+    _ids = count(0)
+
+    def __init__(self, endpoint: str, params: List, reconnect_interval: float = RECONNECT_INTERVAL):
+        self.endpoint = endpoint
+        self.params = params
+        self.reconnect_interval = reconnect_interval
+        self.callbacks: List[Callable[[dict], None]] = []
+        self.connected = Event()
+        # notified on every notification and on disconnection
+        self.state_changed = Condition()
+        self.stop_event = Event()
+        self.logger = get_logger(logger_name=f"{self.__class__.__name__}-{next(self._ids)}")
+        super().__init__(group=None, name=f"Subscription-{params[0]}", target=self.run, daemon=True)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                await self._subscribe()
+            except (OSError, ValueError, KeyError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                self.logger.warning(f"Subscription to {self.params[0]} on {self.endpoint} dropped: {e}")
+            self._set_disconnected()
+            if not self.stop_event.is_set():
+                await asyncio.sleep(self.reconnect_interval)
+
+    async def _connect(self):
+        if self.endpoint.startswith('ws'):
+            return await websockets.connect(self.endpoint)
+        return await _IPCConnection.open(self.endpoint)
+
+    async def _subscribe(self):
+        connection = await self._connect()
+        try:
+            await connection.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe',
+                                              'params': self.params}))
+            response = json.loads(await connection.recv())
+            if 'error' in response:
+                raise ValueError(response['error'])
+            subscription_id = response['result']
+            self.logger.info(f"Subscribed to {self.params[0]} on {self.endpoint}")
+            self.connected.set()
+
+            while not self.stop_event.is_set():
+                try:
+                    message = json.loads(await asyncio.wait_for(connection.recv(), RECEIVE_TIMEOUT))
+                except asyncio.TimeoutError:
+                    continue
+                params = message.get('params', {})
+                if message.get('method') == 'eth_subscription' and params.get('subscription') == subscription_id:
+                    self._notify(params['result'])
+        finally:
+            await connection.close()
+
+    def _notify(self, result: dict):
+        for callback in self.callbacks:
+            callback(result)
+        with self.state_changed:
+            self.state_changed.notify_all()
+
+    def _set_disconnected(self):
+        self.connected.clear()
+        with self.state_changed:
+            self.state_changed.notify_all()
+
+
+class NewHeadsSubscription(Subscription):
+    """Subscription to new block headers, that keeps track of the chain head"""
+
+    def __init__(self, endpoint: str, **kwargs):
+        super().__init__(endpoint, ['newHeads'], **kwargs)
+        self.head: Optional[int] = None
+        self.head_hash: Optional[bytes] = None
+        self.callbacks.append(self._on_head)
+
+    def _on_head(self, header: dict):
+        with self.state_changed:
+            self.head = int(header['number'], 16)
+            self.head_hash = HexBytes(header['hash'])
+
+    def hash_of(self, number: int) -> Optional[bytes]:
+        """ The hash of the latest head received, if it is block @number """
+        with self.state_changed:
+            return self.head_hash if self.head == number else None
+
+    def wait_for_head(self, after: Optional[int], timeout: float) -> Optional[int]:
+        """
+        Blocks until a head other than @after is received - higher, or lower after a reorg - the connection drops,
+        or @timeout seconds pass
+
+        :return: the latest head received, or None if no head was received yet
+        """
+        with self.state_changed:
+            self.state_changed.wait_for(
+                lambda: not self.connected.is_set() or (self.head is not None and self.head != after),
+                timeout
+            )
+            return self.head
@@ -0,0 +1,158 @@
+import json
+from bisect import bisect_left
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Dict, Tuple, Union
+
+from src.util.config import Config
+from src.util.logger import get_logger
+
+# upper bounds (seconds) of the default histogram buckets - 1ms to ~65s, doubling
+LATENCY_BUCKETS = tuple(0.001 * 2 ** i for i in range(17))
+# seconds between two snapshots logged by MetricsReporter
+REPORT_INTERVAL = 60
+
+
+class Counter:
+    """Thread safe monotonic counter"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._value = 0
+        self._lock = Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Histogram:
+    """Thread safe distribution of observed values (e.g. latencies), counted in fixed buckets"""
+
+    def __init__(self, name: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        # the last bucket counts the values above the highest bound
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def quantile(self, q: float) -> float:
+        """ Upper bound of the bucket holding the @q quantile (0 < q <= 1) - the maximum for the overflow bucket """
+        with self._lock:
+            rank = q * sum(self._counts)
+            seen = 0
+            for bound, count in zip(self.buckets, self._counts):
+                seen += count
+                if count and seen >= rank:
+                    return bound
+            return self._max
+
+    @property
+    def value(self) -> Dict[str, float]:
+        with self._lock:
+            count = sum(self._counts)
+            mean = self._sum / count if count else 0.0
+            max_ = self._max
+        return {'count': count, 'mean': mean, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99), 'max': max_}
+
+
+class InstrumentedLock:
+    """
+    Lock that records how long its callers waited for it, in the '<name>.wait' histogram, and how many of them had to
+    wait at all, in the '<name>.contended' counter
+    """
+
+    def __init__(self, name: str):
+        self._lock = Lock()
+        self._wait = metrics.histogram(f'{name}.wait')
+        self._contended = metrics.counter(f'{name}.contended')
+
+    def acquire(self) -> bool:
+        if self._lock.acquire(blocking=False):
+            self._wait.observe(0.0)
+            return True
+        self._contended.inc()
+        start = monotonic()
+        self._lock.acquire()
+        self._wait.observe(monotonic() - start)
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class Metrics:
+    """Process wide registry of named metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Histogram]] = {}
+        self._lock = Lock()
+
+    def counter(self, name: str) -> Counter:
+        """ Returns the counter called @name, creating it on first use """
+        return self._get(name, Counter)
+
+    def histogram(self, name: str) -> Histogram:
+        """ Returns the histogram called @name, creating it on first use """
+        return self._get(name, Histogram)
+
+    def _get(self, name: str, kind):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = kind(name)
+            return self._metrics[name]
+
+    def snapshot(self) -> Dict[str, Union[int, Dict[str, float]]]:
+        with self._lock:
+            return {name: metric.value for name, metric in self._metrics.items()}
+
+
+metrics = Metrics()
+
+
+class MetricsReporter(Thread):
+    """
+    Logs a snapshot of all the metrics, as one JSON line, every 'metrics_log_interval' seconds - and once more when
+    stopped. An interval of 0 turns it off
+    """
+
+    def __init__(self, config: Config, **kwargs):
+        self.interval = float(config.get('metrics_log_interval', REPORT_INTERVAL))
+        self.logger = get_logger(db_name=config.get('db_name', ''), logger_name='Metrics')
+        self.stop_event = Event()
+        super().__init__(group=None, name="MetricsReporter", target=self.run, daemon=True, **kwargs)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        if not self.interval:
+            return
+        while not self.stop_event.wait(self.interval):
+            self.report()
+        self.report()
+
+    def report(self):
+        self.logger.info(f"Metrics: {json.dumps(metrics.snapshot(), sort_keys=True)}")
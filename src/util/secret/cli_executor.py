@@ -0,0 +1,89 @@
+import subprocess
+from heapq import heappush, heappop
+from itertools import count
+from subprocess import PIPE, CalledProcessError, CompletedProcess, TimeoutExpired
+from threading import Condition
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from src.util.metrics import metrics
+
+MAX_CONCURRENT = 4
+# seconds
+CLI_TIMEOUT = 60
+
+# lanes - lower runs first
+PRIORITY_BROADCAST = 0
+PRIORITY_TX = 1
+PRIORITY_QUERY = 2
+
+
+def command_name(cmd: List[str]) -> str:
+    """ e.g. 'tx.broadcast' or 'query.compute' - used to name the latency histograms """
+    return '.'.join(cmd[1:3])
+
+
+def command_priority(cmd: List[str]) -> int:
+    """ Broadcasting and signing first, then building transactions, and queries last """
+    if any(word in ('broadcast', 'sign', 'multisign') for word in cmd[1:3]):
+        return PRIORITY_BROADCAST
+    if cmd[1:2] == ['tx']:
+        return PRIORITY_TX
+    return PRIORITY_QUERY
+
+
+class CliExecutor:
+    """
+    Runs secretcli commands with a bounded concurrency, by priority, and with a deadline
+
+    At most 'max_concurrent' processes run at once. Callers beyond that wait for a slot, and slots go to the highest
+    priority lane first (see command_priority), then in arrival order.
+    A process still running after its timeout is killed, and the call fails with CalledProcessError like a failed
+    command does.
+    Time spent waiting for a slot is recorded in the 'secretcli.wait' histogram, and the run time of each command in
+    'secretcli.<command name>'
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, timeout: float = CLI_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self._running = 0
+        self._waiting: List[Tuple[int, int]] = []
+        self._tickets = count()
+        self._slots = Condition()
+
+    def run(self, cmd: List[str], priority: Optional[int] = None, timeout: Optional[float] = None,
+            input_: Optional[bytes] = None) -> CompletedProcess:
+        """
+        :raises CalledProcessError: if the command failed or timed out
+        """
+        self._acquire(command_priority(cmd) if priority is None else priority)
+        timeout = timeout or self.timeout
+        start = monotonic()
+        try:
+            return subprocess.run(cmd, stdout=PIPE, stderr=PIPE, input=input_, check=True, timeout=timeout)
+        except TimeoutExpired as e:
+            # subprocess.run already killed the process
+            metrics.counter('secretcli.timeouts').inc()
+            stderr = (e.stderr or b'') + f'secretcli timed out after {timeout} seconds'.encode()
+            raise CalledProcessError(-9, cmd, e.output or b'', stderr) from None
+        finally:
+            metrics.histogram(f'secretcli.{command_name(cmd)}').observe(monotonic() - start)
+            self._release()
+
+    def _acquire(self, priority: int):
+        start = monotonic()
+        with self._slots:
+            ticket = (priority, next(self._tickets))
+            heappush(self._waiting, ticket)
+            self._slots.wait_for(lambda: self._running < self.max_concurrent and self._waiting[0] == ticket)
+            heappop(self._waiting)
+            self._running += 1
+            # the next waiter may get a slot too
+            self._slots.notify_all()
+        metrics.histogram('secretcli.wait').observe(monotonic() - start)
+
+    def _release(self):
+        with self._slots:
+            self._running -= 1
+            self._slots.notify_all()
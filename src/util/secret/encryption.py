@@ -0,0 +1,90 @@
+import base64
+import json
+import os
+from typing import Dict, Optional
+
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.DH import import_x25519_private_key, import_x25519_public_key, key_agreement
+from Crypto.Protocol.KDF import HKDF
+
+# salt of the key derivation of the Secret Network enclave
+HKDF_SALT = bytes.fromhex('000000000000000000024bead8df69990852c202db0e0097c1a12ea637d7e96d')
+NONCE_SIZE = 32
+KEY_SIZE = 32
+
+EXECUTE_GAS = 200000
+
+
+class SecretEncryption:
+    """
+    Encrypts contract messages for the enclave of the Secret Network, and decrypts them - like secretcli does
+
+    The key of each message is derived from the x25519 shared secret of the transaction key ('id_tx_io.json') and
+    the network's consensus IO key, and a random nonce. Messages are sealed with AES-SIV, and sent as
+    nonce || our public key || ciphertext, so the enclave can derive the same key
+    """
+
+    def __init__(self, tx_key: bytes, consensus_io_pubkey: bytes):
+        self._private_key = import_x25519_private_key(tx_key)
+        self.public_key = self._private_key.public_key().export_key(format='raw')
+        self._shared_secret = key_agreement(static_priv=self._private_key,
+                                            static_pub=import_x25519_public_key(consensus_io_pubkey),
+                                            kdf=lambda secret: secret)
+
+    def key(self, nonce: bytes) -> bytes:
+        return HKDF(self._shared_secret + nonce, KEY_SIZE, HKDF_SALT, SHA256)
+
+    def encrypt(self, code_hash: str, msg: str, nonce: Optional[bytes] = None) -> bytes:
+        """ Encrypts the message of a contract with code hash @code_hash (hex) """
+        nonce = nonce or os.urandom(NONCE_SIZE)
+        # the code hash is sent as lowercase hex, before the message
+        plaintext = code_hash.lower().encode() + msg.encode()
+        return nonce + self.public_key + seal(self.key(nonce), plaintext)
+
+    def decrypt(self, encrypted: bytes) -> bytes:
+        """ Decrypts a message we encrypted. Returns the code hash followed by the message """
+        nonce, ciphertext = encrypted[:NONCE_SIZE], encrypted[NONCE_SIZE + len(self.public_key):]
+        return self.decrypt_output(ciphertext, nonce)
+
+    def decrypt_output(self, ciphertext: bytes, nonce: bytes) -> bytes:
+        """ Decrypts the output of a contract - encrypted with the nonce of the message that produced it """
+        return open_sealed(self.key(nonce), ciphertext)
+
+
+def seal(key: bytes, plaintext: bytes) -> bytes:
+    """ AES-SIV, with a single empty associated data, as the enclave uses. Returns the tag followed by the ciphertext """
+    cipher = AES.new(key, AES.MODE_SIV)
+    cipher.update(b'')
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+    return tag + ciphertext
+
+
+def open_sealed(key: bytes, sealed: bytes) -> bytes:
+    """ :raises ValueError: if @sealed wasn't sealed with @key """
+    cipher = AES.new(key, AES.MODE_SIV)
+    cipher.update(b'')
+    return cipher.decrypt_and_verify(sealed[16:], sealed[:16])
+
+
+def load_tx_key(path: str) -> bytes:
+    """ The private key of secretcli's transaction key file, id_tx_io.json """
+    with open(path) as f:
+        return bytes.fromhex(json.load(f)['private'])
+
+
+def execute_contract_tx(sender: str, contract: str, encrypted_msg: bytes, gas: int = EXECUTE_GAS) -> Dict:
+    """ An unsigned MsgExecuteContract tx, as 'secretcli tx compute execute --generate-only' prints it """
+    return {'type': 'cosmos-sdk/StdTx', 'value': {
+        'msg': [{'type': 'wasm/MsgExecuteContract', 'value': {
+            'sender': sender,
+            'contract': contract,
+            'msg': base64.b64encode(encrypted_msg).decode(),
+            'callback_code_hash': '',
+            'sent_funds': [],
+            'callback_sig': None,
+        }}],
+        'fee': {'amount': [], 'gas': str(gas)},
+        'signatures': None,
+        'memo': '',
+    }}
@@ -0,0 +1,102 @@
+import base64
+from dataclasses import dataclass
+from threading import local
+from time import monotonic
+from typing import Dict, List, Optional
+
+import requests
+
+from src.util.metrics import metrics
+
+# seconds
+LCD_TIMEOUT = 10
+
+
+@dataclass
+class Coin:
+    denom: str
+    amount: int
+
+
+@dataclass
+class Account:
+    address: str
+    account_number: int
+    sequence: int
+    coins: List[Coin]
+
+    @classmethod
+    def from_json(cls, raw: Dict) -> 'Account':
+        """ :param raw: the account as returned by the node ({'type': ..., 'value': ...}), or 'secretcli query account' """
+        value = raw['value']
+        return cls(address=value['address'], account_number=int(value.get('account_number', 0)),
+                   sequence=int(value.get('sequence', 0)),
+                   coins=[Coin(coin['denom'], int(coin['amount'])) for coin in value.get('coins') or []])
+
+    def balance(self, denom: str) -> int:
+        return sum(coin.amount for coin in self.coins if coin.denom == denom)
+
+
+@dataclass
+class TxResponse:
+    txhash: str
+    height: int
+    code: int
+    raw_log: str
+
+    @classmethod
+    def from_json(cls, raw: Dict) -> 'TxResponse':
+        """ :param raw: the response as returned by the node, or 'secretcli query tx' """
+        return cls(txhash=raw.get('txhash', ''), height=int(raw.get('height', 0)), code=int(raw.get('code', 0)),
+                   raw_log=raw.get('raw_log', ''))
+
+    @property
+    def succeeded(self) -> bool:
+        return self.code == 0
+
+
+class LcdClient:
+    """
+    HTTP client for the REST server (LCD) of a Secret Network node
+
+    Covers the queries that don't need the enclave's encryption - accounts and transactions. Each thread keeps its
+    own pooled session. Failed requests raise RuntimeError, like the secretcli calls they replace, and latencies are
+    recorded in the 'secret.lcd.latency' histogram
+    """
+
+    def __init__(self, url: str, timeout: float = LCD_TIMEOUT):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._local = local()
+
+    def account(self, address: str) -> Account:
+        return Account.from_json(self.get(f'/auth/accounts/{address}'))
+
+    def tx(self, tx_hash: str) -> TxResponse:
+        return TxResponse.from_json(self.get(f'/txs/{tx_hash}'))
+
+    def consensus_io_pubkey(self) -> bytes:
+        """ The network's key for encrypting contract messages """
+        return base64.b64decode(self.get('/reg/consensus-io-exch-pubkey')['ioExchPubkey'])
+
+    def get(self, path: str) -> Dict:
+        """ GETs @path, and returns its result - unwrapped from the {'height', 'result'} envelope if there is one """
+        start = monotonic()
+        try:
+            response = self._session().get(f'{self.url}{path}', timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise RuntimeError(f"LCD request {path} failed: {e}") from None
+        finally:
+            metrics.histogram('secret.lcd.latency').observe(monotonic() - start)
+
+        if isinstance(body, dict) and 'result' in body and 'height' in body:
+            return body['result']
+        return body
+
+    def _session(self) -> requests.Session:
+        session: Optional[requests.Session] = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
@@ -0,0 +1,176 @@
+import base64
+import json
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Dict, List, Tuple, Union
+
+from Crypto.Hash import RIPEMD160
+from ecdsa import BadSignatureError, SECP256k1, VerifyingKey
+from ecdsa.util import sigdecode_string
+
+from src.util.secret.signing import PUBKEY_TYPE, std_sign_bytes
+
+MULTISIG_PUBKEY_TYPE = 'tendermint/PubKeyMultisigThreshold'
+
+# amino prefix of a PubKeySecp256k1, followed by the length of the key
+_SECP256K1_AMINO_PREFIX = bytes.fromhex('eb5ae987') + b'\x21'
+
+_BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+_BECH32_GENERATOR = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+
+
+def _polymod(values: List[int]) -> int:
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ value
+        for i, gen in enumerate(_BECH32_GENERATOR):
+            chk ^= gen if (top >> i) & 1 else 0
+    return chk
+
+
+def _hrp_expand(hrp: str) -> List[int]:
+    return [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+
+
+def _convert_bits(data: bytes, from_bits: int, to_bits: int, pad: bool) -> bytes:
+    acc, bits, res = 0, 0, []
+    max_value = (1 << to_bits) - 1
+    for value in data:
+        acc = (acc << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            res.append((acc >> bits) & max_value)
+    if pad and bits:
+        res.append((acc << (to_bits - bits)) & max_value)
+    elif not pad and (bits >= from_bits or (acc << (to_bits - bits)) & max_value):
+        raise ValueError("Invalid padding")
+    return bytes(res)
+
+
+def bech32_decode(bech: str) -> Tuple[str, bytes]:
+    """ Returns the human readable part and the data of a bech32 string, e.g. 'secretpub1...' """
+    bech = bech.lower()
+    pos = bech.rfind('1')
+    if pos < 1 or pos + 7 > len(bech) or any(c not in _BECH32_CHARSET for c in bech[pos + 1:]):
+        raise ValueError(f"Invalid bech32 string {bech}")
+    hrp, data = bech[:pos], [_BECH32_CHARSET.find(c) for c in bech[pos + 1:]]
+    if _polymod(_hrp_expand(hrp) + data) != 1:
+        raise ValueError(f"Invalid bech32 checksum {bech}")
+    return hrp, _convert_bits(bytes(data[:-6]), 5, 8, pad=False)
+
+
+def bech32_encode(hrp: str, data: bytes) -> str:
+    values = list(_convert_bits(data, 8, 5, pad=True))
+    polymod = _polymod(_hrp_expand(hrp) + values + [0] * 6) ^ 1
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(_BECH32_CHARSET[d] for d in values + checksum)
+
+
+def pubkey_from_bech32(bech: str) -> bytes:
+    """ The compressed secp256k1 key of a 'secretpub1...' key """
+    _, data = bech32_decode(bech)
+    if not data.startswith(_SECP256K1_AMINO_PREFIX) or len(data) != len(_SECP256K1_AMINO_PREFIX) + 33:
+        raise ValueError(f"{bech} isn't a secp256k1 public key")
+    return data[len(_SECP256K1_AMINO_PREFIX):]
+
+
+def pubkey_address(pubkey: bytes) -> bytes:
+    return RIPEMD160.new(sha256(pubkey).digest()).digest()
+
+
+def _uvarint(n: int) -> bytes:
+    res = b''
+    while n >= 0x80:
+        res += bytes([n & 0x7f | 0x80])
+        n >>= 7
+    return res + bytes([n])
+
+
+def _field(number: int, data: bytes) -> bytes:
+    """ a length prefixed amino (protobuf) field """
+    return _uvarint(number << 3 | 2) + _uvarint(len(data)) + data
+
+
+def compact_bit_array(size: int, indexes: List[int]) -> bytes:
+    """ The amino encoding of a CompactBitArray of @size bits, with the bits of @indexes set """
+    elems = bytearray((size + 7) // 8)
+    for i in indexes:
+        elems[i >> 3] |= 1 << (7 - i % 8)
+    extra_bits = size % 8
+    # amino omits fields with default values
+    res = _uvarint(1 << 3) + _uvarint(extra_bits) if extra_bits else b''
+    return res + (_field(2, bytes(elems)) if elems else b'')
+
+
+def multisignature(size: int, signatures: Dict[int, bytes]) -> bytes:
+    """ The amino encoding of a Multisignature, from the signatures of the keys at each index """
+    res = _field(1, compact_bit_array(size, list(signatures)))
+    for i in sorted(signatures):
+        res += _field(2, signatures[i])
+    return res
+
+
+@dataclass
+class MultisigKey:
+    """ A threshold multisig key, with its keys in the order secretcli uses - sorted by address """
+    threshold: int
+    pubkeys: List[bytes]
+
+    def __post_init__(self):
+        self.pubkeys = sorted(self.pubkeys, key=pubkey_address)
+
+    @classmethod
+    def from_bech32(cls, threshold: int, pubkeys: Union[str, List[str]]) -> 'MultisigKey':
+        """ :param pubkeys: 'secretpub1...' keys, as a list or a comma separated string, like 'secret_signers' """
+        if isinstance(pubkeys, str):
+            pubkeys = pubkeys.replace(' ', '').split(',')
+        return cls(threshold, [pubkey_from_bech32(key) for key in pubkeys])
+
+    def to_json(self) -> Dict:
+        return {'type': MULTISIG_PUBKEY_TYPE, 'value': {
+            'threshold': str(self.threshold),
+            'pubkeys': [{'type': PUBKEY_TYPE, 'value': base64.b64encode(key).decode()} for key in self.pubkeys]
+        }}
+
+
+def _verified_signature(signed: str, multisig: MultisigKey, sign_bytes: bytes) -> Tuple[int, bytes]:
+    """ Returns the index of the key that signed, and the signature """
+    signature = json.loads(signed)
+    pubkey = base64.b64decode(signature['pub_key']['value'])
+    if pubkey not in multisig.pubkeys:
+        raise RuntimeError(f"Signature of a key that isn't part of the multisig: {signature['pub_key']['value']}")
+
+    sig = base64.b64decode(signature['signature'])
+    try:
+        VerifyingKey.from_string(pubkey, curve=SECP256k1).verify(sig, sign_bytes, hashfunc=sha256,
+                                                                 sigdecode=sigdecode_string)
+    except BadSignatureError:
+        raise RuntimeError(f"Couldn't verify signature of {signature['pub_key']['value']}") from None
+    return multisig.pubkeys.index(pubkey), sig
+
+
+def multisign(unsigned_tx: str, multisig: MultisigKey, signatures: List[str], chain_id: str, account_number: int,
+              sequence: int) -> str:
+    """
+    Combines signatures into the signed tx, as 'secretcli tx multisign' does
+
+    :param signatures: as 'secretcli tx sign --signature-only' prints them (see Signatures.signed_tx)
+    :raises RuntimeError: if a signature is invalid, or there aren't enough of them
+    """
+    try:
+        tx = json.loads(unsigned_tx)
+        sign_bytes = std_sign_bytes(tx, chain_id, account_number, sequence)
+        signed = dict(_verified_signature(signature, multisig, sign_bytes) for signature in signatures)
+    except (ValueError, KeyError, TypeError) as e:
+        raise RuntimeError(f"Failed to read transaction or signatures: {e}") from None
+
+    if len(signed) < multisig.threshold:
+        raise RuntimeError(f"Not enough signatures: {len(signed)} of {multisig.threshold} required")
+
+    tx['value']['signatures'] = [{
+        'pub_key': multisig.to_json(),
+        'signature': base64.b64encode(multisignature(len(multisig.pubkeys), signed)).decode(),
+    }]
+    return json.dumps(tx, indent=2)
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from src.db.collections.secret_sequence import SecretSequence
+from src.util.metrics import metrics
+from src.util.secretcli import account_info
+
+# seconds - gaps reported this soon after a resync are most likely caused by the txs that triggered it
+RESYNC_COOLDOWN = 7
+
+
+class SequenceAllocator:
+    """
+    Allocates the sequence numbers of a Secret account's transactions
+
+    The next sequence is kept in the db, and reserved atomically, so concurrent handlers - and processes - never get
+    the same number. The chain is only queried the first time, and when a gap is reported: a tx that won't make it
+    on-chain, so that the ones after it can't either. A burst of failures caused by one gap resyncs once.
+    Reservations, releases, gaps and resyncs are counted in the 'secret.sequence.*' metrics
+    """
+
+    def __init__(self, address: str, resync_cooldown: float = RESYNC_COOLDOWN):
+        self.address = address
+        self.resync_cooldown = timedelta(seconds=resync_cooldown)
+        doc = SecretSequence.get(address)
+        if doc is None:
+            self.resync()
+            doc = SecretSequence.get(address)
+        self.account_number = doc.account_number
+
+    def reserve(self) -> int:
+        metrics.counter('secret.sequence.reserved').inc()
+        return SecretSequence.reserve(self.address)
+
+    def release(self, sequence: int):
+        """ Gives back a reserved sequence that won't be used - if later ones were reserved since, it's a gap """
+        if SecretSequence.release(self.address, sequence):
+            metrics.counter('secret.sequence.released').inc()
+        else:
+            self.gap()
+
+    def gap(self):
+        """ Reports a tx that failed, or was never included - resyncs, unless just did """
+        metrics.counter('secret.sequence.gaps').inc()
+        doc = SecretSequence.get(self.address)
+        if doc is None or datetime.utcnow() - doc.resynced_on >= self.resync_cooldown:
+            self.resync()
+
+    def resync(self):
+        """ Continues from the account's sequence on-chain """
+        metrics.counter('secret.sequence.resyncs').inc()
+        details = account_info(self.address)
+        self.account_number = details.account_number
+        SecretSequence.sync(self.address, self.account_number, details.sequence)
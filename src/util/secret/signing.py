@@ -0,0 +1,136 @@
+import base64
+import json
+from hashlib import sha256
+from typing import Dict, Optional, Union
+
+from ecdsa import SECP256k1, SigningKey
+from ecdsa.util import sigencode_string_canonize
+
+from src.util.crypto_store.crypto_manager import CryptoManagerBase
+
+PUBKEY_TYPE = 'tendermint/PubKeySecp256k1'
+
+# Go's encoding/json escapes these, even in strings - the sign bytes must match what the node computes
+_GO_ESCAPES = {'<': '\\u003c', '>': '\\u003e', '&': '\\u0026', '\u2028': '\\u2028', '\u2029': '\\u2029'}
+
+
+def canonical_json(obj) -> bytes:
+    """ JSON with sorted keys, no whitespace and Go's escaping - like the Cosmos SDK's MustSortJSON """
+    res = json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    for char, escaped in _GO_ESCAPES.items():
+        res = res.replace(char, escaped)
+    return res.encode()
+
+
+def std_sign_bytes(unsigned_tx: Union[str, Dict], chain_id: str, account_number: int, sequence: int) -> bytes:
+    """
+    The bytes signed for a StdTx - its StdSignDoc
+
+    :param unsigned_tx: the transaction generated by 'secretcli tx ... --generate-only'
+    """
+    if isinstance(unsigned_tx, str):
+        unsigned_tx = json.loads(unsigned_tx)
+    value = unsigned_tx['value']
+
+    fee = dict(value['fee'])
+    # an empty fee amount is signed as [], never null
+    fee['amount'] = fee.get('amount') or []
+
+    return canonical_json({
+        'account_number': str(account_number),
+        'chain_id': chain_id,
+        'fee': fee,
+        'memo': value.get('memo', ''),
+        'msgs': value['msg'],
+        'sequence': str(sequence),
+    })
+
+
+def compress_public_key(public_key: bytes) -> bytes:
+    """
+    Compresses a 64 byte (x || y) or 65 byte (0x04 || x || y) secp256k1 public key to 33 bytes
+
+    :raises ValueError: if @public_key isn't a compressed, raw or uncompressed key
+    """
+    if len(public_key) == 33 and public_key[0] in (2, 3):
+        return public_key
+    if len(public_key) == 65 and public_key[0] == 4:
+        public_key = public_key[1:]
+    if len(public_key) != 64:
+        raise ValueError(f"Invalid secp256k1 public key of {len(public_key)} bytes")
+    prefix = b'\x03' if public_key[-1] & 1 else b'\x02'
+    return prefix + public_key[:32]
+
+
+class SecretKey:
+    """ A secp256k1 key that signs the sha256 of transactions for the Secret Network """
+
+    @property
+    def public_key(self) -> bytes:
+        """ compressed, 33 bytes """
+        raise NotImplementedError
+
+    def sign_digest(self, digest: bytes) -> bytes:
+        """ Returns the 64 byte r || s signature of @digest, with a low s """
+        raise NotImplementedError
+
+
+class LocalSecretKey(SecretKey):
+    def __init__(self, private_key: bytes):
+        self._key = SigningKey.from_string(private_key, curve=SECP256k1)
+
+    @property
+    def public_key(self) -> bytes:
+        return self._key.verifying_key.to_string('compressed')
+
+    def sign_digest(self, digest: bytes) -> bytes:
+        # deterministic (RFC 6979) like the Tendermint signer
+        return self._key.sign_digest_deterministic(digest, hashfunc=sha256, sigencode=sigencode_string_canonize)
+
+
+class CryptoStoreSecretKey(SecretKey):
+    """ Signs through a crypto store - e.g. a key kept in an HSM """
+
+    def __init__(self, store: CryptoManagerBase, public_key: bytes = b''):
+        self.store = store
+        public_key = public_key or getattr(store, 'public_key', b'')
+        if not public_key:
+            raise ValueError("The public key of the crypto store's key is required")
+        self._public_key = compress_public_key(public_key)
+
+    @property
+    def public_key(self) -> bytes:
+        return self._public_key
+
+    def sign_digest(self, digest: bytes) -> bytes:
+        r, s, _ = self.store.sign(digest.hex())
+        order = SECP256k1.order
+        s = min(s, order - s)
+        return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+
+def secret_key_from_config(config) -> Optional[SecretKey]:
+    """ The key set in 'secret_signer_private_key' (hex), or None if there isn't one """
+    private_key = config.get('secret_signer_private_key', '')
+    if not private_key:
+        return None
+    return LocalSecretKey(bytes.fromhex(private_key[2:] if private_key.startswith('0x') else private_key))
+
+
+def sign_tx(unsigned_tx: Union[str, Dict], key: SecretKey, chain_id: str, account_number: int,
+            sequence: int) -> str:
+    """
+    Signs a transaction, and returns the signature as 'secretcli tx sign --signature-only' prints it
+
+    :raises RuntimeError: if the transaction is malformed
+    """
+    try:
+        sign_bytes = std_sign_bytes(unsigned_tx, chain_id, account_number, sequence)
+    except (ValueError, KeyError, TypeError) as e:
+        raise RuntimeError(f"Failed to build the sign bytes of the transaction: {e}") from None
+
+    signature = key.sign_digest(sha256(sign_bytes).digest())
+    return json.dumps({
+        'pub_key': {'type': PUBKEY_TYPE, 'value': base64.b64encode(key.public_key).decode()},
+        'signature': base64.b64encode(signature).decode(),
+    }, indent=2)
@@ -1,16 +1,70 @@
 import os
+import re
 import json
+import base64
 import subprocess
+from functools import lru_cache
 from shutil import copyfile
-from subprocess import PIPE, run as subprocess_run
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 from src.contracts.secret.secret_contract import swap_json
 from src.util.config import Config
 from src.util.logger import get_logger
+from src.util.secret.cli_executor import CliExecutor, CLI_TIMEOUT, MAX_CONCURRENT
+from src.util.secret.encryption import SecretEncryption, execute_contract_tx, load_tx_key
+from src.util.secret.lcd import Account, LcdClient, TxResponse
 
 logger = get_logger(logger_name="SecretCLI")
 
+# commands that read a single file can read it from their stdin instead (see the 'stdin' arguments)
+STDIN = '/dev/stdin'
+# decrypted contract messages start with the code hash (hex) of the contract they were encrypted for
+CODE_HASH_LENGTH = 64
+# the code hash right before the (JSON) message, wherever the output of 'secretcli query compute decrypt' puts them
+DECRYPTED_MESSAGE = re.compile(rf'(?<![0-9a-fA-F])([0-9a-fA-F]{{{CODE_HASH_LENGTH}}})\s*(\{{.*)', re.S)
+
+
+@lru_cache(maxsize=1)
+def lcd() -> Optional[LcdClient]:
+    """
+    The client of the node's REST server ('secret_lcd'), or None if it isn't configured
+
+    Queries that don't need encryption (accounts, transactions) go through it when configured, instead of spawning
+    secretcli. Compute queries still use secretcli, since their inputs and outputs are encrypted
+    """
+    url = Config().get('secret_lcd', '')
+    return LcdClient(url) if url else None
+
+
+@lru_cache(maxsize=1)
+def cli_executor() -> CliExecutor:
+    """ Executor of all the secretcli calls, limited by 'secretcli_max_concurrent' and 'secretcli_timeout' """
+    config = Config()
+    return CliExecutor(int(config.get('secretcli_max_concurrent', MAX_CONCURRENT)),
+                       float(config.get('secretcli_timeout', CLI_TIMEOUT)))
+
+
+@lru_cache(maxsize=1)
+def encryption() -> Optional[SecretEncryption]:
+    """
+    Encryption of contract messages with the transaction key file 'secret_tx_key_file' (id_tx_io.json), or None
+    if it isn't configured
+
+    The network's key is 'secret_io_pubkey' (base64), or queried from the LCD. When configured, contract
+    transactions are generated and decrypted in-process instead of by secretcli
+    """
+    config = Config()
+    key_file = config.get('secret_tx_key_file', '')
+    if not key_file:
+        return None
+    io_pubkey = config.get('secret_io_pubkey', '')
+    if io_pubkey:
+        return SecretEncryption(load_tx_key(key_file), base64.b64decode(io_pubkey))
+    if lcd():
+        return SecretEncryption(load_tx_key(key_file), lcd().consensus_io_pubkey())
+    logger.warning("'secret_tx_key_file' is set, but neither 'secret_io_pubkey' nor 'secret_lcd' - using secretcli")
+    return None
+
 
 def query_encrypted_error(tx_hash: str):
     cmd = ['secretcli', 'q', 'compute', 'tx', tx_hash]
@@ -20,12 +74,13 @@ def query_encrypted_error(tx_hash: str):
     return resp_json["output_error"]
 
 
-def sign_tx(unsigned_tx_path: str, multi_sig_account_addr: str, account_name: str, account: int, sequence: int):
+def sign_tx(unsigned_tx_path: str, multi_sig_account_addr: str, account_name: str, account: int, sequence: int,
+            stdin: Optional[str] = None):
     cmd = ['secretcli', 'tx', 'sign', unsigned_tx_path, '--signature-only', '--multisig',
            multi_sig_account_addr, '--from', account_name, '--offline', '--account-number', str(account),
            '--sequence', str(sequence)]
 
-    return run_secret_cli(cmd)
+    return run_secret_cli(cmd, stdin=stdin)
 
 
 def multisig_tx(unsigned_tx_path: str, multi_sig_account_name: str, account: int, sequence: int, *signed_tx):
@@ -36,38 +91,92 @@ def multisig_tx(unsigned_tx_path: str, multi_sig_account_name: str, account: int
 
 def create_unsigned_tx(secret_contract_addr: str, transaction_data: Dict, chain_id: str, enclave_key: str,
                        code_hash: str, multisig_acc_addr: str) -> str:
+    if encryption():
+        msg = encryption().encrypt(code_hash, json.dumps(transaction_data))
+        return json.dumps(execute_contract_tx(multisig_acc_addr, secret_contract_addr, msg), indent=2)
     cmd = ['secretcli', 'tx', 'compute', 'execute', secret_contract_addr, f"{json.dumps(transaction_data)}",
            '--generate-only', '--chain-id', f"{chain_id}", '--enclave-key', enclave_key, '--code-hash',
            code_hash, '--from', multisig_acc_addr, '--gas', '200000']
     return run_secret_cli(cmd)
 
 
-def broadcast(signed_tx_path: str) -> str:
+def create_unsigned_batch_tx(secret_contract_addr: str, transactions_data: List[Dict], chain_id: str,
+                             enclave_key: str, code_hash: str, multisig_acc_addr: str) -> str:
+    """ Like create_unsigned_tx, with a message per item of @transactions_data, and the gas of all of them """
+    if len(transactions_data) == 1:
+        return create_unsigned_tx(secret_contract_addr, transactions_data[0], chain_id, enclave_key, code_hash,
+                                  multisig_acc_addr)
+
+    txs = [json.loads(create_unsigned_tx(secret_contract_addr, data, chain_id, enclave_key, code_hash,
+                                         multisig_acc_addr)) for data in transactions_data]
+    batch = txs[0]
+    batch['value']['msg'] = [msg for tx in txs for msg in tx['value']['msg']]
+    batch['value']['fee']['gas'] = str(sum(int(tx['value']['fee']['gas']) for tx in txs))
+    return json.dumps(batch, indent=2)
+
+
+def broadcast(signed_tx_path: str, stdin: Optional[str] = None) -> str:
     # async mode allows sending more than 1 tx per block
     cmd = ['secretcli', 'tx', 'broadcast', signed_tx_path, '-b', 'async']
-    return run_secret_cli(cmd)
+    return run_secret_cli(cmd, stdin=stdin)
 
 
-def decrypt(data: str) -> str:
-    cmd = ['secretcli', 'query', 'compute', 'decrypt', data]
-    return run_secret_cli(cmd)
+def decrypt(data: str) -> Tuple[str, str]:
+    """
+    Decrypts a contract message we encrypted (base64)
+
+    :return: the code hash the message was encrypted for, and the message
+    :raises RuntimeError: if the message can't be decrypted
+    """
+    if encryption():
+        try:
+            res = encryption().decrypt(base64.b64decode(data)).decode()
+        except ValueError as e:
+            raise RuntimeError(f"Failed to decrypt message: {e}") from None
+    else:
+        cmd = ['secretcli', 'query', 'compute', 'decrypt', data]
+        res = run_secret_cli(cmd).strip()
+
+    # secretcli versions differ in what they print around the message (e.g. a label), so only the code hash and the
+    # message from its first '{' are taken
+    match = DECRYPTED_MESSAGE.search(res)
+    if not match or match.start(2) != res.find('{'):
+        raise RuntimeError(f"Decrypted message doesn't start with a code hash: {res}")
+    return match.group(1), match.group(2)
+
+
+class SwapNotFound(subprocess.CalledProcessError):
+    """ The swap contract has no swap with the queried nonce (yet) """
 
 
 def query_scrt_swap(nonce: int, scrt_swap_address: str, token: str) -> str:
+    """
+    :raises SwapNotFound: if there's no swap with @nonce
+    :raises CalledProcessError: if the query failed
+    """
     query_str = swap_json(nonce, token)
     cmd = ['secretcli', 'query', 'compute', 'query', scrt_swap_address, f"{query_str}"]
-    p = subprocess_run(cmd, stdout=PIPE, stderr=PIPE, check=True)
+    try:
+        p = cli_executor().run(cmd)
+    except subprocess.CalledProcessError as e:
+        if b'Failed to get swap for token' in (e.stderr or b''):
+            raise SwapNotFound(e.returncode, e.cmd, e.output, e.stderr) from None
+        raise
     return p.stdout.decode()
 
 
-def query_tx(tx_hash: str):
+def query_tx(tx_hash: str) -> TxResponse:
+    if lcd():
+        return lcd().tx(tx_hash)
     cmd = ['secretcli', 'query', 'tx', tx_hash]
-    return run_secret_cli(cmd)
+    return TxResponse.from_json(json.loads(run_secret_cli(cmd)))
 
 
-def account_info(account: str):
+def account_info(account: str) -> Account:
+    if lcd():
+        return lcd().account(account)
     cmd = ['secretcli', 'query', 'account', account]
-    return json.loads(run_secret_cli(cmd))
+    return Account.from_json(json.loads(run_secret_cli(cmd)))
 
 
 def query_data_success(tx_hash: str) -> Dict:
@@ -95,23 +204,16 @@ def query_data_success(tx_hash: str) -> Dict:
 
 
 def get_uscrt_balance(address: str) -> int:
-    info = account_info(address)
-    amount = 0
-
-    for coin in info['value']['coins']:
-        if coin['denom'] == 'uscrt':
-            amount += int(coin['amount'])
+    return account_info(address).balance('uscrt')
 
-    return amount
 
-
-def run_secret_cli(cmd: List[str], log: bool = True) -> str:
+def run_secret_cli(cmd: List[str], log: bool = True, stdin: Optional[str] = None) -> str:
     """
-
+    :param stdin: piped to the command - e.g. the file of a command given STDIN as its path
     """
     try:
         logger.debug(f'Running command: {cmd}')
-        p = subprocess.run(cmd, stdout=PIPE, stderr=PIPE, check=True)
+        p = cli_executor().run(cmd, input_=stdin.encode() if stdin is not None else None)
     except subprocess.CalledProcessError as e:
         if log:
             logger.error(f'Failed: stderr: {e.stderr.decode()}, stdout: {e.stdout.decode()}')
@@ -1,45 +1,125 @@
 import json
 import os
+from pathlib import Path
 from threading import Lock
-from typing import List, Tuple, Optional, Generator
-
-from web3 import Web3, HTTPProvider
+from time import sleep
+from typing import List, Tuple, Optional, Generator, Dict, Union
+
+from eth_utils import event_abi_to_log_topic
+from hexbytes import HexBytes
+from requests.exceptions import Timeout
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.method_formatters import receipt_formatter, block_formatter, log_entry_formatter
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
 from web3.contract import Contract as Web3Contract
 from web3.datastructures import AttributeDict
 from web3.logs import DISCARD
-from web3.types import BlockData
+from web3.providers import BaseProvider
+from web3.types import BlockData, EventData, LogReceipt
 
 from src.util.common import project_base_path
 from src.util.config import Config
+from src.util.eth.provider_pool import ProviderPool, eth_endpoints, make_provider, send_batch
+from src.util.eth.chain_head import ChainHead, HEAD_INTERVAL
+from src.util.eth.chain_cache import ChainCache, MEMORY_ITEMS as CACHE_MEMORY_ITEMS, DISK_BYTES as CACHE_DISK_BYTES
+from src.util.metrics import metrics
 
 
-def web3_provider(address_: str) -> Web3:
-    if address_.startswith('http'):  # HTTP
-        return Web3(Web3.HTTPProvider(address_))
-    if address_.startswith('ws'):  # WebSocket
-        return Web3(Web3.WebsocketProvider(address_))
-    return Web3(Web3.IPCProvider(address_))
+def web3_provider(address_: Union[str, List[str]], hedge_after: Optional[float] = None) -> Web3:
+    """
+    :param address_: a single node, or several nodes (list or comma separated) to balance between with a ProviderPool
+    :param hedge_after: see ProviderPool
+    """
+    endpoints = eth_endpoints(address_)
+    if len(endpoints) == 1:
+        return Web3(make_provider(endpoints[0]))
+    return Web3(ProviderPool(endpoints, hedge_after=hedge_after))
 
 
 w3: Web3 = None
 
+# eth_getLogs chunking - sizes are in blocks
+LOGS_CHUNK_SIZE = 2000
+LOGS_CHUNK_MIN = 1
+LOGS_CHUNK_MAX = 100000
+# a query that returned less than this many logs is considered sparse, and the next chunk is doubled
+LOGS_SPARSE_RESULTS = 1000
+# parts of the error messages nodes return when an eth_getLogs query is too large (Infura, Alchemy, geth)
+LOGS_RANGE_ERRORS = ('more than', 'too many', 'response size', 'limit exceeded', 'timeout', 'timed out')
+# seconds to wait before querying again the blocks a node didn't have yet
+LOGS_LAG_INTERVAL = 1.0
+# consecutive answers from nodes that are behind the queried range, before giving up
+LOGS_LAG_RETRIES = 5
+# maximal number of calls in a single JSON-RPC batch
+BATCH_MAX_SIZE = 100
+
 
 def init_provider(config: Config):
     global w3  # pylint: disable=global-statement
-    w3 = web3_provider(config["eth_node"])
+    hedge_after = float(config.get('eth_hedge_after', 0)) or None
+    w3 = web3_provider(config["eth_node"], hedge_after)
 
 
 cfg = Config()
 init_provider(cfg)
 
-w3_lock = Lock()
 event_lock = Lock()
 
+_chain_cache: Optional[ChainCache] = None
+_chain_cache_lock = Lock()
+
+# the fetch function looks w3 up on each call, so it follows init_provider
+chain_head = ChainHead(lambda: w3.eth.blockNumber, interval=float(cfg.get('eth_head_interval', HEAD_INTERVAL)))
+
 
-def get_block(block_identifier, full_transactions: bool = False):
-    with w3_lock:
-        res = w3.eth.getBlock(block_identifier, full_transactions)
-    return res
+def chain_identity() -> str:
+    """ Identifies the chain of the node - the chain id, and the genesis block that tells apart chains sharing it """
+    return f"{w3.eth.chainId}-{w3.eth.getBlock(0).hash.hex()[2:18]}"
+
+
+def chain_cache() -> ChainCache:
+    """
+    Returns the process wide cache of final chain data, creating it on first use
+
+    Entries are stored per chain (see chain_identity), and by default in a file per chain
+    """
+    global _chain_cache  # pylint: disable=global-statement
+    with _chain_cache_lock:
+        if _chain_cache is None:
+            chain = chain_identity()
+            default_path = Path.home().joinpath(cfg.get('app_data', '.bridge'), f'chain_cache-{chain}.sqlite')
+            path = cfg.get('eth_cache_path', str(default_path))
+            if path:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+            _chain_cache = ChainCache(path or None,
+                                      memory_items=int(cfg.get('eth_cache_memory_items', CACHE_MEMORY_ITEMS)),
+                                      disk_bytes=int(cfg.get('eth_cache_disk_bytes', CACHE_DISK_BYTES)),
+                                      chain=chain)
+        return _chain_cache
+
+
+def _is_final(block_number: str, head: str) -> bool:
+    """ True if block @block_number (hex) passed the confirmation depth, so data from it can be cached """
+    return int(block_number, 16) <= int(head, 16) - int(cfg['eth_confirmations'])
+
+
+def get_block(block_identifier, full_transactions: bool = False) -> Optional[BlockData]:
+    """ Returns the block, or None if it doesn't exist. Blocks below the confirmation depth are cached """
+    if not isinstance(block_identifier, int):
+        return w3.eth.getBlock(block_identifier, full_transactions)
+
+    key = f"{block_identifier}{'-full' if full_transactions else ''}"
+    block = chain_cache().get('block', key)
+    if block is None:
+        block, head = batch_request([('eth_getBlockByNumber', [hex(block_identifier), full_transactions]),
+                                     ('eth_blockNumber', [])])
+        chain_head.update(int(head, 16))
+        if block is None:
+            return None
+        if _is_final(block['number'], head):
+            chain_cache().put('block', key, block)
+    return AttributeDict.recursive(block_formatter(block))
 
 
 def extract_tx_by_address(address, block: BlockData) -> list:
@@ -47,18 +127,86 @@ def extract_tx_by_address(address, block: BlockData) -> list:
     return [tx for tx in block.transactions if tx.to and address.lower() == tx.to.lower()]
 
 
-def event_log(tx_hash: str, events: List[str], provider: Web3, contract: Web3Contract) -> \
-        Tuple[str, Optional[AttributeDict]]:
+def batch_request(calls: List[Tuple[str, List]], provider: Web3 = None) -> List:
     """
-    Extracts logs of @event from tx_hash if present
-    :param tx_hash:
-    :param events: Case sensitive events name
-    :param provider:
-    :param contract: Web3 Contract
-    :return: event name and log represented in 'AttributeDict' or 'None' if not found
+    Sends JSON-RPC @calls as batches (a single HTTP POST per BATCH_MAX_SIZE calls), and returns the results in order
+
+    Providers that don't support batches (WebSocket, IPC) get the calls one after the other
+    :param calls: list of (method, params)
+    :param provider: defaults to the global provider
+    :raises ValueError: if any of the calls returned an error
     """
+    provider = provider or w3
+    results = []
+    for i in range(0, len(calls), BATCH_MAX_SIZE):
+        results.extend(_batch(provider.provider, calls[i:i + BATCH_MAX_SIZE]))
+    return results
+
+
+def _batch(provider: BaseProvider, calls: List[Tuple[str, List]]) -> List:
+    request = [{'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+               for i, (method, params) in enumerate(calls)]
+    # a ProviderPool routes the whole batch to a single node
+    make_batch_request = getattr(provider, 'make_batch_request', None)
+    responses = make_batch_request(request) if make_batch_request else send_batch(provider, request)
+
+    for response in responses:
+        if 'error' in response:
+            raise ValueError(response['error'])
+    return [response['result'] for response in responses]
+
 
-    receipt = provider.eth.getTransactionReceipt(tx_hash)
+def get_receipts(tx_hashes: List[str], provider: Web3 = None) -> List[Optional[AttributeDict]]:
+    """
+    Fetches the receipts of @tx_hashes in one batch. Receipts of unknown transactions are None
+
+    Receipts below the confirmation depth are served from (and added to) the chain cache
+    """
+    keys = [HexBytes(tx_hash).hex() for tx_hash in tx_hashes]
+    receipts = {key: chain_cache().get('receipt', key) for key in keys}
+
+    missing = [key for key, receipt in receipts.items() if receipt is None]
+    if missing:
+        # the head is fetched in the same batch, to decide which receipts can be cached
+        *results, head = batch_request([('eth_getTransactionReceipt', [key]) for key in missing] +
+                                       [('eth_blockNumber', [])], provider)
+        chain_head.update(int(head, 16))
+        for key, receipt in zip(missing, results):
+            receipts[key] = receipt
+            if receipt and _is_final(receipt['blockNumber'], head):
+                chain_cache().put('receipt', key, receipt)
+
+    return [AttributeDict.recursive(receipt_formatter(receipts[key])) if receipts[key] else None for key in keys]
+
+
+def batch_calls(contract: Web3Contract, calls: List[Tuple[str, Tuple]]) -> List:
+    """
+    Calls (eth_call) several functions of @contract in one batch
+
+    :param contract: Web3 Contract
+    :param calls: list of (function name, args)
+    :return: the decoded return values, in the same format as ContractFunction.call
+    """
+    functions = [getattr(contract.functions, name)(*args) for name, args in calls]
+    rpc_calls = []
+    for function in functions:
+        data = function._encode_transaction_data()  # pylint: disable=protected-access
+        rpc_calls.append(('eth_call', [{'to': contract.address, 'data': data}, 'latest']))
+    raw_results = batch_request(rpc_calls, contract.web3)
+
+    results = []
+    for function, raw_result in zip(functions, raw_results):
+        output_types = get_abi_output_types(function.abi)
+        output = contract.web3.codec.decode_abi(output_types, HexBytes(raw_result))
+        output = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, output)
+        results.append(output[0] if len(output) == 1 else output)
+    return results
+
+
+def _receipt_event(receipt: Optional[AttributeDict], events: List[str], contract: Web3Contract) -> \
+        Tuple[str, Optional[AttributeDict]]:
+    if receipt is None:
+        return '', None
     for event in events:
         # we discard warning as we do best effort to find wanted event, not always there
         # as we listen to the entire contract tx, might
@@ -70,52 +218,212 @@ def event_log(tx_hash: str, events: List[str], provider: Web3, contract: Web3Con
     return '', None
 
 
+def event_logs(tx_hashes: List[str], events: List[str], provider: Web3, contract: Web3Contract) -> \
+        List[Tuple[str, Optional[AttributeDict]]]:
+    """
+    Bulk version of event_log - the receipts of all of @tx_hashes are fetched in a single batch
+    """
+    return [_receipt_event(receipt, events, contract) for receipt in get_receipts(tx_hashes, provider)]
+
+
+def event_log(tx_hash: str, events: List[str], provider: Web3, contract: Web3Contract) -> \
+        Tuple[str, Optional[AttributeDict]]:
+    """
+    Extracts logs of @event from tx_hash if present
+    :param tx_hash:
+    :param events: Case sensitive events name
+    :param provider:
+    :param contract: Web3 Contract
+    :return: event name and log represented in 'AttributeDict' or 'None' if not found
+    """
+    return event_logs([tx_hash], events, provider, contract)[0]
+
+
+def _to_json_compatible(value):
+    if isinstance(value, bytes):
+        return {'__bytes__': value.hex()}
+    if isinstance(value, (dict, AttributeDict)):
+        return {key: _to_json_compatible(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json_compatible(val) for val in value]
+    return value
+
+
+def _from_json_compatible(value: dict):
+    if '__bytes__' in value:
+        return HexBytes(value['__bytes__'])
+    return value
+
+
+def event_to_json(event: EventData) -> str:
+    """ Serializes a decoded event, keeping bytes values (hashes, encoded args) distinguishable from strings """
+    return json.dumps(_to_json_compatible(event), separators=(',', ':'))
+
+
+def event_from_json(data: str) -> AttributeDict:
+    """ Restores an event serialized with event_to_json """
+    return AttributeDict.recursive(json.loads(data, object_hook=_from_json_compatible))
+
+
 def normalize_address(address: str):
     """Converts address to address acceptable by web3"""
     return Web3.toChecksumAddress(address.lower())
 
 
-def contract_event_in_range(contract, event_name: str, from_block: int = 0,
-                            to_block: Optional[int] = None) -> Generator:
+def event_topics(contract: Web3Contract, events: List[str]) -> Dict[bytes, str]:
+    """ Maps the topic0 hash of each of @events to the event name """
+    return {event_abi_to_log_topic(getattr(contract.events, name)._get_event_abi()): name  # pylint: disable=protected-access
+            for name in events}
+
+
+def is_range_too_large(error: Exception) -> bool:
+    """ True if the node refused an eth_getLogs query because of the size of the range or the number of results """
+    if isinstance(error, Timeout):
+        return True
+    if isinstance(error, ValueError) and error.args:
+        message = error.args[0].get('message', '') if isinstance(error.args[0], dict) else str(error.args[0])
+        return any(hint in message.lower() for hint in LOGS_RANGE_ERRORS)
+    return False
+
+
+class NodeBehind(ValueError):
+    """ The nodes that answered eth_getLogs kept being behind the queried blocks """
+
+
+class LogsScan:
     """
-    scans the blockchain, and yields blocks that has contract tx with the provided event
+    Progress of an eth_getLogs scan over a range of blocks, see logs_in_range
 
-    Note: Be cautions with the range provided, as the logic creates query for each block which could be a bottleneck.
+    The range is fetched in chunks. A chunk is halved whenever the node refuses it (too many results, timeout) and
+    doubled again when results are sparse, so long ranges are covered with as few queries as possible.
+    Each query is answered along with the head of the node that answered: with several nodes, it may be behind the
+    others. Only the blocks it had count as scanned, and the rest are queried again - up to LOGS_LAG_RETRIES
+    consecutive times
+    """
+
+    def __init__(self, from_block: int, to_block: int, chunk_size: int = LOGS_CHUNK_SIZE):
+        self.start = from_block
+        self.to_block = to_block
+        self.chunk_size = chunk_size
+        self.lag_retries = 0
+
+    @property
+    def done(self) -> bool:
+        return self.start > self.to_block
+
+    @property
+    def lagging(self) -> bool:
+        """ The last answer came from a node that didn't have all the queried blocks """
+        return self.lag_retries > 0
+
+    def next_range(self) -> Tuple[int, int]:
+        return self.start, min(self.start + self.chunk_size - 1, self.to_block)
+
+    def shrink(self) -> bool:
+        """ Halves the chunk after a refused query. False if it is as small as it gets """
+        if self.chunk_size <= LOGS_CHUNK_MIN:
+            return False
+        self.chunk_size = max(self.chunk_size // 2, LOGS_CHUNK_MIN)
+        return True
+
+    def answered(self, end: int, node_head: int, results: int) -> int:
+        """
+        Moves past the blocks covered by an answer to the query up to block @end
+
+        :param node_head: head of the node that answered
+        :param results: number of logs in the answer
+        :return: the last block the answer covers - logs after it are to be ignored
+        :raises NodeBehind: if the nodes were behind for too many consecutive answers
+        """
+        scanned = min(end, node_head)
+        if scanned < end:
+            metrics.counter('eth.logs.lagging').inc()
+            self.lag_retries += 1
+            if self.lag_retries > LOGS_LAG_RETRIES:
+                raise NodeBehind(f"Nodes still at block {node_head} after {LOGS_LAG_RETRIES} retries, "
+                                 f"scanning up to block {end}")
+        else:
+            self.lag_retries = 0
+
+        self.start = max(self.start, scanned + 1)
+        if results < LOGS_SPARSE_RESULTS:
+            self.chunk_size = min(self.chunk_size * 2, LOGS_CHUNK_MAX)
+        return scanned
+
+
+def logs_in_range(address: str, topics: List[bytes], from_block: int, to_block: int,
+                  chunk_size: int = LOGS_CHUNK_SIZE) -> Generator[LogReceipt, None, None]:
+    """
+    Yields the raw logs emitted by @address with one of @topics as topic0, in block order
+
+    The range is fetched with eth_getLogs in adaptive chunks, see LogsScan. Each query is sent in one batch with
+    eth_blockNumber, so it's known which blocks the node that answered had. When it was behind, the blocks it didn't
+    have are queried again after LOGS_LAG_INTERVAL seconds, from another node if there are several
+    :param address: contract address
+    :param topics: topic0 hashes to OR together
+    :param from_block: first block to scan (inclusive)
+    :param to_block: last block to scan (inclusive)
+    :param chunk_size: number of blocks to request in the first query
+    :raises NodeBehind: see LogsScan
+    """
+    params = {'address': normalize_address(address), 'topics': [[Web3.toHex(topic) for topic in topics]]}
+    scan = LogsScan(from_block, to_block, chunk_size)
+    while not scan.done:
+        start, end = scan.next_range()
+        try:
+            # a batch is answered by a single node, which runs its calls in order
+            node_head, logs = batch_request([('eth_blockNumber', []),
+                                             ('eth_getLogs', [{**params, 'fromBlock': hex(start), 'toBlock': hex(end)}])])
+        except (ValueError, Timeout) as e:
+            if not is_range_too_large(e) or not scan.shrink():
+                raise
+            continue
+
+        scanned = scan.answered(end, int(node_head, 16), len(logs))
+        for log in logs:
+            log = AttributeDict.recursive(log_entry_formatter(log))
+            if log.blockNumber <= scanned:
+                yield log
+
+        if scan.lagging:
+            if isinstance(w3.provider, ProviderPool):
+                w3.provider.set_aside_last()
+            sleep(LOGS_LAG_INTERVAL)
+
+
+def contract_events_in_range(contract, events: List[str], from_block: int = 0,
+                             to_block: Optional[int] = None) -> Generator[Tuple[str, EventData], None, None]:
+    """
+    Scans the blockchain for logs of @events emitted by @contract, and yields them decoded, in block order
+
+    :param contract: EthereumContract
+    :param events: names of the contract events to look for (Case sensitive)
     :param from_block: starting block, defaults to 0
     :param to_block: end block, defaults to 'latest'
-    :param provider:
-    :param logger:
-    :param contract:
-    :param event_name: name of the contract emit event you wish to be notified of
+    :return: generator of (event name, decoded log)
     """
     if to_block is None:
-        to_block = w3.eth.blockNumber
-
-    with w3_lock:
-
-        if isinstance(w3.provider, HTTPProvider):
-            for block_num in range(from_block, to_block + 1):
-                block = w3.eth.getBlock(block_num, full_transactions=True)
-                contract_transactions = extract_tx_by_address(contract.address, block)
-
-                if not contract_transactions:
-                    continue
-                for tx in contract_transactions:
-                    _, log = event_log(tx_hash=tx.hash, events=[event_name], provider=w3, contract=contract.tracked_contract)
-                    if log is None:
-                        continue
-                    yield log
-        else:
-            event = getattr(contract.tracked_contract.events, event_name)
-            event_filter = event.createFilter(fromBlock=from_block, toBlock=to_block)
+        to_block = chain_head.number
 
-            for tx in event_filter.get_new_entries():
-                _, log = event_log(tx_hash=tx.hash, events=[event_name], provider=w3, contract=contract.tracked_contract)
+    topics = event_topics(contract.contract, events)
+    for log in logs_in_range(contract.address, list(topics), from_block, to_block,
+                             chunk_size=int(cfg.get('eth_logs_chunk_size', LOGS_CHUNK_SIZE))):
+        name = topics[bytes(log['topics'][0])]
+        yield name, getattr(contract.contract.events, name)().processLog(log)
 
-                if log is None:
-                    continue
 
-                yield log
+def contract_event_in_range(contract, event_name: str, from_block: int = 0,
+                            to_block: Optional[int] = None) -> Generator:
+    """
+    scans the blockchain, and yields the logs of the contract with the provided event
+
+    :param from_block: starting block, defaults to 0
+    :param to_block: end block, defaults to 'latest'
+    :param contract: EthereumContract
+    :param event_name: name of the contract emit event you wish to be notified of
+    """
+    for _, log in contract_events_in_range(contract, [event_name], from_block, to_block):
+        yield log
 
 
 def estimate_gas_price():
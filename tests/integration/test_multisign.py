@@ -0,0 +1,31 @@
+import json
+from pathlib import Path
+
+from src.util.common import project_base_path, temp_file, temp_files
+from src.util.config import Config
+from src.util.secret.multisig import MultisigKey, multisign
+from src.util.secretcli import STDIN, multisig_tx, sign_tx
+from tests.utils.keys import get_key_signer
+
+ACCOUNT_NUMBER = 17
+SEQUENCE = 4
+
+
+def test_multisign_matches_secretcli(configuration: Config, multisig_account, scrt_accounts):
+    unsigned_tx = json.dumps({'type': 'cosmos-sdk/StdTx', 'value': {
+        'msg': [{'type': 'cosmos-sdk/MsgSend', 'value': {
+            'from_address': multisig_account.address, 'to_address': multisig_account.address,
+            'amount': [{'denom': 'uscrt', 'amount': '1'}]}}],
+        'fee': {'amount': [{'denom': 'uscrt', 'amount': '50000'}], 'gas': '200000'}, 'signatures': None, 'memo': ''}})
+    signatures = [sign_tx(STDIN, multisig_account.address, account.name, ACCOUNT_NUMBER, SEQUENCE, stdin=unsigned_tx)
+                  for account in scrt_accounts]
+
+    with temp_file(unsigned_tx) as unsigned_tx_path:
+        with temp_files(signatures) as signed_tx_paths:
+            expected = multisig_tx(unsigned_tx_path, multisig_account.name, ACCOUNT_NUMBER, SEQUENCE, *signed_tx_paths)
+
+    keys_dir = Path.joinpath(project_base_path(), configuration['path_to_keys'])
+    multisig = MultisigKey.from_bech32(configuration['signatures_threshold'],
+                                       [get_key_signer(account.name, keys_dir)['pubkey'] for account in scrt_accounts])
+    signed = multisign(unsigned_tx, multisig, signatures, configuration['chain_id'], ACCOUNT_NUMBER, SEQUENCE)
+    assert json.loads(signed, object_pairs_hook=list) == json.loads(expected, object_pairs_hook=list)
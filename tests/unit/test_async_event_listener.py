@@ -0,0 +1,182 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+from threading import Thread, current_thread
+
+from eth_utils import event_abi_to_log_topic
+from pytest import fixture
+from web3 import Web3
+
+from src.contracts.ethereum import async_event_listener
+from src.contracts.ethereum.async_event_listener import AsyncEthEventListener, TrackedContract
+
+TRANSFER_ABI = {'anonymous': False, 'name': 'Transfer', 'type': 'event',
+                'inputs': [{'indexed': False, 'name': 'value', 'type': 'uint256'}]}
+TRANSFER_TOPIC = '0x' + event_abi_to_log_topic(TRANSFER_ABI).hex()
+
+
+class StandInContract:
+    def __init__(self, address: str):
+        self.address = address
+        self.contract = Web3().eth.contract(address=address, abi=[TRANSFER_ABI])
+
+
+class StandInNode(ThreadingHTTPServer):
+    """Local JSON-RPC node serving eth_blockNumber and eth_getLogs from a list of logs"""
+
+    def __init__(self):
+        self.head = 0
+        # blocks the backend answering eth_getLogs batches is behind, one less after each of them - as when a load
+        # balancer sends the scan to another backend than the head
+        self.lag = 0
+        self.logs = []
+        self.get_logs_calls = 0
+        super().__init__(('127.0.0.1', 0), _Handler)
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    def add_transfer(self, address: str, block: int, value: int):
+        self.logs.append({
+            'address': address, 'topics': [TRANSFER_TOPIC], 'data': '0x' + f'{value:064x}',
+            'blockNumber': hex(block), 'blockHash': '0x' + f'{block:064x}', 'logIndex': hex(len(self.logs)),
+            'transactionHash': '0x' + f'{len(self.logs):064x}', 'transactionIndex': '0x0', 'removed': False
+        })
+
+    def result(self, method, params, lag=0):
+        if method == 'eth_blockNumber':
+            return hex(self.head - lag)
+        self.get_logs_calls += 1
+        query = params[0]
+        addresses = [address.lower() for address in query['address']]
+        to_block = min(int(query['toBlock'], 16), self.head - lag)
+        return [log for log in self.logs if log['address'].lower() in addresses
+                and int(query['fromBlock'], 16) <= int(log['blockNumber'], 16) <= to_block]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        node: StandInNode = self.server
+        lag = node.lag if any(call['method'] == 'eth_getLogs' for call in request) else 0
+        results = [node.result(call['method'], call['params'], lag) for call in request]
+        node.lag = max(node.lag - 1, 0) if lag else node.lag
+        body = json.dumps([{'jsonrpc': '2.0', 'id': call['id'], 'result': result}
+                           for call, result in zip(request, results)]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def node():
+    server = StandInNode()
+    yield server
+    server.shutdown()
+
+
+def test_multiplexed_contracts(node):
+    contracts = [StandInContract(Web3.toChecksumAddress(f'0x{i:040x}')) for i in (1, 2)]
+    node.head = 10
+    node.add_transfer(contracts[0].address, 3, 100)
+    node.add_transfer(contracts[1].address, 5, 200)
+    node.add_transfer(contracts[0].address, 9, 300)
+
+    listener = AsyncEthEventListener({'db_name': '', 'eth_node': f'http://127.0.0.1:{node.server_address[1]}',
+                                      'eth_confirmations': 2, 'eth_reorg_depth': 0, 'sleep_interval': 0.05})
+    received = Queue()
+    for contract in contracts:
+        listener.register(lambda event, address=contract.address: received.put((address, event.args.value)),
+                          ['Transfer'], from_block=1, contract=contract)
+    listener.start()
+
+    # events of both contracts, in block order, up to the confirmation threshold
+    assert received.get(timeout=5) == (contracts[0].address, 100)
+    assert received.get(timeout=5) == (contracts[1].address, 200)
+    assert received.empty()
+
+    node.head = 11
+    assert received.get(timeout=5) == (contracts[0].address, 300)
+    # one query per new head, for both contracts
+    assert node.get_logs_calls == 2
+    listener.stop()
+    listener.join(5)
+    assert not listener.is_alive()
+
+
+def test_lagging_backend(node, monkeypatch):
+    monkeypatch.setattr(async_event_listener, 'LOGS_LAG_INTERVAL', 0)
+    contract = StandInContract(Web3.toChecksumAddress('0x' + '7' * 40))
+    node.head = 10
+    node.add_transfer(contract.address, 5, 100)
+    node.add_transfer(contract.address, 9, 200)
+    node.lag = 3
+
+    listener = AsyncEthEventListener({'db_name': '', 'eth_node': f'http://127.0.0.1:{node.server_address[1]}',
+                                      'eth_confirmations': 0, 'eth_reorg_depth': 0, 'sleep_interval': 0.05})
+    received = Queue()
+    listener.register(lambda event: received.put(event.args.value), ['Transfer'], from_block=1, contract=contract)
+    listener.start()
+
+    # the blocks the backend didn't have yet are scanned again, and no event is lost
+    assert [received.get(timeout=5), received.get(timeout=5)] == [100, 200]
+    listener.stop()
+    listener.join(5)
+
+
+def test_moves_to_node_not_behind(node, monkeypatch):
+    monkeypatch.setattr(async_event_listener, 'LOGS_LAG_INTERVAL', 0)
+    contract = StandInContract(Web3.toChecksumAddress('0x' + '7' * 40))
+    synced = StandInNode()
+    for server in (node, synced):
+        server.head = 10
+        server.add_transfer(contract.address, 5, 100)
+    # doesn't have any of the scanned blocks for a long while
+    node.lag = 100
+
+    try:
+        listener = AsyncEthEventListener({'db_name': '', 'eth_confirmations': 0, 'eth_reorg_depth': 0,
+                                          'sleep_interval': 0.05,
+                                          'eth_node': [f'http://127.0.0.1:{server.server_address[1]}'
+                                                       for server in (node, synced)]})
+        received = Queue()
+        listener.register(lambda event: received.put(event.args.value), ['Transfer'], from_block=1, contract=contract)
+        listener.start()
+
+        assert received.get(timeout=5) == 100
+        assert node.get_logs_calls == 1
+        listener.stop()
+        listener.join(5)
+    finally:
+        synced.shutdown()
+
+
+def test_db_calls_off_loop_and_errors_recovered(node, monkeypatch):
+    contract = StandInContract(Web3.toChecksumAddress('0x' + '8' * 40))
+    node.head = 10
+    node.add_transfer(contract.address, 5, 100)
+    threads = []
+    add_pending = TrackedContract.add_pending
+
+    def add_pending_once_failing(tracked, name, event):
+        threads.append(current_thread().name)
+        if len(threads) == 1:
+            raise RuntimeError("unexpected")
+        add_pending(tracked, name, event)
+
+    monkeypatch.setattr(TrackedContract, 'add_pending', add_pending_once_failing)
+    listener = AsyncEthEventListener({'db_name': '', 'eth_node': f'http://127.0.0.1:{node.server_address[1]}',
+                                      'eth_confirmations': 0, 'eth_reorg_depth': 0, 'sleep_interval': 0.05})
+    received = Queue()
+    listener.register(lambda event: received.put(event.args.value), ['Transfer'], from_block=1, contract=contract)
+    listener.start()
+
+    # the failed tick is started over
+    assert received.get(timeout=5) == 100
+    assert listener.is_alive()
+    assert len(threads) == 2 and all(name.startswith('ListenerWorker') for name in threads)
+    listener.stop()
+    listener.join(5)
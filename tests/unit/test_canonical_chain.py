@@ -0,0 +1,34 @@
+from web3.datastructures import AttributeDict
+
+from src.contracts.ethereum.canonical_chain import CanonicalChain
+
+
+def _chain(length: int, fork: str = 'a', fork_from: int = 0):
+    """ block hashes are '<fork><number>' for blocks at or above fork_from, and 'a<number>' below """
+    def block_hash(number):
+        return f"{fork if number >= fork_from else 'a'}{number}".encode()
+    return {n: AttributeDict({'hash': block_hash(n), 'parentHash': block_hash(n - 1)}) for n in range(length)}
+
+
+def test_no_reorg():
+    blocks = _chain(20)
+    chain = CanonicalChain(size=8)
+
+    assert chain.update(10, blocks.get) is None
+    assert chain.update(15, blocks.get) is None
+    assert chain.hash_of(15) == b'a15'
+    assert chain.hash_of(12) == b'a12'
+    assert chain.hash_of(5) is None
+
+
+def test_reorg_detected():
+    chain = CanonicalChain(size=8)
+    chain.update(8, _chain(20).get)
+    chain.update(14, _chain(20).get)
+
+    # blocks 12 and up are replaced by fork 'b'
+    reorged = _chain(20, fork='b', fork_from=12)
+    assert chain.update(16, reorged.get) == 12
+    assert chain.hash_of(11) == b'a11'
+    assert chain.hash_of(12) == b'b12'
+    assert chain.hash_of(16) == b'b16'
@@ -0,0 +1,75 @@
+import random
+from threading import Lock, RLock
+from time import sleep
+
+from pytest import raises
+from web3.datastructures import AttributeDict
+
+from src.leader.secret20 import manager as manager_module
+from src.leader.secret20.manager import SecretManager
+from src.util.logger import get_logger
+
+PARTITION = 10
+WORKERS = 2
+
+
+def _manager(monkeypatch, failing_partition=None):
+    """ A manager catching up on 2 events per block, fetched with random delays """
+    manager = SecretManager.__new__(SecretManager)
+    manager.config = {'eth_start_block': 0, 'eth_catch_up_partition': PARTITION, 'eth_catch_up_workers': WORKERS}
+    manager.logger = get_logger(logger_name='test')
+    manager.batch = []
+    manager.batch_lock = RLock()
+    manager.log = []
+    manager.in_flight, manager.max_in_flight = 0, 0
+    lock = Lock()
+
+    def events_in_range(block_range):
+        with lock:
+            manager.in_flight += 1
+            manager.max_in_flight = max(manager.max_in_flight, manager.in_flight)
+        sleep(random.uniform(0, 0.01))
+        from_block, to_block = block_range
+        if from_block == failing_partition:
+            raise ValueError('query failed')
+        events = [AttributeDict({'blockNumber': block, 'logIndex': index})
+                  for block in range(from_block, to_block + 1) for index in (0, 1)]
+        random.shuffle(events)
+        return events
+
+    def checkpoint(_, block):
+        if block == PARTITION:
+            # slow handling - the workers mustn't fetch further ahead meanwhile
+            sleep(0.1)
+        with lock:
+            manager.in_flight -= 1
+        manager.log.append(('checkpoint', block))
+
+    monkeypatch.setattr(manager, '_events_in_range', events_in_range)
+    monkeypatch.setattr(manager, '_handle', lambda event: manager.log.append((event.blockNumber, event.logIndex)))
+    monkeypatch.setattr(manager_module.SwapTrackerObject, 'last_processed', lambda src: 0)
+    monkeypatch.setattr(manager_module.SwapTrackerObject, 'update_last_processed', checkpoint)
+    return manager
+
+
+def test_handled_in_order(monkeypatch):
+    manager = _manager(monkeypatch)
+    manager.catch_up(200)
+
+    events = [entry for entry in manager.log if entry[0] != 'checkpoint']
+    assert events == [(block, index) for block in range(1, 201) for index in (0, 1)]
+    # the checkpoint of a partition follows all of its events, and none of the next one's
+    for i, (kind, block) in enumerate(manager.log):
+        if kind == 'checkpoint':
+            assert manager.log[i - 1] == (block, 1)
+    assert [block for kind, block in manager.log if kind == 'checkpoint'] == list(range(10, 201, PARTITION))
+    assert manager.max_in_flight <= WORKERS * 2
+
+
+def test_checkpoint_stops_at_failed_partition(monkeypatch):
+    manager = _manager(monkeypatch, failing_partition=51)
+    with raises(ValueError):
+        manager.catch_up(200)
+
+    assert [block for kind, block in manager.log if kind == 'checkpoint'] == [10, 20, 30, 40, 50]
+    assert max(block for block, _ in manager.log if block != 'checkpoint') == 50
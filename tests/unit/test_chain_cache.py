@@ -0,0 +1,61 @@
+from src.util.eth.chain_cache import ChainCache, TOUCH_BATCH
+from src.util.metrics import metrics
+
+
+def test_memory_lru():
+    cache = ChainCache(memory_items=2)
+    cache.put('receipt', '0x1', {'n': 1})
+    cache.put('receipt', '0x2', {'n': 2})
+    assert cache.get('receipt', '0x1') == {'n': 1}
+    cache.put('receipt', '0x3', {'n': 3})
+
+    # 0x2 was the least recently used
+    assert cache.get('receipt', '0x2') is None
+    assert cache.get('receipt', '0x1') == {'n': 1}
+    assert cache.get('block', '0x1') is None
+
+
+def test_disk_survives_restart(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    ChainCache(path).put('receipt', '0xab', {'blockNumber': '0x10'})
+
+    disk_hits = metrics.counter('eth.cache.disk_hits').value
+    cache = ChainCache(path)
+    assert cache.get('receipt', '0xab') == {'blockNumber': '0x10'}
+    assert metrics.counter('eth.cache.disk_hits').value == disk_hits + 1
+
+
+def test_disk_size_eviction(tmp_path):
+    cache = ChainCache(str(tmp_path / 'cache.sqlite'), memory_items=1, disk_bytes=1000)
+    for i in range(100):
+        cache.put('block', str(i), {'data': 'x' * 90})
+
+    assert cache.disk_used <= 1000
+    assert cache.get('block', '99') is not None
+    assert cache.get('block', '0') is None
+
+
+def test_chains_kept_apart(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    ChainCache(path, chain='1-d4e56740f876aef8').put('block', '100', {'hash': '0x1'})
+
+    assert ChainCache(path, chain='4-6341fd3daf94b748').get('block', '100') is None
+    assert ChainCache(path, chain='1-d4e56740f876aef8').get('block', '100') == {'hash': '0x1'}
+
+
+def test_reads_recorded_in_batches(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    writer = ChainCache(path)
+    for i in range(TOUCH_BATCH):
+        writer.put('block', str(i), {'n': i})
+
+    cache = ChainCache(path, memory_items=1)
+    statements = []
+    cache.db.set_trace_callback(statements.append)
+    for i in range(TOUCH_BATCH - 1):
+        assert cache.get('block', str(i)) == {'n': i}
+    assert not [statement for statement in statements if statement.startswith('UPDATE')]
+
+    cache.get('block', str(TOUCH_BATCH - 1))
+    assert [statement for statement in statements if statement.startswith('UPDATE')]
+    assert statements[-1] == 'COMMIT'
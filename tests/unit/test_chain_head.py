@@ -0,0 +1,58 @@
+from threading import Thread
+
+from src.util.eth.chain_head import ChainHead
+
+
+def test_cached_between_refreshes():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return 100 + len(calls)
+
+    head = ChainHead(fetch, interval=60)
+    assert head.number == 101
+    assert head.number == 101
+    assert len(calls) == 1
+
+    head.update(150)
+    assert head.number == 150
+    head.update(120)
+    assert head.number == 150
+
+
+def test_wait_for_wakes_on_update():
+    head = ChainHead(lambda: 10, interval=60)
+    results = []
+    waiter = Thread(target=lambda: results.append(head.wait_for(12, timeout=5)))
+    waiter.start()
+    head.update(12)
+    waiter.join(5)
+    assert results == [12]
+
+    assert head.wait_for(20, timeout=0.1) == 12
+
+
+def test_reorg_to_lower_head():
+    head = ChainHead(lambda: 10, interval=60)
+    head.update(20, b'a20')
+    # a late notification of an older block of the same chain
+    head.update(19)
+    assert head.number == 20
+    head.update(20, b'a20')
+    assert head.number == 20
+
+    # the chain was replaced by a shorter one
+    head.update(18, b'b18')
+    assert head.number == 18
+    head.update(18, b'b18')
+    head.update(17)
+    assert head.number == 18
+
+
+def test_lower_head_without_known_hash():
+    head = ChainHead(lambda: 105, interval=60)
+    assert head.number == 105
+    # the polled head has no hash to compare with - a lower block is only late
+    head.update(103, b'abc')
+    assert head.number == 105
@@ -0,0 +1,52 @@
+import sys
+from subprocess import CalledProcessError
+from threading import Thread
+from time import monotonic, sleep
+
+from pytest import raises
+
+from src.util.secret.cli_executor import CliExecutor, PRIORITY_BROADCAST, PRIORITY_QUERY, command_priority
+
+
+def _python(code: str):
+    return [sys.executable, '-c', code]
+
+
+def test_priorities():
+    assert command_priority(['secretcli', 'tx', 'broadcast', 'tx.json']) == PRIORITY_BROADCAST
+    assert command_priority(['secretcli', 'tx', 'multisign', 'tx.json', 'ms']) == PRIORITY_BROADCAST
+    assert command_priority(['secretcli', 'query', 'compute', 'query']) == PRIORITY_QUERY
+
+
+def test_timeout_kills():
+    executor = CliExecutor(timeout=0.5)
+    start = monotonic()
+    with raises(CalledProcessError) as e:
+        executor.run(_python('import time; time.sleep(30)'))
+    assert monotonic() - start < 5
+    assert b'timed out' in e.value.stderr
+
+    assert executor.run(_python('print("ok")')).stdout.strip() == b'ok'
+
+
+def test_bounded_and_prioritized():
+    executor = CliExecutor(max_concurrent=1)
+    order = []
+
+    def run(name, priority):
+        executor.run(_python('import time; time.sleep(0.2)'), priority=priority)
+        order.append(name)
+
+    first = Thread(target=run, args=('first', PRIORITY_QUERY))
+    first.start()
+    sleep(0.05)
+    # both wait for the single slot - the broadcast goes first even though it arrived last
+    waiting = [Thread(target=run, args=('query', PRIORITY_QUERY)),
+               Thread(target=run, args=('broadcast', PRIORITY_BROADCAST))]
+    for thread in waiting:
+        thread.start()
+        sleep(0.02)
+    for thread in [first] + waiting:
+        thread.join(5)
+
+    assert order == ['first', 'broadcast', 'query']
@@ -0,0 +1,51 @@
+from threading import Event, Thread
+from time import sleep
+
+from pytest import raises
+
+from src.util.dispatcher import KeyedDispatcher
+
+
+def test_ordered_per_key():
+    dispatcher = KeyedDispatcher(workers=4)
+    done = {key: [] for key in range(8)}
+    for i in range(50):
+        for key in done:
+            dispatcher.submit(key, lambda key=key, i=i: done[key].append(i))
+    dispatcher.stop()
+    dispatcher.join(5)
+
+    assert all(results == list(range(50)) for results in done.values())
+
+
+def test_keys_run_in_parallel():
+    dispatcher = KeyedDispatcher(workers=2)
+    release = Event()
+    ran = Event()
+    # find a key on the other worker than key 0
+    other = next(key for key in range(1, 100) if hash(key) % 2 != hash(0) % 2)
+    dispatcher.submit(0, release.wait)
+    dispatcher.submit(other, ran.set)
+    assert ran.wait(5)
+    release.set()
+    dispatcher.stop()
+
+
+def test_backpressure_and_errors():
+    dispatcher = KeyedDispatcher(workers=1, queue_size=1)
+    release = Event()
+    dispatcher.submit('a', release.wait)
+    sleep(0.05)
+    dispatcher.submit('a', lambda: 1 / 0)
+
+    submitted = Event()
+    # the queue is full - submitting blocks until the worker catches up
+    producer = Thread(target=lambda: (dispatcher.submit('a', lambda: None), submitted.set()))
+    producer.start()
+    assert not submitted.wait(0.1)
+    release.set()
+    assert submitted.wait(5)
+
+    sleep(0.05)
+    with raises(ZeroDivisionError):
+        dispatcher.submit('a', lambda: None)
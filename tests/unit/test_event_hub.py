@@ -0,0 +1,110 @@
+from queue import Queue
+from threading import current_thread
+
+from pytest import fixture, raises
+from web3 import Web3
+
+from src.contracts.ethereum.async_event_listener import AsyncEthEventListener
+from src.contracts.ethereum.event_hub import SharedEventListener, event_listener
+from src.contracts.ethereum.event_listener import EthEventListener
+from tests.unit.test_async_event_listener import StandInContract, StandInNode
+
+
+@fixture
+def node():
+    server = StandInNode()
+    yield server
+    server.shutdown()
+
+
+def test_subscribers_share_the_listener(node):
+    contract = StandInContract(Web3.toChecksumAddress('0x' + '3' * 40))
+    config = {'db_name': '', 'eth_node': f'http://127.0.0.1:{node.server_address[1]}', 'eth_confirmations': 0,
+              'eth_reorg_depth': 0, 'sleep_interval': 0.05, 'eth_shared_listener': True}
+    node.head = 10
+    node.add_transfer(contract.address, 2, 100)
+    node.add_transfer(contract.address, 6, 200)
+
+    early, late = event_listener(contract, config), event_listener(contract, config)
+    assert isinstance(early, SharedEventListener) and early.hub is late.hub
+    early_events, late_events = Queue(), Queue()
+    early.register(lambda event: early_events.put(event.args.value), ['Transfer'], from_block=1)
+    late.register(lambda event: late_events.put(event.args.value), ['Transfer'], from_block=5)
+    early.start()
+    late.start()
+
+    # independent start blocks
+    assert [early_events.get(timeout=5), early_events.get(timeout=5)] == [100, 200]
+    assert late_events.get(timeout=5) == 200
+    assert late_events.empty()
+
+    # once both subscribers reached the head, new logs are fetched once for both of them
+    calls = node.get_logs_calls
+    node.add_transfer(contract.address, 11, 300)
+    node.head = 11
+    assert early_events.get(timeout=5) == 300
+    assert late_events.get(timeout=5) == 300
+    assert node.get_logs_calls == calls + 1
+
+    early.stop()
+    assert late.is_alive()
+    late.stop()
+    late.hub.join(5)
+    assert not late.hub.is_alive()
+
+
+def _config(node) -> dict:
+    return {'db_name': '', 'eth_node': f'http://127.0.0.1:{node.server_address[1]}', 'eth_confirmations': 0,
+            'eth_reorg_depth': 0, 'sleep_interval': 0.05, 'eth_shared_listener': True}
+
+
+def test_failing_subscriber_isolated(node):
+    contract = StandInContract(Web3.toChecksumAddress('0x' + '5' * 40))
+    node.head = 10
+    node.add_transfer(contract.address, 2, 100)
+    node.add_transfer(contract.address, 6, 200)
+
+    def fail(event):
+        raise RuntimeError(f"callback failed on {event.args.value}")
+
+    failing, other = event_listener(contract, _config(node)), event_listener(contract, _config(node))
+    received = Queue()
+    failing.register(fail, ['Transfer'], from_block=1)
+    other.register(lambda event: received.put(event.args.value), ['Transfer'], from_block=1)
+    failing.start()
+    other.start()
+
+    # the other subscriber got all its events, and the listener is still up
+    assert [received.get(timeout=5), received.get(timeout=5)] == [100, 200]
+    assert failing.hub.is_alive()
+
+    failing.stop()
+    other.stop()
+    other.hub.join(5)
+
+
+def test_partition_key_passed_through(node):
+    contract = StandInContract(Web3.toChecksumAddress('0x' + '6' * 40))
+    node.head = 10
+    node.add_transfer(contract.address, 2, 100)
+    config = dict(_config(node), eth_callback_workers=2)
+
+    listener = event_listener(contract, config, partition_key=lambda event: event.args.value)
+    assert isinstance(listener, SharedEventListener)
+    threads = Queue()
+    listener.register(lambda event: threads.put(current_thread().name), ['Transfer'], from_block=1)
+    listener.start()
+
+    # ran on the subscriber's own workers
+    assert threads.get(timeout=5).startswith('Callbacks-')
+    listener.stop()
+    listener.hub.join(5)
+
+
+def test_own_listener_without_http_node():
+    contract = StandInContract(Web3.toChecksumAddress('0x' + '4' * 40))
+    config = {'db_name': '', 'eth_node': 'ws://127.0.0.1:8546,/tmp/geth.ipc', 'eth_confirmations': 0,
+              'sleep_interval': 0.05, 'eth_shared_listener': True}
+    with raises(ValueError):
+        AsyncEthEventListener(config, contract)
+    assert isinstance(event_listener(contract, config), EthEventListener)
@@ -0,0 +1,191 @@
+from typing import Any, List, Optional
+
+from eth_utils import event_abi_to_log_topic
+from pytest import fixture
+from web3 import Web3
+from web3.providers import BaseProvider
+
+from src.contracts.ethereum import event_listener as event_listener_module
+from src.contracts.ethereum.event_listener import EthEventListener
+from src.util import web3 as web3_module
+from src.util.eth.chain_cache import ChainCache
+from src.util.eth.chain_head import ChainHead
+from src.util.metrics import metrics
+
+TRANSFER_ABI = {'anonymous': False, 'name': 'Transfer', 'type': 'event',
+                'inputs': [{'indexed': False, 'name': 'value', 'type': 'uint256'}]}
+SWAP_ABI = {'anonymous': False, 'name': 'Swap', 'type': 'event',
+            'inputs': [{'indexed': False, 'name': 'amount', 'type': 'uint256'}]}
+TOPICS = {abi['name']: '0x' + event_abi_to_log_topic(abi).hex() for abi in (TRANSFER_ABI, SWAP_ABI)}
+
+CONFIG = {'db_name': '', 'eth_confirmations': 2, 'eth_reorg_depth': 16, 'sleep_interval': 0}
+
+
+class StandInContract:
+    def __init__(self, address: str = Web3.toChecksumAddress('0x' + '5' * 40)):
+        self.address = address
+        self.contract = Web3().eth.contract(address=address, abi=[TRANSFER_ABI, SWAP_ABI])
+
+
+def _number(value) -> int:
+    return value if isinstance(value, int) else int(value, 16)
+
+
+class StandInChain(BaseProvider):
+    """web3 provider serving a chain of empty blocks and the logs added to it. Blocks of a fork get other hashes"""
+
+    def __init__(self, head: int):
+        super().__init__()
+        self.head = head
+        self.forked_from: Optional[int] = None
+        # a node that is syncing - this many blocks behind, and one block closer after each eth_getLogs
+        self.lag = 0
+        self.logs: List[dict] = []
+        self.calls: List[str] = []
+
+    def block_hash(self, number: int) -> str:
+        fork = int(self.forked_from is not None and number >= self.forked_from)
+        return '0x' + f'{fork:032x}{number:032x}'
+
+    def add_log(self, address: str, event: str, block: int, value: int):
+        self.logs.append({
+            'address': address, 'topics': [TOPICS[event]], 'data': '0x' + f'{value:064x}',
+            'blockNumber': hex(block), 'blockHash': self.block_hash(block), 'logIndex': hex(len(self.logs)),
+            'transactionHash': '0x' + f'{len(self.logs):064x}', 'transactionIndex': '0x0', 'removed': False
+        })
+
+    def reorg(self, from_block: int):
+        """ Replaces the blocks from @from_block on, and drops their logs """
+        self.forked_from = from_block
+        self.logs = [log for log in self.logs if _number(log['blockNumber']) < from_block]
+
+    def result(self, method: str, params: List) -> Any:
+        if method == 'eth_blockNumber':
+            return hex(self.head - self.lag)
+        if method == 'eth_getBlockByNumber':
+            number = _number(params[0])
+            if number > self.head:
+                return None
+            return {'number': hex(number), 'hash': self.block_hash(number), 'parentHash': self.block_hash(number - 1)}
+        if method == 'eth_getLogs':
+            query = params[0]
+            addresses = query['address'] if isinstance(query['address'], list) else [query['address']]
+            addresses, topics = [address.lower() for address in addresses], query['topics'][0]
+            to_block = min(_number(query['toBlock']), self.head - self.lag)
+            self.lag = max(self.lag - 1, 0)
+            return [log for log in self.logs if log['address'].lower() in addresses
+                    and log['topics'][0] in topics
+                    and _number(query['fromBlock']) <= _number(log['blockNumber']) <= to_block]
+        raise NotImplementedError(method)
+
+    def make_request(self, method, params):
+        self.calls.append(method)
+        return {'jsonrpc': '2.0', 'id': 0, 'result': self.result(method, params)}
+
+    def isConnected(self) -> bool:
+        return True
+
+
+def stand_in_chain(monkeypatch, head: int) -> StandInChain:
+    """ Points the web3 helpers and the event listener at a StandInChain """
+    chain = StandInChain(head)
+    head_cache = ChainHead(lambda: chain.head, interval=0)
+    monkeypatch.setattr(web3_module, 'w3', Web3(chain))
+    monkeypatch.setattr(web3_module, 'chain_head', head_cache)
+    monkeypatch.setattr(event_listener_module, 'chain_head', head_cache)
+    monkeypatch.setattr(web3_module, '_chain_cache', ChainCache())
+    monkeypatch.setitem(web3_module.cfg, 'eth_confirmations', CONFIG['eth_confirmations'])
+    return chain
+
+
+def tick(listener: EthEventListener) -> list:
+    """ One iteration of the listener's loop, returns the released events """
+    # pylint: disable=protected-access
+    head = listener._check_reorg(None)
+    for name, event in listener.get_new_events(head):
+        listener._add_pending(name, event)
+    return [(name, event) for name, event in listener.confirmation_handler(head)]
+
+
+@fixture
+def chain(monkeypatch):
+    return stand_in_chain(monkeypatch, head=8)
+
+
+def test_reorged_events_are_refetched(chain):
+    contract = StandInContract()
+    listener = EthEventListener(contract, CONFIG)
+    listener.register(lambda event: None, ['Transfer'])
+    assert listener.last_block == 8
+    assert tick(listener) == []
+
+    chain.add_log(contract.address, 'Transfer', 9, 100)
+    chain.head = 10
+    assert tick(listener) == []
+    assert [event.args.value for _, event in listener.pending_events] == [100]
+
+    # the transfer is replaced by one in the next block of the new chain
+    chain.reorg(9)
+    chain.add_log(contract.address, 'Transfer', 10, 200)
+    chain.head = 11
+    assert tick(listener) == []
+    assert [event.args.value for _, event in listener.pending_events] == [200]
+
+    chain.head = 12
+    released = tick(listener)
+    assert [(name, event.args.value) for name, event in released] == [('Transfer', 200)]
+    assert listener.last_block == 12
+
+
+def test_lagging_node(chain, monkeypatch):
+    monkeypatch.setattr(web3_module, 'LOGS_LAG_INTERVAL', 0)
+    contract = StandInContract()
+    listener = EthEventListener(contract, CONFIG)
+    listener.register(lambda event: None, ['Transfer'])
+    chain.add_log(contract.address, 'Transfer', 10, 100)
+    chain.add_log(contract.address, 'Transfer', 12, 200)
+    chain.head = 12
+
+    # the head came from another node, the node that answers the scan is 3 blocks behind
+    chain.lag = 3
+    lagging = metrics.counter('eth.logs.lagging').value
+    assert [event.args.value for _, event in listener.get_new_events(12)] == [100, 200]
+    assert listener.last_block == 12
+    # blocks it didn't have yet were queried again, each block once it had it
+    assert metrics.counter('eth.logs.lagging').value == lagging + 3
+
+
+def test_one_query_for_all_events(chain):
+    contract = StandInContract()
+    listener = EthEventListener(contract, CONFIG)
+    transfers, swaps = [], []
+    listener.register(transfers.append, ['Transfer'])
+    listener.register(swaps.append, ['Swap'])
+    chain.add_log(contract.address, 'Transfer', 9, 100)
+    chain.add_log(contract.address, 'Swap', 9, 7)
+    chain.add_log(contract.address, 'Swap', 10, 8)
+    # another contract's events aren't delivered
+    chain.add_log(Web3.toChecksumAddress('0x' + '4' * 40), 'Transfer', 10, 300)
+
+    for head in (10, 12):
+        chain.head = head
+        chain.calls.clear()
+        for name, event in tick(listener):
+            listener.callbacks.trigger(name, event)
+        assert chain.calls.count('eth_getLogs') == 1
+
+    # each decoded event reached only the callbacks of its own type
+    assert [(event.event, event.args.value) for event in transfers] == [('Transfer', 100)]
+    assert [(event.event, event.args.amount) for event in swaps] == [('Swap', 7), ('Swap', 8)]
+
+
+def test_one_backfill_query_for_all_events(chain):
+    contract = StandInContract()
+    chain.add_log(contract.address, 'Transfer', 3, 100)
+    chain.add_log(contract.address, 'Swap', 5, 7)
+    listener = EthEventListener(contract, CONFIG)
+
+    chain.calls.clear()
+    listener.register(lambda event: None, ['Transfer', 'Swap'], from_block=1)
+    assert chain.calls.count('eth_getLogs') == 1
+    assert [(name, event.blockNumber) for name, event in listener.pending_events] == [('Transfer', 3), ('Swap', 5)]
@@ -0,0 +1,61 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from pytest import fixture, raises
+
+from src.util.secret.lcd import LcdClient
+
+ADDRESS = 'secret1p0vgghl8rw4ukzm7geyy0f0tl29glxrtnlalue'
+TX_HASH = 'A0EA73A5E0B5F1C44F4B9A4E0C8F25B0B5D2C7C9FA5A4E8C6A6DA3FC7F76BCBE'
+
+RESPONSES = {
+    f'/auth/accounts/{ADDRESS}': {'height': '1042', 'result': {'type': 'cosmos-sdk/Account', 'value': {
+        'address': ADDRESS, 'coins': [{'denom': 'uscrt', 'amount': '1500000'}, {'denom': 'uatom', 'amount': '3'}],
+        'public_key': None, 'account_number': '17', 'sequence': '4'}}},
+    f'/txs/{TX_HASH}': {'height': '1040', 'txhash': TX_HASH, 'code': 0, 'raw_log': '[]', 'logs': []},
+    '/reg/consensus-io-exch-pubkey': {'height': '1042', 'result': {
+        'ioExchPubkey': 'hSDwCYkwp1R0i33ctD73Wg2/Og0mOBr066SpjqqbTmo='}},
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path not in RESPONSES:
+            self.send_error(404)
+            return
+        body = json.dumps(RESPONSES[self.path]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def client():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield LcdClient(f'http://127.0.0.1:{server.server_address[1]}')
+    server.shutdown()
+
+
+def test_account(client):
+    account = client.account(ADDRESS)
+    assert (account.account_number, account.sequence) == (17, 4)
+    assert account.balance('uscrt') == 1500000
+
+
+def test_tx(client):
+    tx = client.tx(TX_HASH)
+    assert tx.height == 1040 and tx.succeeded
+
+    with raises(RuntimeError):
+        client.tx('00' * 32)
+
+
+def test_consensus_io_pubkey(client):
+    assert client.consensus_io_pubkey().hex() == '8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a'
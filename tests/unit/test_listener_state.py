@@ -0,0 +1,87 @@
+from hexbytes import HexBytes
+from mongoengine import connect, disconnect
+from pytest import fixture
+from web3.datastructures import AttributeDict
+
+from src.contracts.ethereum.event_listener import EthEventListener
+from src.db.collections.listener_state import ListenerCursor, PendingEvent
+from src.util.web3 import event_from_json, event_to_json
+from tests.unit.test_event_listener import CONFIG, StandInContract, stand_in_chain, tick
+
+CURSOR = 'signer-0x1'
+
+
+@fixture
+def mongo():
+    connect('test', host='mongomock://localhost')
+    yield
+    disconnect()
+
+
+@fixture
+def chain(monkeypatch):
+    return stand_in_chain(monkeypatch, head=8)
+
+
+def test_event_json_round_trip():
+    event = AttributeDict({
+        'event': 'Swap', 'logIndex': 3, 'blockNumber': 11, 'address': '0x' + '5' * 40,
+        'blockHash': HexBytes('0x' + 'ab' * 32), 'transactionHash': HexBytes('0x' + 'cd' * 32),
+        'args': AttributeDict({
+            'from': '0x' + '6' * 40, 'amount': 10 ** 30, 'recipient': b'secret1',
+            'nested': AttributeDict({'hashes': [HexBytes('0x01'), '0x01']}),
+        }),
+    })
+
+    restored = event_from_json(event_to_json(event))
+    assert restored == event
+    # bytes come back as bytes, hex strings as strings
+    assert isinstance(restored.blockHash, HexBytes) and restored.transactionHash.hex() == '0x' + 'cd' * 32
+    assert isinstance(restored.args.recipient, HexBytes) and restored.args.recipient == b'secret1'
+    assert isinstance(restored.args.nested.hashes[0], HexBytes) and restored.args.nested.hashes[1] == '0x01'
+    assert restored.args.amount == 10 ** 30
+
+
+def test_resumes_after_restart(mongo, chain):
+    contract = StandInContract()
+    listener = EthEventListener(contract, CONFIG, cursor_name=CURSOR)
+    listener.register(lambda event: None, ['Transfer'])
+    chain.add_log(contract.address, 'Transfer', 9, 100)
+    chain.head = 10
+    assert tick(listener) == []
+    listener._save_cursor()  # pylint: disable=protected-access
+    assert ListenerCursor.last_scanned(CURSOR) == 10
+    assert PendingEvent.objects(listener=CURSOR).count() == 1
+
+    # restarted, while the chain moved on
+    chain.add_log(contract.address, 'Transfer', 11, 200)
+    chain.head = 11
+    released = []
+    restarted = EthEventListener(contract, CONFIG, cursor_name=CURSOR)
+    restarted.register(released.append, ['Transfer'])
+    # restored the pending event, and caught up from the stored cursor
+    assert restarted.last_block == 11
+    assert [event.args.value for _, event in restarted.pending_events] == [100, 200]
+
+    for name, event in tick(restarted):
+        # pylint: disable=protected-access
+        restarted.callbacks.trigger(name, event, done=lambda event=event: restarted._remove_pending(event))
+    # the restored event was released once, the one of block 11 was found and waits for confirmations
+    assert [event.args.value for event in released] == [100]
+    assert [event.args.value for _, event in restarted.pending_events] == [200]
+    assert [record.block_number for record in PendingEvent.objects(listener=CURSOR)] == [11]
+
+
+def test_pending_event_found_again(mongo, chain):
+    contract = StandInContract()
+    chain.add_log(contract.address, 'Transfer', 7, 100)
+    listener = EthEventListener(contract, CONFIG, cursor_name=CURSOR)
+    listener.register(lambda event: None, ['Transfer'], from_block=1)
+    assert len(listener.pending_events) == 1
+
+    restarted = EthEventListener(contract, CONFIG, cursor_name=CURSOR)
+    restarted.register(lambda event: None, ['Transfer'])
+    # caught up over the restored event's block - it is neither stored nor pending twice
+    restarted.add_events_in_range(['Transfer'], from_block=1, to_block=8)
+    assert [event.args.value for _, event in restarted.pending_events] == [100]
+    assert PendingEvent.objects(listener=CURSOR).count() == 1
@@ -0,0 +1,50 @@
+from threading import Thread
+from time import sleep
+
+from src.util.metrics import Histogram, InstrumentedLock, MetricsReporter, metrics
+
+
+def test_histogram():
+    histogram = Histogram('test', buckets=(1, 2, 4, 8))
+    for value in (0.5, 1.5, 1.5, 3, 100):
+        histogram.observe(value)
+
+    assert histogram.count == 5
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(0.8) == 4
+    assert histogram.quantile(1) == 100
+    assert histogram.value['mean'] == 106.5 / 5
+
+
+def test_instrumented_lock():
+    lock = InstrumentedLock('test.lock')
+    with lock:
+        pass
+    assert metrics.counter('test.lock.contended').value == 0
+
+    def hold():
+        with lock:
+            sleep(0.1)
+
+    holder = Thread(target=hold)
+    holder.start()
+    sleep(0.02)
+    with lock:
+        pass
+    holder.join()
+    assert metrics.counter('test.lock.contended').value == 1
+    assert metrics.histogram('test.lock.wait').quantile(1) >= 0.05
+
+
+def test_reporter_logs_snapshots():
+    metrics.counter('test.reported').inc(3)
+    reporter = MetricsReporter({'metrics_log_interval': 0.05})
+    lines = []
+    reporter.logger.info = lines.append
+    reporter.start()
+    sleep(0.2)
+    reporter.stop()
+    reporter.join(5)
+
+    assert len(lines) >= 2
+    assert '"test.reported": 3' in lines[-1]
@@ -0,0 +1,57 @@
+import os
+import random
+from time import perf_counter
+
+from pytest import mark
+from web3.datastructures import AttributeDict
+
+from src.contracts.ethereum.pending_events import PendingEvents
+
+N_EVENTS = 100000
+CONFIRMATIONS = 12
+
+# timing tests depend on the machine - they only run with RUN_BENCHMARKS set
+benchmark = mark.skipif(not os.environ.get('RUN_BENCHMARKS'), reason="benchmark, set RUN_BENCHMARKS to run it")
+
+
+def _event(block: int, log_index: int) -> AttributeDict:
+    return AttributeDict({'blockNumber': block, 'logIndex': log_index})
+
+
+def test_release_by_block_order():
+    pending = PendingEvents()
+    pending.push('Swap', _event(5, 1))
+    pending.push('Swap', _event(3, 0))
+    pending.push('SwapToken', _event(5, 0))
+    pending.push('Swap', _event(9, 0))
+
+    released = list(pending.release(5))
+
+    assert [(event.blockNumber, event.logIndex) for _, event in released] == [(3, 0), (5, 0), (5, 1)]
+    assert released[1][0] == 'SwapToken'
+    assert len(pending) == 1
+    assert not list(pending.release(8))
+    assert [name for name, _ in pending] == ['Swap']
+
+
+@benchmark
+def test_release_benchmark():
+    """ 100k pending events (a large backfill) released over a chain advancing one block per tick """
+    blocks = [random.randint(0, N_EVENTS // 10) for _ in range(N_EVENTS)]
+
+    pending = PendingEvents()
+    start = perf_counter()
+    for i, block in enumerate(blocks):
+        pending.push('Swap', _event(block, i))
+    insert_time = perf_counter() - start
+
+    released = 0
+    start = perf_counter()
+    for head in range(N_EVENTS // 10 + CONFIRMATIONS + 1):
+        released += sum(1 for _ in pending.release(head - CONFIRMATIONS))
+    release_time = perf_counter() - start
+
+    assert released == N_EVENTS
+    assert not pending
+    # the list based implementation this replaced needed minutes for the same workload
+    assert insert_time + release_time < 5, f"insert {insert_time:.3f}s, release {release_time:.3f}s"
@@ -0,0 +1,158 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import sleep, monotonic
+
+import requests
+from pytest import fixture, raises
+from web3 import Web3
+from web3.providers import BaseProvider
+
+from src.util.eth.provider_pool import ProviderPool, SessionHTTPProvider
+
+
+class StandInNode(ThreadingHTTPServer):
+    """Local JSON-RPC node that answers eth_blockNumber with its own id, after an injected delay"""
+
+    def __init__(self, node_id: int, delay: float = 0.0):
+        self.node_id = node_id
+        self.delay = delay
+        self.down = False
+        self.requests = []
+        super().__init__(('127.0.0.1', 0), _Handler)
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def uri(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):  # pylint: disable=invalid-name
+        node: StandInNode = self.server
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if node.down:
+            self.send_error(503)
+            return
+        sleep(node.delay)
+        calls = request if isinstance(request, list) else [request]
+        node.requests.extend(call['method'] for call in calls)
+        results = [{'jsonrpc': '2.0', 'id': call['id'], 'result': hex(node.node_id)} for call in calls]
+        body = json.dumps(results if isinstance(request, list) else results[0]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def nodes():
+    servers = [StandInNode(0, delay=0.2), StandInNode(1), StandInNode(2, delay=0.1)]
+    yield servers
+    for server in servers:
+        server.shutdown()
+
+
+def test_fastest_node(nodes):
+    pool = ProviderPool([node.uri for node in nodes])
+    w3 = Web3(pool)
+    # learn the latencies
+    for _ in nodes:
+        w3.eth.blockNumber
+    assert w3.eth.blockNumber == 1
+    assert pool.make_batch_request([{'jsonrpc': '2.0', 'id': 0, 'method': 'eth_blockNumber', 'params': []}]) == \
+        [{'jsonrpc': '2.0', 'id': 0, 'result': '0x1'}]
+
+
+def test_failover(nodes):
+    pool = ProviderPool([node.uri for node in nodes])
+    w3 = Web3(pool)
+    nodes[0].down = True
+    nodes[1].down = True
+    assert w3.eth.blockNumber == 2
+    # the failed nodes are skipped while backing off
+    assert w3.eth.blockNumber == 2
+
+    nodes[2].down = True
+    with raises(OSError):
+        w3.eth.blockNumber
+
+
+def test_hedged_read(nodes):
+    pool = ProviderPool([nodes[0].uri, nodes[2].uri], hedge_after=0.05)
+    start = monotonic()
+    assert Web3(pool).eth.blockNumber == 2
+    assert monotonic() - start < 0.2
+
+
+def test_sticky_writes(nodes):
+    pool = ProviderPool([node.uri for node in nodes])
+    for _ in range(3):
+        pool.make_request('eth_sendRawTransaction', ['0x00'])
+    assert nodes[0].requests == ['eth_sendRawTransaction'] * 3
+
+    nodes[0].down = True
+    pool.make_request('eth_sendRawTransaction', ['0x00'])
+    nodes[0].down = False
+    pool.make_request('eth_sendRawTransaction', ['0x00'])
+    moved_to = [node for node in nodes[1:] if node.requests]
+    assert len(moved_to) == 1 and moved_to[0].requests == ['eth_sendRawTransaction'] * 2
+
+
+def test_parallel_requests(nodes):
+    provider = SessionHTTPProvider(nodes[0].uri)
+    threads = [Thread(target=provider.make_request, args=('eth_blockNumber', [])) for _ in range(4)]
+    start = monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 4 requests of 0.2 seconds each, served concurrently
+    assert monotonic() - start < 0.6
+    assert nodes[0].requests == ['eth_blockNumber'] * 4
+
+
+class FailingProvider(BaseProvider):
+    """ Raises @error on every request """
+
+    def __init__(self, error: Exception):
+        super().__init__()
+        self.error = error
+        self.requests = 0
+
+    def make_request(self, method, params):
+        self.requests += 1
+        raise self.error
+
+
+def test_query_timeout_not_held_against_node():
+    providers = {'a': FailingProvider(requests.ReadTimeout('read timed out')), 'b': FailingProvider(OSError())}
+    pool = ProviderPool(list(providers), provider_factory=providers.get)
+
+    # the query was too large - neither retried on the other node, nor counted as a failure
+    with raises(requests.ReadTimeout):
+        pool.make_request('eth_getLogs', [{}])
+    assert providers['b'].requests == 0
+    assert all(endpoint.healthy and endpoint.failures == 0 for endpoint in pool.endpoints)
+
+    # the same error on other requests is the node's
+    with raises(OSError):
+        pool.make_request('eth_blockNumber', [])
+    assert providers['b'].requests == 1
+    assert not any(endpoint.healthy for endpoint in pool.endpoints)
+
+
+def test_set_aside_last(nodes):
+    pool = ProviderPool([node.uri for node in nodes])
+    w3 = Web3(pool)
+    for _ in nodes:
+        w3.eth.blockNumber
+    assert w3.eth.blockNumber == 1
+
+    pool.set_aside_last()
+    assert w3.eth.blockNumber == 2
+    assert all(endpoint.failures == 0 for endpoint in pool.endpoints)
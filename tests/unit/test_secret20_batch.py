@@ -0,0 +1,202 @@
+import json
+from hexbytes import HexBytes
+from mongoengine import connect, disconnect, NotUniqueError
+from pytest import fixture, raises
+from web3.datastructures import AttributeDict
+
+from src.contracts.ethereum.multisig_wallet import MultisigWallet
+from src.db.collections.eth_swap import Status, Swap
+from src.db.collections.secret_sequence import SecretSequence
+from src.db.collections.swaptrackerobject import SwapTrackerObject
+from src.leader.secret20 import leader as leader_module, manager as manager_module
+from src.leader.secret20.leader import Secret20Leader
+from src.leader.secret20.manager import SecretManager
+from src.signer.secret20.signer import SecretAccount
+from src.util.common import Token
+from src.util.logger import get_logger
+from src.util.secret.lcd import TxResponse
+from src.util.secret.sequence import SequenceAllocator
+
+MULTISIG = SecretAccount('secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp', 'ms2')
+RECIPIENT = 'secret1ljptw8mf5wk9n69j2v5vl4w2laqlrgspxykanp'
+CONFIG = {'scrt_swap_address': 'secret1swap', 'chain_id': 'secret-2', 'enclave_key': 'io-master-cert.der',
+          'swap_code_hash': '0' * 64}
+
+
+class StandInWallet:
+    """ Accepts every swap event, see _event """
+    verify_destination = staticmethod(lambda event: True)
+    extract_amount = staticmethod(lambda event: event.args.value)
+    parse_swap_event = staticmethod(MultisigWallet.parse_swap_event)
+
+
+def _event(block: int, index: int, value: int = 100) -> AttributeDict:
+    return AttributeDict({'event': 'Swap', 'blockNumber': block,
+                          'transactionHash': HexBytes(f'0x{block:032x}{index:032x}'),
+                          'args': AttributeDict({'recipient': RECIPIENT.encode(), 'value': value})})
+
+
+@fixture
+def mongo():
+    connect('test', host='mongomock://localhost')
+    yield
+    disconnect()
+
+
+@fixture
+def manager(mongo, monkeypatch):
+    """ A manager minting batches of up to 3 swaps, whose txs are recorded instead of created by secretcli """
+    SecretSequence.sync(MULTISIG.address, 17, 4)
+    # as when catching up
+    SwapTrackerObject.last_processed('Ethereum')
+    txs = []
+
+    def create_tx(_contract, mints, *_):
+        txs.append(mints)
+        return json.dumps({'value': {'msg': mints}})
+
+    monkeypatch.setattr(manager_module, 'create_unsigned_batch_tx', create_tx)
+    secret_manager = SecretManager.__new__(SecretManager)
+    secret_manager.contract = StandInWallet()
+    secret_manager.s20_map = {'native': Token('secret1seth', 'seth')}
+    secret_manager.config = CONFIG
+    secret_manager.multisig = MULTISIG
+    secret_manager.logger = get_logger(logger_name='test')
+    secret_manager.sequences = SequenceAllocator(MULTISIG.address)
+    secret_manager.account_num = 17
+    secret_manager.batch_size = 3
+    secret_manager.batch_window = 60
+    secret_manager.batch = []
+    secret_manager.batch_started = 0.0
+    secret_manager.batch_lock = manager_module.RLock()
+    secret_manager.txs = txs
+    return secret_manager
+
+
+def _batches():
+    """ The saved swaps, as lists of tx hashes grouped by the first swap of their batch """
+    batches = {}
+    for swap in Swap.objects.order_by('src_tx_hash'):
+        first = swap.batch or swap
+        batches.setdefault(first.src_tx_hash, []).append(swap.src_tx_hash)
+    return list(batches.values())
+
+
+def test_batch_fill(manager):
+    events = [_event(10, i) for i in range(4)]
+    for event in events[:2]:
+        manager._handle(event)  # pylint: disable=protected-access
+    # waiting for more swaps
+    assert Swap.objects.count() == 0
+    assert SwapTrackerObject.last_processed('Ethereum') == -1
+
+    manager._handle(events[2])  # pylint: disable=protected-access
+    assert _batches() == [[event.transactionHash.hex() for event in events[:3]]]
+    assert len(manager.txs) == 1 and len(manager.txs[0]) == 3
+    assert {swap.sequence for swap in Swap.objects} == {4}
+    assert SwapTrackerObject.last_processed('Ethereum') == 10
+
+    # a new batch starts
+    manager._handle(events[3])  # pylint: disable=protected-access
+    assert [swap.src_tx_hash for swap, _, _ in manager.batch] == [events[3].transactionHash.hex()]
+
+
+def test_window_flush(manager, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(manager_module, 'monotonic', lambda: now[0])
+    manager._handle(_event(10, 0))  # pylint: disable=protected-access
+    manager._handle(_event(11, 0))  # pylint: disable=protected-access
+
+    now[0] += manager.batch_window - 1
+    manager._flush_if_due()  # pylint: disable=protected-access
+    assert Swap.objects.count() == 0
+    assert SwapTrackerObject.last_processed('Ethereum') == -1
+
+    now[0] += 1
+    manager._flush_if_due()  # pylint: disable=protected-access
+    assert len(_batches()) == 1 and len(_batches()[0]) == 2
+    # advanced past the batch only once it was saved
+    assert SwapTrackerObject.last_processed('Ethereum') == 11
+
+
+def test_failed_save_releases_sequence(manager, monkeypatch):
+    events = [_event(10, i) for i in range(3)]
+    failing = events[1].transactionHash.hex()
+    save = Swap.save
+
+    def save_or_fail(swap, *args, **kwargs):
+        if swap.src_tx_hash == failing:
+            raise NotUniqueError(f"duplicate {failing}")
+        return save(swap, *args, **kwargs)
+
+    monkeypatch.setattr(Swap, 'save', save_or_fail)
+    batch = [(Swap(src_tx_hash=event.transactionHash.hex(), amount='100', unsigned_tx='', status=Status.SWAP_UNSIGNED),
+              {}) for event in events]
+    with raises(NotUniqueError):
+        manager._save_batch(batch)  # pylint: disable=protected-access
+
+    # nothing of the batch is kept, and its sequence goes to the next tx
+    assert Swap.objects.count() == 0
+    assert manager.sequences.reserve() == 4
+
+
+def test_released_sequence_after_later_reservation(manager):
+    sequence = manager.sequences.reserve()
+    manager.sequences.reserve()
+    resyncs = []
+    manager.sequences.gap = lambda: resyncs.append(sequence)
+
+    # a later tx has a sequence already - there's a gap now
+    manager.sequences.release(sequence)
+    assert resyncs == [4]
+
+
+def _leader(manager) -> Secret20Leader:
+    leader = Secret20Leader.__new__(Secret20Leader)
+    leader.manager = manager
+    leader.logger = get_logger(logger_name='test')
+    manager.update_sequence = lambda: manager.gaps.append(True)
+    manager.gaps = []
+    return leader
+
+
+def _submitted_batch(manager) -> Swap:
+    for i in range(3):
+        manager._handle(_event(10, i))  # pylint: disable=protected-access
+    first = Swap.objects.get(batch=None)
+    first.status = Status.SWAP_SUBMITTED
+    first.dst_tx_hash = 'AB' * 32
+    first.save_batch()
+    assert {swap.status for swap in Swap.objects} == {Status.SWAP_SUBMITTED}
+    return first
+
+
+def test_batch_confirmed(manager, monkeypatch):
+    first = _submitted_batch(manager)
+    monkeypatch.setattr(leader_module, 'query_tx', lambda tx_hash: TxResponse(tx_hash, 1040, 0, '[]'))
+
+    assert _leader(manager)._broadcast_validation(first)  # pylint: disable=protected-access
+    assert {swap.status for swap in Swap.objects} == {Status.SWAP_CONFIRMED}
+
+
+def test_batch_failed(manager, monkeypatch):
+    first = _submitted_batch(manager)
+    monkeypatch.setattr(leader_module, 'query_tx', lambda tx_hash: TxResponse(tx_hash, 1040, 5, 'out of gas'))
+    leader = _leader(manager)
+
+    assert not leader._broadcast_validation(first)  # pylint: disable=protected-access
+    assert {swap.status for swap in Swap.objects} == {Status.SWAP_FAILED}
+    assert manager.gaps == [True]
+
+
+def test_single_swap_uses_mint_status(manager, monkeypatch):
+    manager.batch_size = 1
+    manager._handle(_event(10, 0))  # pylint: disable=protected-access
+    swap = Swap.objects.get()
+    monkeypatch.setattr(leader_module, 'query_data_success',
+                        lambda tx_hash: {'mint_from_ext_chain': {'status': 'success'}})
+    queried = []
+    monkeypatch.setattr(leader_module, 'query_tx', queried.append)
+
+    assert Secret20Leader._is_confirmed(swap)  # pylint: disable=protected-access
+    assert not queried
@@ -0,0 +1,98 @@
+import json
+
+from mongoengine import connect, disconnect
+from pytest import fixture
+from web3.datastructures import AttributeDict
+
+from src.db.collections.eth_swap import Status, Swap
+from src.signer.secret20.signer import Secret20Signer
+from src.util.logger import get_logger
+
+RECIPIENT = 'secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp'
+
+
+class StandInMultisig:
+    """ Serves the swap events of @logs (by tx hash), and records the bulk queries """
+
+    def __init__(self, logs: dict):
+        self.logs = logs
+        self.queries = []
+
+    def get_events_by_txs(self, tx_ids):
+        self.queries.append(tx_ids)
+        return [self.logs.get(tx_id) for tx_id in tx_ids]
+
+    def get_events_by_tx(self, tx_id):
+        raise AssertionError(f"queried {tx_id} on its own")
+
+    @staticmethod
+    def extract_amount(tx_log) -> int:
+        return tx_log.args.value
+
+    @staticmethod
+    def extract_addr(tx_log) -> str:
+        return tx_log.args.recipient.decode()
+
+
+@fixture
+def mongo():
+    connect('test', host='mongomock://localhost')
+    yield
+    disconnect()
+
+
+def _mint(tx_hash: str, amount: int) -> dict:
+    # messages are left unencrypted, see _signer
+    return {'value': {'msg': json.dumps({'mint_from_ext_chain': {
+        'identifier': tx_hash, 'amount': str(amount), 'address': RECIPIENT}})}}
+
+
+def _log(amount: int) -> AttributeDict:
+    return AttributeDict({'args': AttributeDict({'value': amount, 'recipient': RECIPIENT.encode()})})
+
+
+def _batch(amounts: dict, minted: dict) -> Swap:
+    """ Stores a batch of swaps of @amounts, minted by a tx of @minted amounts """
+    unsigned_tx = json.dumps({'value': {'msg': [_mint(tx_hash, amount) for tx_hash, amount in minted.items()]}})
+    first, *others = amounts
+    swap = Swap(src_tx_hash=first, amount=str(amounts[first]), status=Status.SWAP_UNSIGNED, unsigned_tx=unsigned_tx)
+    swap.save()
+    for tx_hash in others:
+        Swap(src_tx_hash=tx_hash, amount=str(amounts[tx_hash]), status=Status.SWAP_UNSIGNED, unsigned_tx='',
+             batch=swap).save()
+    return swap
+
+
+def _signer(monkeypatch, contract: StandInMultisig) -> Secret20Signer:
+    signer = Secret20Signer.__new__(Secret20Signer)
+    signer.contract = contract
+    signer.logger = get_logger(logger_name='test')
+    monkeypatch.setattr(Secret20Signer, '_decrypt', staticmethod(lambda msg: ('0' * 64, msg['value']['msg'])))
+    return signer
+
+
+def test_batch_logs_fetched_at_once(mongo, monkeypatch):
+    amounts = {'0xa': 10, '0xb': 20, '0xc': 30}
+    contract = StandInMultisig({tx_hash: _log(amount) for tx_hash, amount in amounts.items()})
+    signer = _signer(monkeypatch, contract)
+
+    assert signer._is_valid(_batch(amounts, amounts))  # pylint: disable=protected-access
+    assert [sorted(query) for query in contract.queries] == [sorted(amounts)]
+
+
+def test_batch_with_invalid_mint(mongo, monkeypatch):
+    amounts = {'0xa': 10, '0xb': 20}
+    # the on-chain tx of 0xb swapped less than the db holds
+    contract = StandInMultisig({'0xa': _log(10), '0xb': _log(2)})
+    signer = _signer(monkeypatch, contract)
+
+    assert not signer._is_valid(_batch(amounts, amounts))  # pylint: disable=protected-access
+    assert len(contract.queries) == 1
+
+
+def test_batch_with_missing_log(mongo, monkeypatch):
+    amounts = {'0xa': 10, '0xb': 20}
+    contract = StandInMultisig({'0xb': _log(20)})
+    signer = _signer(monkeypatch, contract)
+
+    assert not signer._is_valid(_batch(amounts, amounts))  # pylint: disable=protected-access
@@ -0,0 +1,100 @@
+import base64
+import json
+
+from pytest import raises
+
+from src.contracts.secret.secret_contract import mint_json
+from src.util import secretcli
+from src.util.secret.encryption import SecretEncryption, execute_contract_tx, open_sealed
+
+# RFC 7748, section 6.1
+ALICE_PRIVATE = bytes.fromhex('77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a')
+ALICE_PUBLIC = bytes.fromhex('8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a')
+BOB_PRIVATE = bytes.fromhex('5dab087e624a8a4b79e17f8b83800ee66f3bb1292618b6fd1c2f8b27ff88e0eb')
+BOB_PUBLIC = bytes.fromhex('de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f')
+SHARED_SECRET = bytes.fromhex('4a5d9d5ba4ce2de1728e3bf480350f25e07e21c947d19e3376f09b3c1e161742')
+
+CODE_HASH = '309757D609FB932B5DD0E101A2D018E80FC11347B3A8EB285B826B0E2CBDA236'
+MSG = json.dumps({'mint_from_ext_chain': {'address': 'secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp',
+                                          'amount': '1000', 'identifier': '0xabc'}})
+
+
+def test_key_agreement():
+    # the transaction key is ours, the consensus IO key is the enclave's
+    encryption = SecretEncryption(ALICE_PRIVATE, BOB_PUBLIC)
+    assert encryption.public_key == ALICE_PUBLIC
+    # pylint: disable=protected-access
+    assert encryption._shared_secret == SHARED_SECRET
+
+    nonce = bytes(range(32))
+    # the enclave derives the same key, from our public key sent with the message
+    assert SecretEncryption(BOB_PRIVATE, ALICE_PUBLIC).key(nonce) == encryption.key(nonce)
+    assert encryption.key(bytes(32)) != encryption.key(nonce)
+
+
+def test_encrypt_decrypt():
+    encryption = SecretEncryption(ALICE_PRIVATE, BOB_PUBLIC)
+    encrypted = encryption.encrypt(CODE_HASH, MSG)
+    nonce, public_key, sealed = encrypted[:32], encrypted[32:64], encrypted[64:]
+    assert public_key == ALICE_PUBLIC
+
+    # as the enclave reads it
+    plaintext = open_sealed(SecretEncryption(BOB_PRIVATE, public_key).key(nonce), sealed)
+    assert plaintext == (CODE_HASH.lower() + MSG).encode()
+    assert encryption.decrypt(encrypted) == plaintext
+
+    # a random nonce per message
+    assert encryption.encrypt(CODE_HASH, MSG)[:32] != nonce
+    assert encryption.encrypt(CODE_HASH, MSG, nonce=nonce) == encrypted
+
+    with raises(ValueError):
+        encryption.decrypt(encrypted[:-1] + bytes([encrypted[-1] ^ 1]))
+
+
+def test_execute_contract_tx():
+    encrypted = SecretEncryption(ALICE_PRIVATE, BOB_PUBLIC).encrypt(CODE_HASH, MSG)
+    tx = execute_contract_tx('secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp',
+                             'secret1hx84ff3h4m8yuvey36g9590pw9mm2p55cwqnm6', encrypted)
+
+    msg = tx['value']['msg'][0]
+    assert msg['type'] == 'wasm/MsgExecuteContract'
+    assert base64.b64decode(msg['value']['msg']) == encrypted
+    assert tx['value']['fee'] == {'amount': [], 'gas': '200000'}
+
+
+def test_batch_tx(monkeypatch):
+    encryption = SecretEncryption(ALICE_PRIVATE, BOB_PUBLIC)
+    monkeypatch.setattr(secretcli, 'encryption', lambda: encryption)
+    mints = [mint_json(str(amount), f'0x{amount:064x}', 'secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp', 'secret1xyz')
+             for amount in range(1, 4)]
+
+    tx = json.loads(secretcli.create_unsigned_batch_tx('secret1hx84ff3h4m8yuvey36g9590pw9mm2p55cwqnm6', mints,
+                                                       'holodeck', '', CODE_HASH, 'secret1sender'))
+    # a message per swap, with the gas of all of them
+    assert tx['value']['fee']['gas'] == '600000'
+    decrypted = [encryption.decrypt(base64.b64decode(msg['value']['msg'])).decode()[64:] for msg in tx['value']['msg']]
+    assert [json.loads(msg) for msg in decrypted] == mints
+
+
+def test_decrypt(monkeypatch):
+    encryption = SecretEncryption(ALICE_PRIVATE, BOB_PUBLIC)
+    monkeypatch.setattr(secretcli, 'encryption', lambda: encryption)
+    data = base64.b64encode(encryption.encrypt(CODE_HASH, MSG)).decode()
+    assert secretcli.decrypt(data) == (CODE_HASH.lower(), MSG)
+
+    # the code hash and the message, as 'secretcli query compute decrypt' prints them
+    monkeypatch.setattr(secretcli, 'encryption', lambda: None)
+    monkeypatch.setattr(secretcli, 'run_secret_cli', lambda cmd: f'{CODE_HASH.lower()}{MSG}\n')
+    assert secretcli.decrypt(data) == (CODE_HASH.lower(), MSG)
+
+    # with a label, and the hash apart from the message
+    monkeypatch.setattr(secretcli, 'run_secret_cli', lambda cmd: f'Decrypted data: {CODE_HASH.lower()} {MSG}\n')
+    assert secretcli.decrypt(data) == (CODE_HASH.lower(), MSG)
+
+    monkeypatch.setattr(secretcli, 'run_secret_cli', lambda cmd: MSG)
+    with raises(RuntimeError):
+        secretcli.decrypt(data)
+    # a hash inside the message isn't the code hash
+    monkeypatch.setattr(secretcli, 'run_secret_cli', lambda cmd: f'{{"hash": "{CODE_HASH}"}}{MSG}')
+    with raises(RuntimeError):
+        secretcli.decrypt(data)
@@ -0,0 +1,122 @@
+import base64
+import json
+from hashlib import sha256
+
+from ecdsa import SECP256k1, VerifyingKey
+from ecdsa.util import sigdecode_string
+from pytest import raises
+
+from src.util.secret.multisig import MultisigKey, bech32_decode, bech32_encode, compact_bit_array, multisign, \
+    multisignature, pubkey_address
+from src.util.secret.signing import LocalSecretKey, sign_tx, std_sign_bytes
+
+UNSIGNED_TX = json.dumps({'type': 'cosmos-sdk/StdTx', 'value': {
+    'msg': [{'type': 'wasm/MsgExecuteContract', 'value': {
+        'sender': 'secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp',
+        'contract': 'secret1k48x38gdrunurennpemt4ns45cphlvuvg9kfzs',
+        'msg': 'c2VjcmV0', 'callback_code_hash': '', 'sent_funds': [], 'callback_sig': None}}],
+    'fee': {'amount': [{'denom': 'uscrt', 'amount': '50000'}], 'gas': '200000'}, 'signatures': None, 'memo': ''}})
+
+KEYS = [LocalSecretKey(bytes([i + 1]) * 32) for i in range(3)]
+
+
+def _secretpub(key: LocalSecretKey) -> str:
+    return bech32_encode('secretpub', bytes.fromhex('eb5ae98721') + key.public_key)
+
+
+def test_bech32():
+    # BIP 173 test vector
+    assert bech32_decode('abcdef1qpzry9x8gf2tvdw0s3jn54khce6mua7lmqqqxw') == \
+        ('abcdef', bytes.fromhex('00443214c74254b635cf84653a56d7c675be77df'))
+    with raises(ValueError):
+        bech32_decode('abcdef1qpzry9x8gf2tvdw0s3jn54khce6mua7lmqqqxx')
+
+    address = 'secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp'
+    assert bech32_encode(*bech32_decode(address)) == address
+
+
+def test_multisignature_encoding():
+    # 3 keys, signed by the first and the last: 3 extra bits, bits 0 and 2 set
+    assert compact_bit_array(3, [0, 2]) == bytes.fromhex('0803' '1201a0')
+    # no extra bits when the size is a multiple of 8
+    assert compact_bit_array(8, [7]) == bytes.fromhex('120101')
+
+    assert multisignature(3, {2: b'\x22' * 64, 0: b'\x11' * 64}) == \
+        bytes.fromhex('0a05' '0803' '1201a0') + b'\x12\x40' + b'\x11' * 64 + b'\x12\x40' + b'\x22' * 64
+
+
+def test_multisign():
+    multisig = MultisigKey.from_bech32(2, ','.join(_secretpub(key) for key in KEYS))
+    # like 'secretcli keys add --multisig', the keys are sorted by address
+    assert [pubkey_address(key) for key in multisig.pubkeys] == sorted(pubkey_address(key.public_key) for key in KEYS)
+
+    signatures = [sign_tx(UNSIGNED_TX, key, 'holodeck', 17, 4) for key in KEYS[:2]]
+    signed = json.loads(multisign(UNSIGNED_TX, multisig, signatures, 'holodeck', 17, 4))
+
+    signature = signed['value']['signatures'][0]
+    assert signature['pub_key'] == multisig.to_json()
+    assert signature['pub_key']['value']['threshold'] == '2'
+    assert signed['value']['msg'] == json.loads(UNSIGNED_TX)['value']['msg']
+
+    indexes = sorted(multisig.pubkeys.index(key.public_key) for key in KEYS[:2])
+    encoded = base64.b64decode(signature['signature'])
+    assert encoded.startswith(bytes.fromhex('0a05') + compact_bit_array(3, indexes))
+
+    sign_bytes = std_sign_bytes(UNSIGNED_TX, 'holodeck', 17, 4)
+    for i, index in enumerate(indexes):
+        sig = encoded[7 + i * 66 + 2:7 + (i + 1) * 66]
+        VerifyingKey.from_string(multisig.pubkeys[index], curve=SECP256k1).verify(sig, sign_bytes, hashfunc=sha256,
+                                                                                  sigdecode=sigdecode_string)
+
+
+def test_multisign_rejects():
+    multisig = MultisigKey.from_bech32(2, [_secretpub(key) for key in KEYS])
+    signature = sign_tx(UNSIGNED_TX, KEYS[0], 'holodeck', 17, 4)
+
+    with raises(RuntimeError):
+        multisign(UNSIGNED_TX, multisig, [signature], 'holodeck', 17, 4)
+    # signed for another sequence
+    with raises(RuntimeError):
+        multisign(UNSIGNED_TX, multisig, [signature, sign_tx(UNSIGNED_TX, KEYS[1], 'holodeck', 17, 5)],
+                  'holodeck', 17, 4)
+    # not one of the multisig's keys
+    with raises(RuntimeError):
+        multisign(UNSIGNED_TX, multisig, [signature, sign_tx(UNSIGNED_TX, LocalSecretKey(b'\x09' * 32), 'holodeck',
+                                                             17, 4)], 'holodeck', 17, 4)
+
+
+# UNSIGNED_TX ('holodeck', account 17, sequence 4) multisigned by a 2 of 3 multisig of KEYS, with the signatures of
+# KEYS[0] and KEYS[2] - in the layout 'secretcli tx multisign' prints: StdTx fields in amino order, keys sorted by
+# address, and an amino Multisignature. tests/integration/test_multisign.py compares with a live secretcli
+GOLDEN_SIGNATURES = [
+    '{"pub_key":{"type":"tendermint/PubKeySecp256k1","value":"AxuExVZ7EmRAmV0+1aq6BWXXHhg0YEgZ/5wX9enV3QeP"},'
+    '"signature":"tXbMB7zEP/wmOCNsOBUMPgqfJyOhK7nu33P2MAfSCUsvVXukwGN5GMF2/P7Jfo6YP62SUqilY5p2LS1HN/1KIw=="}',
+    '{"pub_key":{"type":"tendermint/PubKeySecp256k1","value":"AlMf5gaBNFA9JyMTMifIZ6yPpsg8U36aRMPFvb3LH+M3"},'
+    '"signature":"dTUKZwH/LIt/rxG/okE5oC0bLLbZXfqRucNjAgG1hj5Zpoi3Xh/RKC3/4Eu6p/fwE4a8J//yceTXoU3Bny7CdA=="}',
+]
+GOLDEN_MULTISIGNED = {'type': 'cosmos-sdk/StdTx', 'value': {
+    'msg': json.loads(UNSIGNED_TX)['value']['msg'],
+    'fee': {'amount': [{'denom': 'uscrt', 'amount': '50000'}], 'gas': '200000'},
+    'signatures': [{
+        'pub_key': {'type': 'tendermint/PubKeyMultisigThreshold', 'value': {'threshold': '2', 'pubkeys': [
+            {'type': 'tendermint/PubKeySecp256k1', 'value': 'AlMf5gaBNFA9JyMTMifIZ6yPpsg8U36aRMPFvb3LH+M3'},
+            {'type': 'tendermint/PubKeySecp256k1', 'value': 'AxuExVZ7EmRAmV0+1aq6BWXXHhg0YEgZ/5wX9enV3QeP'},
+            {'type': 'tendermint/PubKeySecp256k1', 'value': 'Ak1LbNE2EDLKm9KuudkAqk1F2erYCslCM3TEUaclTQdm'},
+        ]}},
+        'signature': 'CgUIAxIBwBJAdTUKZwH/LIt/rxG/okE5oC0bLLbZXfqRucNjAgG1hj5Zpoi3Xh/RKC3/4Eu6p/fwE4a8J//yceTXoU3Bny7CdBJA'
+                     'tXbMB7zEP/wmOCNsOBUMPgqfJyOhK7nu33P2MAfSCUsvVXukwGN5GMF2/P7Jfo6YP62SUqilY5p2LS1HN/1KIw==',
+    }],
+    'memo': '',
+}}
+
+
+def test_multisign_golden():
+    multisig = MultisigKey.from_bech32(2, [_secretpub(key) for key in KEYS])
+    # the signers sign deterministically, like secretcli
+    assert [json.loads(sign_tx(UNSIGNED_TX, KEYS[i], 'holodeck', 17, 4)) for i in (0, 2)] == \
+        [json.loads(signature) for signature in GOLDEN_SIGNATURES]
+
+    signed = multisign(UNSIGNED_TX, multisig, GOLDEN_SIGNATURES, 'holodeck', 17, 4)
+    # same values, and same field order
+    assert json.loads(signed, object_pairs_hook=list) == \
+        json.loads(json.dumps(GOLDEN_MULTISIGNED), object_pairs_hook=list)
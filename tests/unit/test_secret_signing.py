@@ -0,0 +1,93 @@
+import base64
+import json
+from hashlib import sha256
+
+from ecdsa import SECP256k1, SigningKey, VerifyingKey
+from ecdsa.util import sigdecode_string
+from pytest import raises
+
+from src.util.crypto_store.crypto_manager import CryptoManagerBase
+from src.util.secret.signing import CryptoStoreSecretKey, LocalSecretKey, sign_tx, std_sign_bytes
+
+PRIVATE_KEY = bytes.fromhex('a2e1b2c8f9a0d3b4c5e6f708192a3b4c5d6e7f8091a2b3c4d5e6f708192a3b4c')
+
+# as generated by 'secretcli tx compute execute ... --generate-only'
+UNSIGNED_TX = {'type': 'cosmos-sdk/StdTx', 'value': {
+    'msg': [{'type': 'wasm/MsgExecuteContract', 'value': {
+        'sender': 'secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp',
+        'contract': 'secret1k48x38gdrunurennpemt4ns45cphlvuvg9kfzs',
+        'msg': 'c2VjcmV0<&>', 'callback_code_hash': '', 'sent_funds': [], 'callback_sig': None}}],
+    'fee': {'amount': None, 'gas': '200000'}, 'signatures': None, 'memo': ''}}
+
+SIGN_BYTES = (
+    b'{"account_number":"17","chain_id":"holodeck","fee":{"amount":[],"gas":"200000"},"memo":"",'
+    b'"msgs":[{"type":"wasm/MsgExecuteContract","value":{"callback_code_hash":"","callback_sig":null,'
+    b'"contract":"secret1k48x38gdrunurennpemt4ns45cphlvuvg9kfzs","msg":"c2VjcmV0\\u003c\\u0026\\u003e",'
+    b'"sender":"secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp","sent_funds":[]}}],"sequence":"4"}'
+)
+
+
+def _verify(signed: str, sign_bytes: bytes) -> bytes:
+    res = json.loads(signed)
+    assert res['pub_key']['type'] == 'tendermint/PubKeySecp256k1'
+    public_key = VerifyingKey.from_string(base64.b64decode(res['pub_key']['value']), curve=SECP256k1)
+    signature = base64.b64decode(res['signature'])
+    assert public_key.verify(signature, sign_bytes, hashfunc=sha256, sigdecode=sigdecode_string)
+    # low s, like the node requires
+    assert int.from_bytes(signature[32:], 'big') <= SECP256k1.order // 2
+    return signature
+
+
+def test_sign_bytes():
+    assert std_sign_bytes(json.dumps(UNSIGNED_TX), 'holodeck', 17, 4) == SIGN_BYTES
+
+
+def test_sign_local_key():
+    key = LocalSecretKey(PRIVATE_KEY)
+    signed = sign_tx(json.dumps(UNSIGNED_TX), key, 'holodeck', 17, 4)
+    signature = _verify(signed, SIGN_BYTES)
+
+    # deterministic, so every signer run produces the same signature
+    assert sign_tx(UNSIGNED_TX, key, 'holodeck', 17, 4) == signed
+    assert _verify(sign_tx(UNSIGNED_TX, key, 'holodeck', 17, 5), SIGN_BYTES.replace(b'"4"', b'"5"')) != signature
+
+    with raises(RuntimeError):
+        sign_tx('{"value": {}}', key, 'holodeck', 17, 4)
+
+
+class _HighSStore(CryptoManagerBase):
+    """ Signs like the crypto stores do - (r, s, v) of a hex digest - but always with a high s """
+
+    def __init__(self):
+        self._key = SigningKey.from_string(PRIVATE_KEY, curve=SECP256k1)
+        self.public_key = self._key.verifying_key.to_string()
+
+    def sign(self, tx_hash: str):
+        r, s = self._key.sign_digest_deterministic(bytes.fromhex(tx_hash), hashfunc=sha256,
+                                                   sigencode=lambda r, s, order: (r, s))
+        s = max(s, SECP256k1.order - s)
+        return r, s, 27
+
+
+def test_sign_crypto_store():
+    key = CryptoStoreSecretKey(_HighSStore())
+    assert key.public_key == LocalSecretKey(PRIVATE_KEY).public_key
+
+    signed = sign_tx(UNSIGNED_TX, key, 'holodeck', 17, 4)
+    _verify(signed, SIGN_BYTES)
+    assert signed == sign_tx(UNSIGNED_TX, LocalSecretKey(PRIVATE_KEY), 'holodeck', 17, 4)
+
+
+def test_crypto_store_public_key():
+    store = _HighSStore()
+    raw, compressed = store.public_key, LocalSecretKey(PRIVATE_KEY).public_key
+    # raw (x || y), uncompressed and compressed keys
+    assert CryptoStoreSecretKey(store, b'\x04' + raw).public_key == compressed
+    assert CryptoStoreSecretKey(store, compressed).public_key == compressed
+
+    store.public_key = b''
+    with raises(ValueError):
+        CryptoStoreSecretKey(store)
+    for invalid in (compressed[1:], b'\x05' + compressed[1:], b'\x02' + raw):
+        with raises(ValueError):
+            CryptoStoreSecretKey(store, invalid)
@@ -0,0 +1,56 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from src.util.metrics import metrics
+from src.util.secret import sequence as sequence_module
+from src.util.secret.lcd import Account
+from src.util.secret.sequence import SequenceAllocator
+
+ADDRESS = 'secret1k798cssp56ndy7nhjdwml90qy933qp3l0kywtp'
+
+
+class _Sequences:
+    """ In-memory stand-in of the SecretSequence collection """
+    docs = {}
+
+    @classmethod
+    def get(cls, account):
+        return cls.docs.get(account)
+
+    @classmethod
+    def reserve(cls, account):
+        doc = cls.docs[account]
+        doc.next_sequence += 1
+        return doc.next_sequence - 1
+
+    @classmethod
+    def sync(cls, account, account_number, sequence):
+        cls.docs[account] = SimpleNamespace(account_number=account_number, next_sequence=sequence,
+                                            resynced_on=datetime.utcnow())
+
+
+def test_reserve_and_resync(monkeypatch):
+    chain = {'account_number': '17', 'sequence': '4'}
+    queries = []
+    monkeypatch.setattr(sequence_module, 'SecretSequence', _Sequences)
+    monkeypatch.setattr(sequence_module, 'account_info', lambda address: queries.append(address) or Account.from_json(
+        {'value': dict(chain, address=address)}))
+    monkeypatch.setattr(_Sequences, 'docs', {})
+    resyncs = metrics.counter('secret.sequence.resyncs').value
+
+    allocator = SequenceAllocator(ADDRESS, resync_cooldown=60)
+    assert allocator.account_number == 17
+    assert [allocator.reserve() for _ in range(3)] == [4, 5, 6]
+
+    # the tx with sequence 5 failed - and so do the ones after it, but one resync is enough
+    chain['sequence'] = '5'
+    _Sequences.docs[ADDRESS].resynced_on = datetime(2020, 1, 1)
+    for _ in range(3):
+        allocator.gap()
+    assert allocator.reserve() == 5
+    assert len(queries) == 2
+    assert metrics.counter('secret.sequence.resyncs').value - resyncs == 2
+
+    # the db already knows the account - a restart doesn't query the chain
+    assert SequenceAllocator(ADDRESS).reserve() == 6
+    assert len(queries) == 2
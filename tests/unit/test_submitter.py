@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from pytest import raises
+
+from src.contracts.ethereum import submitter as submitter_module
+from src.contracts.ethereum.submitter import TransactionSubmitter, submitter
+
+ACCOUNT = '0xef06222f18a008cd3635a8325208fc0ff934d830'
+
+
+class _Contract:
+    """ Builds 'transactions' that are just their nonce """
+
+    @staticmethod
+    def raw_transaction(account, value, data, gas_price, gas_limit=None, nonce=None):  # pylint: disable=unused-argument
+        return nonce
+
+    @staticmethod
+    def sign_transaction(tx, signer):  # pylint: disable=unused-argument
+        return tx
+
+
+def test_nonces(monkeypatch):
+    sent = []
+    # the node only sees our transactions after a while - its pending count lags behind
+    pending = SimpleNamespace(count=5)
+    monkeypatch.setattr(submitter_module, 'w3', SimpleNamespace(eth=SimpleNamespace(
+        getTransactionCount=lambda account, block_identifier: pending.count)))
+    monkeypatch.setattr(submitter_module, 'broadcast_transaction', lambda tx: sent.append(tx) or tx)
+
+    tx_submitter = TransactionSubmitter(ACCOUNT)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: tx_submitter.submit(_Contract, None, '0x'), range(20)))
+    assert sorted(sent) == list(range(5, 25))
+
+    # a failed broadcast resyncs from the node
+    def fail(tx):
+        raise ValueError(f'nonce too low {tx}')
+    monkeypatch.setattr(submitter_module, 'broadcast_transaction', fail)
+    with raises(ValueError):
+        tx_submitter.submit(_Contract, None, '0x')
+    monkeypatch.setattr(submitter_module, 'broadcast_transaction', lambda tx: tx)
+    pending.count = 23
+    assert tx_submitter.submit(_Contract, None, '0x') == 23
+
+
+def test_shared_per_account():
+    assert submitter(ACCOUNT) is submitter(ACCOUNT.upper().replace('0X', '0x'))
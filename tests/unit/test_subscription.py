@@ -0,0 +1,93 @@
+import asyncio
+import json
+from threading import Thread, Event
+
+import websockets
+from pytest import fixture
+
+from src.util.eth.subscription import NewHeadsSubscription
+
+SUBSCRIPTION_ID = '0x9cef478923ff08bf67fde6c64013158d'
+
+
+class StandInNode(Thread):
+    """Local WebSocket node that accepts eth_subscribe and pushes the heads it is given"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.loop = asyncio.new_event_loop()
+        self.heads: asyncio.Queue = None
+        self.port = None
+        self.ready = Event()
+        self.connections = 0
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.heads = asyncio.Queue()
+        server = self.loop.run_until_complete(websockets.serve(self._handler, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def _handler(self, ws, _path=None):
+        self.connections += 1
+        request = json.loads(await ws.recv())
+        assert request['method'] == 'eth_subscribe' and request['params'] == ['newHeads']
+        await ws.send(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': SUBSCRIPTION_ID}))
+        while True:
+            number = await self.heads.get()
+            if number is None:  # drop the connection
+                await ws.close()
+                return
+            await ws.send(json.dumps({'jsonrpc': '2.0', 'method': 'eth_subscription', 'params': {
+                'subscription': SUBSCRIPTION_ID,
+                'result': {'number': hex(number), 'hash': '0x' + f'{number:064x}', 'parentHash': '0x' + '0' * 64}
+            }}))
+
+    def push(self, number):
+        self.loop.call_soon_threadsafe(self.heads.put_nowait, number)
+
+
+@fixture
+def node():
+    stand_in = StandInNode()
+    stand_in.start()
+    stand_in.ready.wait(5)
+    return stand_in
+
+
+def test_new_heads(node):
+    subscription = NewHeadsSubscription(f'ws://127.0.0.1:{node.port}', reconnect_interval=0.1)
+    subscription.start()
+    assert subscription.connected.wait(5)
+
+    node.push(100)
+    assert subscription.wait_for_head(None, 5) == 100
+    node.push(101)
+    node.push(102)
+    assert subscription.wait_for_head(100, 5) >= 101
+    assert subscription.wait_for_head(101, 5) == 102
+    assert subscription.hash_of(102) == bytes.fromhex(f'{102:064x}')
+    assert subscription.hash_of(101) is None
+
+    # reorg to a shorter chain
+    node.push(99)
+    assert subscription.wait_for_head(102, 5) == 99
+
+    subscription.stop()
+
+
+def test_reconnect_after_drop(node):
+    subscription = NewHeadsSubscription(f'ws://127.0.0.1:{node.port}', reconnect_interval=0.1)
+    subscription.start()
+    assert subscription.connected.wait(5)
+
+    node.push(None)
+    # a dropped connection wakes up waiters, so the listener can fall back to polling
+    assert subscription.wait_for_head(None, 5) is None
+    assert subscription.connected.wait(5)
+    assert node.connections == 2
+
+    node.push(7)
+    assert subscription.wait_for_head(None, 5) == 7
+    subscription.stop()
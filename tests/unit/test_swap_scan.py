@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import CalledProcessError
+from threading import Event, Thread
+from types import SimpleNamespace
+
+from src.leader.eth import leader as eth_leader
+from src.leader.eth.leader import EtherLeader
+from src.util.common import Token
+from src.util.logger import get_logger
+from src.util.secretcli import SwapNotFound
+
+TOKEN = 'secret1ljptw8mf5wk9n69j2v5vl4w2laqlrgspxykanp'
+
+
+class _Tracker:
+    def __init__(self):
+        self.nonce = -1
+        self.saved = []
+
+    def save(self):
+        self.saved.append(self.nonce)
+
+
+def _leader(monkeypatch, swaps: int, failing=()):
+    """ A leader over a contract holding swaps 0..@swaps-1, of which @failing fail to be queried """
+    leader = EtherLeader.__new__(EtherLeader)
+    leader.config = {'scrt_swap_address': 'secret1swap'}
+    leader.token_map = {TOKEN: Token('native', 'eth')}
+    leader.logger = get_logger(logger_name='test')
+    leader.max_window = 8
+    leader.windows = {}
+    leader.query_pool = ThreadPoolExecutor(max_workers=8)
+    leader.scan_pool = ThreadPoolExecutor(max_workers=2)
+    leader.stop_event = Event()
+    leader.signer = SimpleNamespace(address='0x0')
+    leader.handled = []
+
+    def query(nonce, *_):
+        if nonce in failing:
+            raise CalledProcessError(1, 'secretcli', b'', b'connection refused')
+        if nonce >= swaps:
+            raise SwapNotFound(1, 'secretcli', b'', b'Failed to get swap for token')
+        return str(nonce)
+
+    tracker = _Tracker()
+    monkeypatch.setattr(eth_leader, 'query_scrt_swap', query)
+    monkeypatch.setattr(eth_leader.SwapTrackerObject, 'get_or_create', lambda src: tracker)
+    monkeypatch.setattr(leader, '_handle_swap', lambda swap_data, *_: leader.handled.append(int(swap_data)))
+    return leader, tracker
+
+
+def test_window_grows_with_backlog(monkeypatch):
+    leader, tracker = _leader(monkeypatch, swaps=20)
+
+    ticks = 0
+    while leader._scan_token(TOKEN):  # pylint: disable=protected-access
+        ticks += 1
+    # full windows of 1, 2, 4 and 8, then 5 of the next 8 found
+    assert ticks == 4
+    assert leader.handled == list(range(20))
+    assert tracker.nonce == 19 and tracker.saved == list(range(20))
+    # caught up - shrinks back
+    assert leader.windows[TOKEN] == 4
+
+
+def test_stops_at_first_missing(monkeypatch):
+    leader, tracker = _leader(monkeypatch, swaps=20, failing={5})
+    leader.windows[TOKEN] = 8
+
+    assert not leader._scan_token(TOKEN)  # pylint: disable=protected-access
+    # swaps after the failed query are handled on a later tick, in order
+    assert leader.handled == [0, 1, 2, 3, 4]
+    assert tracker.nonce == 4
+
+
+def test_slow_token_does_not_block_others(monkeypatch):
+    leader, _ = _leader(monkeypatch, swaps=0)
+    leader.config['sleep_interval'] = 0.01
+    leader.token_map = {'slow': None, 'fast': None}
+    release = Event()
+    scans = []
+
+    def scan(token):
+        scans.append(token)
+        if token == 'slow':
+            release.wait(5)
+        return False
+
+    monkeypatch.setattr(leader, '_scan_token', scan)
+    thread = Thread(target=leader.run)
+    thread.start()
+    try:
+        release.wait(0.3)
+        # the slow token was scanned once - and never twice at the same time - while the fast one kept going
+        assert scans.count('slow') == 1
+        assert scans.count('fast') > 5
+    finally:
+        release.set()
+        leader.stop_event.set()
+        thread.join(5)
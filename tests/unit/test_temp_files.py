@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+from pytest import raises
+
+from src.util import common
+from src.util.common import temp_file, temp_files
+
+
+def _read_in_child(path: str) -> str:
+    return subprocess.run([sys.executable, '-c', f'print(open({path!r}).read(), end="")'],
+                          stdout=subprocess.PIPE, check=True).stdout.decode()
+
+
+def test_temp_file():
+    with temp_file('{"type": "cosmos-sdk/StdTx"}') as path:
+        # another process - like secretcli - can read it
+        assert _read_in_child(path) == '{"type": "cosmos-sdk/StdTx"}'
+    assert not os.path.exists(path)
+
+
+def test_temp_file_without_memfd(monkeypatch):
+    monkeypatch.setattr(common, '_memfd', lambda data: None)
+    with temp_file('data') as path:
+        assert _read_in_child(path) == 'data'
+        if os.path.isdir(common.SHM_DIR):
+            assert path.startswith(common.SHM_DIR)
+    assert not os.path.exists(path)
+
+
+def test_temp_files_removed_on_error(monkeypatch):
+    monkeypatch.setattr(common, '_memfd', lambda data: None)
+    with raises(RuntimeError):
+        with temp_files(['a', 'b', 'c']) as paths:
+            assert [_read_in_child(path) for path in paths] == ['a', 'b', 'c']
+            raise RuntimeError
+    assert not any(os.path.exists(path) for path in paths)
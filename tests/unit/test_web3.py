@@ -0,0 +1,216 @@
+import json
+from typing import Callable, List, Tuple
+
+from pytest import fixture, raises
+from web3 import Web3
+from web3.providers import BaseProvider
+
+from src.util import web3 as web3_module
+from src.util.eth.chain_cache import ChainCache
+from src.util.eth.chain_head import ChainHead
+from src.util.eth.provider_pool import ProviderPool, SessionHTTPProvider
+from src.util.web3 import LOGS_CHUNK_MAX, LOGS_LAG_RETRIES, NodeBehind, batch_request, chain_cache, get_receipts, \
+    logs_in_range
+
+ADDRESS = Web3.toChecksumAddress('0x' + '6' * 40)
+TOPIC = bytes(32)
+# as Infura words it
+TOO_MANY_RESULTS = {'code': -32005, 'message': 'query returned more than 10000 results'}
+
+
+class LogsNode(BaseProvider):
+    """Answers eth_getLogs with @logs_per_block logs per block, and refuses queries of more than @max_results logs"""
+
+    def __init__(self, logs_per_block: Callable[[int], int], max_results: int = 10000):
+        super().__init__()
+        self.logs_per_block = logs_per_block
+        self.max_results = max_results
+        self.head = 10 ** 9
+        # (from, to, succeeded) of each eth_getLogs query
+        self.queries: List[Tuple[int, int, bool]] = []
+
+    def _logs(self, from_block: int, to_block: int) -> List[dict]:
+        return [{'address': ADDRESS, 'topics': ['0x' + TOPIC.hex()], 'data': '0x', 'blockNumber': hex(block),
+                 'blockHash': '0x' + f'{block:064x}', 'logIndex': hex(index),
+                 'transactionHash': '0x' + f'{block:032x}{index:032x}', 'transactionIndex': '0x0', 'removed': False}
+                for block in range(from_block, to_block + 1) for index in range(self.logs_per_block(block))]
+
+    def make_request(self, method, params):
+        if method == 'eth_blockNumber':
+            return {'jsonrpc': '2.0', 'id': 0, 'result': hex(self.head)}
+        from_block, to_block = int(params[0]['fromBlock'], 16), min(int(params[0]['toBlock'], 16), self.head)
+        count = sum(self.logs_per_block(block) for block in range(from_block, to_block + 1))
+        self.queries.append((from_block, to_block, count <= self.max_results))
+        if count > self.max_results:
+            return {'jsonrpc': '2.0', 'id': 0, 'error': TOO_MANY_RESULTS}
+        return {'jsonrpc': '2.0', 'id': 0, 'result': self._logs(from_block, to_block)}
+
+    def isConnected(self) -> bool:
+        return True
+
+    def scanned(self) -> List[Tuple[int, int]]:
+        return [(from_block, to_block) for from_block, to_block, succeeded in self.queries
+                if succeeded and from_block <= to_block]
+
+
+@fixture
+def node(monkeypatch):
+    def serve(logs_per_block: Callable[[int], int], max_results: int = 10000) -> LogsNode:
+        logs_node = LogsNode(logs_per_block, max_results)
+        monkeypatch.setattr(web3_module, 'w3', Web3(logs_node))
+        return logs_node
+    return serve
+
+
+def _assert_contiguous(scanned: List[Tuple[int, int]], from_block: int, to_block: int):
+    """ Each block was scanned exactly once """
+    assert scanned[0][0] == from_block and scanned[-1][1] == to_block
+    for (_, end), (start, _) in zip(scanned, scanned[1:]):
+        assert start == end + 1
+
+
+def test_shrinks_on_too_many_results(node):
+    logs_node = node(lambda block: 4, max_results=1000)
+    logs = list(logs_in_range(ADDRESS, [TOPIC], 1, 1000, chunk_size=1000))
+
+    expected = [(block, index) for block in range(1, 1001) for index in range(4)]
+    assert [(log.blockNumber, log.logIndex) for log in logs] == expected
+    _assert_contiguous(logs_node.scanned(), 1, 1000)
+    # halved until 250 blocks (1000 results) fit
+    assert logs_node.queries[:3] == [(1, 1000, False), (1, 500, False), (1, 250, True)]
+
+
+def test_grows_on_sparse_ranges(node):
+    # a log every 100 blocks
+    logs_node = node(lambda block: int(block % 100 == 0))
+    logs = list(logs_in_range(ADDRESS, [TOPIC], 1, 400000, chunk_size=10))
+
+    assert [log.blockNumber for log in logs] == list(range(100, 400001, 100))
+    scanned = logs_node.scanned()
+    _assert_contiguous(scanned, 1, 400000)
+    sizes = [end - start + 1 for start, end in scanned]
+    assert sizes[:5] == [10, 20, 40, 80, 160]
+    assert max(sizes) == LOGS_CHUNK_MAX
+    assert all(succeeded for _, _, succeeded in logs_node.queries)
+
+
+def test_raises_at_chunk_size_one(node):
+    # a single block with more logs than the node returns
+    logs_node = node(lambda block: 20000 if block == 7 else 1)
+    logs = logs_in_range(ADDRESS, [TOPIC], 1, 100, chunk_size=16)
+
+    found = []
+    with raises(ValueError) as error:
+        for log in logs:
+            found.append(log.blockNumber)
+    assert error.value.args[0] == TOO_MANY_RESULTS
+
+    # the blocks before it were yielded once each, and it was tried down to a single block
+    assert found == list(range(1, 7))
+    _assert_contiguous(logs_node.scanned(), 1, 6)
+    assert logs_node.queries[-1] == (7, 7, False)
+
+
+def test_gives_up_on_node_behind(node, monkeypatch):
+    monkeypatch.setattr(web3_module, 'LOGS_LAG_INTERVAL', 0)
+    logs_node = node(lambda block: 1)
+    # the node doesn't have any of the blocks yet
+    logs_node.head = 50
+
+    with raises(NodeBehind):
+        list(logs_in_range(ADDRESS, [TOPIC], 100, 200))
+    assert len(logs_node.queries) == LOGS_LAG_RETRIES + 1
+
+
+def test_moves_to_node_not_behind(monkeypatch):
+    monkeypatch.setattr(web3_module, 'LOGS_LAG_INTERVAL', 0)
+    behind, synced = LogsNode(lambda block: 1), LogsNode(lambda block: 1)
+    behind.head = 50
+    pool = ProviderPool(['behind', 'synced'], provider_factory={'behind': behind, 'synced': synced}.get)
+    monkeypatch.setattr(web3_module, 'w3', Web3(pool))
+
+    assert [log.blockNumber for log in logs_in_range(ADDRESS, [TOPIC], 100, 200)] == list(range(100, 201))
+    assert len(behind.queries) == 1
+    _assert_contiguous(synced.scanned(), 100, 200)
+
+
+class BatchNode(SessionHTTPProvider):
+    """ Answers a batch POST with @results (by method, and the first param), in reverse order """
+
+    def __init__(self, results: dict):
+        super().__init__('http://localhost:8545')
+        self.results = results
+        self.posts = 0
+
+    def _response(self, call: dict) -> dict:
+        result = self.results[(call['method'], *call['params'][:1])]
+        if isinstance(result, dict) and 'code' in result:
+            return {'jsonrpc': '2.0', 'id': call['id'], 'error': result}
+        return {'jsonrpc': '2.0', 'id': call['id'], 'result': result}
+
+    def post(self, data: bytes) -> bytes:
+        self.posts += 1
+        return json.dumps([self._response(call) for call in reversed(json.loads(data))]).encode()
+
+
+def _receipt(tx_hash: str) -> dict:
+    return {'transactionHash': tx_hash, 'blockNumber': '0x1', 'blockHash': '0x' + '1' * 64, 'transactionIndex': '0x0',
+            'from': ADDRESS, 'to': ADDRESS, 'cumulativeGasUsed': '0x5208', 'gasUsed': '0x5208', 'contractAddress': None,
+            'logs': [], 'logsBloom': '0x' + '0' * 512, 'status': '0x1'}
+
+
+def test_batch_responses_matched_by_id():
+    node = BatchNode({('eth_blockNumber',): '0x10', ('eth_chainId',): '0x1', ('eth_gasPrice',): '0x3b9aca00'})
+
+    assert batch_request([('eth_gasPrice', []), ('eth_blockNumber', []), ('eth_chainId', [])], Web3(node)) == \
+        ['0x3b9aca00', '0x10', '0x1']
+    assert node.posts == 1
+
+
+def test_batch_with_failing_entry(monkeypatch):
+    monkeypatch.setattr(web3_module, '_chain_cache', ChainCache())
+    monkeypatch.setattr(web3_module, 'chain_head', ChainHead(lambda: 0x10, interval=0))
+    monkeypatch.setitem(web3_module.cfg, 'eth_confirmations', 2)
+    known, unknown, failing = ('0x' + f'{i:064x}' for i in range(3))
+    node = BatchNode({('eth_blockNumber',): '0x10', ('eth_getTransactionReceipt', known): _receipt(known),
+                      ('eth_getTransactionReceipt', unknown): None,
+                      ('eth_getTransactionReceipt', failing): {'code': -32000, 'message': 'header not found'}})
+
+    # receipts are matched to their txs, unknown txs have none
+    receipts = get_receipts([unknown, known], Web3(node))
+    assert receipts[0] is None and receipts[1].transactionHash.hex() == known
+
+    # an error fails the whole batch, instead of being taken for a missing receipt
+    with raises(ValueError) as error:
+        get_receipts([known, failing, unknown], Web3(node))
+    assert error.value.args[0] == {'code': -32000, 'message': 'header not found'}
+
+
+class GenesisNode(BaseProvider):
+    """ Serves the chain id and genesis block of a network """
+
+    def __init__(self, chain_id: int, genesis_hash: str):
+        super().__init__()
+        self.chain_id = chain_id
+        self.genesis_hash = genesis_hash
+
+    def make_request(self, method, params):
+        if method == 'eth_chainId':
+            return {'jsonrpc': '2.0', 'id': 0, 'result': hex(self.chain_id)}
+        return {'jsonrpc': '2.0', 'id': 0, 'result': {
+            'number': '0x0', 'hash': self.genesis_hash, 'parentHash': '0x' + '0' * 64, 'transactions': []}}
+
+    def isConnected(self) -> bool:
+        return True
+
+
+def test_chain_cache_per_chain(monkeypatch, tmp_path):
+    monkeypatch.setitem(web3_module.cfg, 'app_data', str(tmp_path))
+    paths = []
+    for chain_id, genesis_hash in ((1, '0xd4e56740f876aef8' + 'c' * 48), (4, '0x6341fd3daf94b748' + 'c' * 48)):
+        monkeypatch.setattr(web3_module, 'w3', Web3(GenesisNode(chain_id, genesis_hash)))
+        monkeypatch.setattr(web3_module, '_chain_cache', None)
+        paths.append(chain_cache().db.execute('PRAGMA database_list').fetchone()[2])
+
+    assert [path.split('/')[-1] for path in paths] == ['chain_cache-1-d4e56740f876aef8.sqlite',
+                                                       'chain_cache-4-6341fd3daf94b748.sqlite']